@@ -1 +0,0 @@
-# Utils package
@@ -1,209 +1,436 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
-from datetime import datetime
-import time
+from fastapi import APIRouter, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import json
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Literal, Optional
+import uuid
 
 from ..models.schemas import (
     OptimizeRequest,
     OptimizeResponse,
+    EvaluationStatusResponse,
+    HistoryPage,
+    HistoryDetail,
     ErrorResponse,
     HealthResponse,
+    ReadinessResponse,
+    response_exclude,
 )
-from ..services.llm_provider import get_llm_provider
-from ..services.optimizer import PromptOptimizer
-from ..utils.json_parser import approximate_length
+from ..services.lifecycle import readiness
+from ..utils.sse import SSEEncoder, dumps
+from ..utils.responses import PydanticJSONResponse, negotiate_encoding
+from ..models.results import as_dict
+from ..config import settings
+
+# The services (and the pipeline, which pulls in the providers, triage,
+# history and caches) are imported by the handlers that use them, so the
+# app answers /health before they load; start-up warm-up imports them.
+if TYPE_CHECKING:
+    from ..services.pipeline import RunControl
+    from ..services.priority import RunAdmission
 
 router = APIRouter()
 
 
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Health check endpoint"""
+    """Liveness check: the process is up and serving requests"""
     return HealthResponse(status="healthy")
 
 
+@router.get("/ready", response_model=ReadinessResponse, responses={503: {"model": ReadinessResponse}})
+async def readiness_check():
+    """Readiness check: start-up warm-up (connections, caches) has finished"""
+    status = readiness.status()
+    if not readiness.ready:
+        return PydanticJSONResponse(ReadinessResponse(**status), status_code=503)
+    return ReadinessResponse(**status)
+
+
+def history_scope(x_admin_token: Optional[str], x_api_key: Optional[str]) -> Optional[str]:
+    """
+    Tenant whose history a caller may read: every run with the admin token
+    (None), otherwise the runs made with the API key sent in X-Api-Key.
+    """
+    from ..services.pipeline import key_tenant
+    from ..services.profiling import is_admin
+
+    if is_admin(x_admin_token):
+        return None
+    if not x_api_key:
+        raise HTTPException(status_code=403, detail="History needs X-Api-Key (the runs' own API key) or the admin token")
+    return key_tenant(x_api_key)
+
+
+def epoch_seconds(value: Optional[datetime]) -> Optional[float]:
+    """Unix time of a query datetime; one without a timezone is read as UTC"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+@router.get("/history", response_model=HistoryPage, responses={403: {"model": ErrorResponse}})
+async def list_history(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    backend: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    min_score: Optional[float] = Query(None, ge=-1.0, le=1.0),
+    max_score: Optional[float] = Query(None, ge=-1.0, le=1.0),
+    x_admin_token: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None),
+):
+    """List past optimization runs of the caller's API key (all with the admin token), newest first"""
+    from ..services.history import history_store
+
+    tenant = history_scope(x_admin_token, x_api_key)
+    try:
+        items, next_cursor = await run_in_threadpool(
+            history_store.query,
+            limit=limit,
+            cursor=cursor,
+            tenant=tenant,
+            backend=backend,
+            since=epoch_seconds(since),
+            until=epoch_seconds(until),
+            min_score=min_score,
+            max_score=max_score,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return HistoryPage(items=items, next_cursor=next_cursor)
+
+
+@router.get("/history/{run_id}", response_model=HistoryDetail, responses={403: {"model": ErrorResponse}, 404: {"model": ErrorResponse}})
+async def get_history_run(
+    run_id: str,
+    x_admin_token: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None),
+):
+    """Fetch a stored run of the caller's API key (any with the admin token) with all stage outputs"""
+    from ..services.history import history_store
+
+    tenant = history_scope(x_admin_token, x_api_key)
+    run = await run_in_threadpool(history_store.get, run_id, tenant)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Unknown run id: {run_id}")
+    return HistoryDetail(**run)
+
+
+@router.get("/cache/stats")
+async def similar_cache_stats():
+    """Near-duplicate cache hit rate and lookup latency"""
+    from ..services.dedup_cache import dedup_cache
+
+    return dedup_cache.stats()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Process counters (cancelled runs, aborted LLM calls, estimated tokens saved)"""
+    from ..services.metrics import metrics
+
+    return metrics.snapshot()
+
+
+@router.get("/priority/stats")
+async def priority_stats():
+    """Runs and upstream calls in flight and queued per priority class"""
+    from ..services.priority import scheduler
+
+    return scheduler.stats()
+
+
+@router.get("/providers/stats")
+async def provider_stats():
+    """Per-key usage, latency and quarantine state of the provider pool"""
+    from ..services.provider_pool import get_provider_pool
+
+    return {"members": get_provider_pool().stats(), "spillover": settings.POOL_SPILLOVER}
+
+
+def require_admin(token: Optional[str]) -> None:
+    from ..services.profiling import is_admin
+
+    if not is_admin(token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@router.get("/admin/profiles", responses={403: {"model": ErrorResponse}})
+async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """Stored run profiles, newest first"""
+    require_admin(x_admin_token)
+    from ..services.profiling import profile_store
+
+    return {"profiles": await run_in_threadpool(profile_store.list)}
+
+
+@router.get("/admin/profiles/{run_id}", response_class=PlainTextResponse, responses={403: {"model": ErrorResponse}, 404: {"model": ErrorResponse}})
+async def get_profile(run_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Collapsed stacks of a profiled run (flamegraph.pl / speedscope input)"""
+    require_admin(x_admin_token)
+    from ..services.profiling import profile_store
+
+    profile = await run_in_threadpool(profile_store.get, run_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No profile for run id: {run_id}")
+    return PlainTextResponse(profile)
+
+
+@router.get("/evaluation/{run_id}", response_model=EvaluationStatusResponse, responses={404: {"model": ErrorResponse}})
+async def get_evaluation(run_id: str):
+    """Fetch the pairwise evaluation of a run (used with defer_evaluation)"""
+    from ..services.evaluation_store import evaluation_store
+
+    entry = evaluation_store.get(run_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired run id: {run_id}")
+    return EvaluationStatusResponse(
+        run_id=run_id,
+        status=entry["status"],
+        evaluation=as_dict(entry["evaluation"]),
+        error=entry["error"],
+    )
+
+
+async def cancel_on_disconnect(http_request: Request, control: "RunControl", interval: float = 0.25) -> None:
+    """Cancel a run as soon as its HTTP client goes away"""
+    while not control.cancelled:
+        if await http_request.is_disconnected():
+            control.cancel()
+            return
+        await asyncio.sleep(interval)
+
+
 @router.post("/optimize", response_model=OptimizeResponse, responses={400: {"model": ErrorResponse}})
-async def optimize_prompt(request: OptimizeRequest):
+async def optimize_prompt(
+    request: OptimizeRequest,
+    http_request: Request,
+    x_profile: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+):
     """
     Optimize a prompt using the full pipeline:
     1. Smart Queue analysis
     2. Proposer-Critic-Verifier (PCV)
     3. D/S cycle (Diversification/Stabilization)
-    4. Pairwise evaluation
+    4. Pairwise evaluation (optionally deferred or sampled)
+
+    The pipeline runs in a worker thread; if the client disconnects the
+    in-flight LLM call is aborted and no further stages are started.
+    X-Profile with the admin token profiles the run (see /admin/profiles).
+    `verbosity` trims the body; large bodies are gzip/brotli-compressed
+    according to Accept-Encoding.
     """
-    start_time = time.time()
-    
+    from ..services.llm_provider import CallCancelled
+    from ..services.pipeline import RunControl
+    from ..services.priority import scheduler
+    from ..services.profiling import should_profile
+
+    control = RunControl(request.max_iterations)
+    watcher = asyncio.create_task(cancel_on_disconnect(http_request, control))
+    # Queue for the run's priority slot here, not in a worker thread
+    admission = scheduler.admission(request.priority or "standard")
     try:
-        # Initialize LLM provider
-        provider = get_llm_provider(
-            backend=request.backend,
-            gemini_key=request.gemini_api_key,
-            xai_key=request.xai_api_key
-        )
-        
-        # Initialize optimizer
-        optimizer = PromptOptimizer(provider)
-        
-        # Step 1: Smart Queue
-        smart_queue_result = optimizer.smart_queue(request.prompt)
-        
-        # Check if optimization is needed
-        if not smart_queue_result.needs_optimization and not request.force_optimization:
-            # Return early if no optimization needed
-            processing_time = time.time() - start_time
-            
-            return OptimizeResponse(
-                success=True,
-                original_prompt=request.prompt,
-                final_prompt=request.prompt,
-                smart_queue=smart_queue_result,
-                pcv=None,
-                ds_iterations=[],
-                evaluation=None,
-                original_length=approximate_length(request.prompt),
-                final_length=approximate_length(request.prompt),
-                length_change_percent=0.0,
-                converged=True,
-                convergence_iteration=0,
-                processing_time_seconds=processing_time
-            )
-        
-        # Step 2: PCV (Proposer-Critic-Verifier)
-        pcv_result = optimizer.run_pcv(request.prompt)
-        
-        # Step 3: D/S Cycle
-        final_prompt, ds_iterations, converged, convergence_iteration = optimizer.run_ds_cycle(
-            initial_prompt=pcv_result.final_prompt,
-            max_iterations=request.max_iterations,
-            convergence_threshold=request.convergence_threshold
+        try:
+            await admission.acquire_async(control.cancel_event)
+        except CallCancelled:
+            return Response(status_code=499)
+        return await run_in_threadpool(
+            run_optimize, request, request.run_id or uuid.uuid4().hex, control,
+            should_profile(x_profile), negotiate_encoding(accept_encoding), admission,
         )
-        
-        # Step 4: Pairwise Evaluation
-        evaluation = optimizer.pairwise_eval(request.prompt, final_prompt)
-        
-        # Calculate metrics
-        original_length = approximate_length(request.prompt)
-        final_length = approximate_length(final_prompt)
-        length_change_percent = ((final_length - original_length) / original_length) * 100
-        
-        processing_time = time.time() - start_time
-        
-        return OptimizeResponse(
-            success=True,
-            original_prompt=request.prompt,
-            final_prompt=final_prompt,
-            smart_queue=smart_queue_result,
-            pcv=pcv_result,
-            ds_iterations=ds_iterations,
-            evaluation=evaluation,
-            original_length=original_length,
-            final_length=final_length,
-            length_change_percent=length_change_percent,
-            converged=converged,
-            convergence_iteration=convergence_iteration,
-            processing_time_seconds=processing_time
+    finally:
+        admission.release()
+        watcher.cancel()
+
+
+def run_optimize(
+    request: OptimizeRequest,
+    run_id: str,
+    control: "RunControl",
+    profile: bool = False,
+    encoding: Optional[str] = None,
+    admission: Optional["RunAdmission"] = None,
+) -> Response:
+    """Blocking body of POST /optimize (profiled including response serialization)"""
+    from ..services.pipeline import PipelineCancelled, run_to_completion
+    from ..services.profiling import profile_run
+
+    with profile_run(run_id, enabled=profile):
+        try:
+            result = run_to_completion(request, run_id, control, texts=request.verbosity == "full", admission=admission)
+        except PipelineCancelled:
+            # Client Closed Request; nobody is left to read the body
+            return Response(status_code=499)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            # The run id lets the client retry and resume from the last checkpointed stage
+            raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}", headers={"X-Run-Id": run_id})
+
+        # Validated once here; returned as a Response so FastAPI does not re-validate
+        return PydanticJSONResponse(
+            OptimizeResponse(success=True, original_prompt=request.prompt, **result),
+            exclude=response_exclude(request.verbosity),
+            encoding=encoding,
         )
-        
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
 
-@router.post("/optimize-stream")
-async def optimize_prompt_stream(request: OptimizeRequest):
+@router.post("/optimize-stream", responses={409: {"model": ErrorResponse}})
+async def optimize_prompt_stream(request: OptimizeRequest, x_profile: Optional[str] = Header(None)):
     """
     Optimize a prompt with real-time streaming updates.
     Returns Server-Sent Events (SSE) for each stage completion.
+    With defer_evaluation the evaluation event is sent after 'complete'.
+    stream_mode="delta" sends prompt texts as diffs against the previous text.
+
+    The run continues for STREAM_RESUME_GRACE seconds after the connection
+    drops and can be resumed with GET /optimize-stream/{run_id}; after that
+    the in-flight LLM call is aborted and the run stops.
     """
-    
-    async def generate_events():
-        start_time = time.time()
-        
+    from ..services.pipeline import RunControl, iterate_admitted, optimization_events
+    from ..services.priority import scheduler
+    from ..services.profiling import profile_events, should_profile
+    from ..services.run_streams import run_streams
+
+    run_id = request.run_id or uuid.uuid4().hex
+    live = run_streams.get(run_id)
+    if live is not None and not live.done:
+        raise HTTPException(status_code=409, detail=f"Run {run_id} is still in progress; resume it with GET /optimize-stream/{run_id}")
+    control = RunControl(request.max_iterations)
+    admission = scheduler.admission(request.priority or "interactive")
+    events = optimization_events(request, run_id, control, default_priority="interactive", admission=admission)
+    if should_profile(x_profile):
+        events = profile_events(run_id, events)
+    stream = run_streams.start(run_id, iterate_admitted(events, admission, control), control)
+    sse = SSEEncoder(mode=request.stream_mode, compress=request.stream_compression)
+    return StreamingResponse(
+        sse.wrap_numbered(stream.subscribe()),
+        media_type="text/event-stream",
+        headers={**sse.headers(), "X-Run-Id": run_id},
+    )
+
+
+@router.get("/optimize-stream/{run_id}", responses={404: {"model": ErrorResponse}})
+async def resume_prompt_stream(
+    run_id: str,
+    last_event_id: Optional[int] = Header(None, ge=0),
+    stream_mode: Literal["full", "delta"] = "full",
+    stream_compression: bool = False,
+):
+    """Resume a run's event stream, replaying events after Last-Event-ID"""
+    from ..services.run_streams import run_streams
+
+    stream = run_streams.get(run_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired run id: {run_id}")
+    sse = SSEEncoder(mode=stream_mode, compress=stream_compression)
+    return StreamingResponse(
+        sse.wrap_numbered(stream.subscribe(last_event_id or 0)),
+        media_type="text/event-stream",
+        headers={**sse.headers(), "X-Run-Id": run_id},
+    )
+
+
+@router.websocket("/ws")
+async def optimization_socket(websocket: WebSocket):
+    """
+    Multiplexed optimization session over one WebSocket.
+
+    Client messages:
+      {"type": "start", "request": {...OptimizeRequest...}, "ref": "<client tag>"}
+      {"type": "cancel", "run_id": "..."}
+      {"type": "update", "run_id": "...", "max_iterations": 1..6}
+
+    Server messages:
+      {"type": "started", "run_id": "...", "ref": "..."}
+      {"type": "event", "run_id": "...", "event": {...same as /optimize-stream...}}
+      {"type": "finished", "run_id": "..."}
+      {"type": "error", "message": "...", "run_id"?: "...", "ref"?: "..."}
+    """
+    from ..services.pipeline import RunControl, iterate_admitted, optimization_events
+    from ..services.priority import scheduler
+    from ..services.profiling import profile_events, should_profile
+
+    await websocket.accept()
+    runs: dict[str, tuple[asyncio.Task, RunControl]] = {}
+    send_lock = asyncio.Lock()
+
+    async def send(message: dict) -> None:
+        async with send_lock:
+            await websocket.send_text(dumps(message))
+
+    async def drive(run_id: str, request: OptimizeRequest, control: RunControl) -> None:
+        admission = scheduler.admission(request.priority or "interactive")
+        events = optimization_events(request, run_id, control, default_priority="interactive", admission=admission)
+        if should_profile(websocket.headers.get("x-profile")):
+            events = profile_events(run_id, events)
         try:
-            # Initialize LLM provider
-            yield f"data: {json.dumps({'stage': 'init', 'message': 'Initializing LLM provider...'})}\n\n"
-            
-            provider = get_llm_provider(
-                backend=request.backend,
-                gemini_key=request.gemini_api_key,
-                xai_key=request.xai_api_key
-            )
-            optimizer = PromptOptimizer(provider)
-            
-            # Stage 1: Smart Queue
-            yield f"data: {json.dumps({'stage': 'smart_queue', 'status': 'running', 'message': 'Analyzing prompt quality...'})}\n\n"
-            smart_queue_result = optimizer.smart_queue(request.prompt)
-            yield f"data: {json.dumps({'stage': 'smart_queue', 'status': 'complete', 'data': smart_queue_result.dict()})}\n\n"
-            
-            # Check if optimization needed
-            if not smart_queue_result.needs_optimization and not request.force_optimization:
-                yield f"data: {json.dumps({'stage': 'complete', 'message': 'No optimization needed', 'final_prompt': request.prompt})}\n\n"
-                return
-            
-            # Stage 2: PCV - Proposer
-            yield f"data: {json.dumps({'stage': 'pcv_proposer', 'status': 'running', 'message': 'Proposer rewriting prompt...'})}\n\n"
-            proposed = optimizer.proposer_step(request.prompt)
-            yield f"data: {json.dumps({'stage': 'pcv_proposer', 'status': 'complete', 'data': {'proposed_prompt': proposed}})}\n\n"
-            
-            # Stage 3: PCV - Critic
-            yield f"data: {json.dumps({'stage': 'pcv_critic', 'status': 'running', 'message': 'Critic analyzing proposal...'})}\n\n"
-            critique = optimizer.critic_step(proposed)
-            yield f"data: {json.dumps({'stage': 'pcv_critic', 'status': 'complete', 'data': {'critique': critique}})}\n\n"
-            
-            # Stage 4: PCV - Verifier
-            yield f"data: {json.dumps({'stage': 'pcv_verifier', 'status': 'running', 'message': 'Verifier creating final version...'})}\n\n"
-            pcv_final = optimizer.verifier_step(request.prompt, proposed, critique)
-            yield f"data: {json.dumps({'stage': 'pcv_verifier', 'status': 'complete', 'data': {'final_prompt': pcv_final}})}\n\n"
-            
-            # Stage 5: D/S Cycle
-            current = pcv_final
-            prev_len = approximate_length(current)
-            converged = False
-            convergence_iteration = None
-            ds_iterations = []
-            
-            for i in range(1, request.max_iterations + 1):
-                # D-Block
-                yield f"data: {json.dumps({'stage': f'ds_iteration_{i}_d', 'status': 'running', 'message': f'D/S Iteration {i}: Diversification...'})}\n\n"
-                d_out = optimizer.d_block(current)
-                yield f"data: {json.dumps({'stage': f'ds_iteration_{i}_d', 'status': 'complete', 'data': {'output': d_out}})}\n\n"
-                
-                # S-Block
-                yield f"data: {json.dumps({'stage': f'ds_iteration_{i}_s', 'status': 'running', 'message': f'D/S Iteration {i}: Stabilization...'})}\n\n"
-                s_out = optimizer.s_block(d_out)
-                
-                current = s_out
-                cur_len = approximate_length(current)
-                change_rate = abs(cur_len - prev_len) / max(prev_len, 1)
-                
-                yield f"data: {json.dumps({'stage': f'ds_iteration_{i}_s', 'status': 'complete', 'data': {'output': s_out, 'length': cur_len, 'change_rate': change_rate, 'iteration': i}})}\n\n"
-                
-                prev_len = cur_len
-                
-                if change_rate < request.convergence_threshold:
-                    converged = True
-                    convergence_iteration = i
-                    yield f"data: {json.dumps({'stage': 'ds_converged', 'message': f'Converged at iteration {i}'})}\n\n"
-                    break
-            
-            final_prompt = current
-            
-            # Stage 6: Evaluation
-            yield f"data: {json.dumps({'stage': 'evaluation', 'status': 'running', 'message': 'Comparing original vs optimized...'})}\n\n"
-            evaluation = optimizer.pairwise_eval(request.prompt, final_prompt)
-            yield f"data: {json.dumps({'stage': 'evaluation', 'status': 'complete', 'data': evaluation.dict()})}\n\n"
-            
-            # Final summary
-            processing_time = time.time() - start_time
-            original_length = approximate_length(request.prompt)
-            final_length = approximate_length(final_prompt)
-            length_change_percent = ((final_length - original_length) / original_length) * 100
-            
-            yield f"data: {json.dumps({'stage': 'complete', 'data': {'final_prompt': final_prompt, 'original_length': original_length, 'final_length': final_length, 'length_change_percent': length_change_percent, 'converged': converged, 'convergence_iteration': convergence_iteration, 'processing_time_seconds': processing_time}})}\n\n"
-            
-        except Exception as e:
-            yield f"data: {json.dumps({'stage': 'error', 'error': str(e)})}\n\n"
-    
-    return StreamingResponse(generate_events(), media_type="text/event-stream")
+            async for event in iterate_admitted(events, admission, control):
+                await send({"type": "event", "run_id": run_id, "event": event})
+            await send({"type": "finished", "run_id": run_id})
+        except (WebSocketDisconnect, RuntimeError):
+            control.cancel()
+        finally:
+            runs.pop(run_id, None)
+
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                kind = message.get("type")
+            except (json.JSONDecodeError, AttributeError):
+                await send({"type": "error", "message": "Messages must be JSON objects"})
+                continue
+            run_id = message.get("run_id")
+
+            if kind == "start":
+                ref = message.get("ref")
+                if len(runs) >= settings.WS_MAX_RUNS:
+                    await send({"type": "error", "ref": ref, "message": f"At most {settings.WS_MAX_RUNS} concurrent runs per connection"})
+                    continue
+                try:
+                    request = OptimizeRequest(**message.get("request", {}))
+                except ValidationError as e:
+                    await send({"type": "error", "ref": ref, "message": str(e)})
+                    continue
+                except TypeError:
+                    await send({"type": "error", "ref": ref, "message": "request must be an object"})
+                    continue
+                run_id = request.run_id or uuid.uuid4().hex
+                if run_id in runs:
+                    await send({"type": "error", "ref": ref, "message": f"Run {run_id} is already in progress"})
+                    continue
+                control = RunControl(request.max_iterations)
+                await send({"type": "started", "run_id": run_id, "ref": ref})
+                runs[run_id] = (asyncio.create_task(drive(run_id, request, control)), control)
+
+            elif kind in ("cancel", "update"):
+                if run_id not in runs:
+                    await send({"type": "error", "run_id": run_id, "message": f"Unknown or finished run: {run_id}"})
+                    continue
+                control = runs[run_id][1]
+                if kind == "cancel":
+                    control.cancel()
+                else:
+                    max_iterations = message.get("max_iterations")
+                    if not isinstance(max_iterations, int) or not 1 <= max_iterations <= 6:
+                        await send({"type": "error", "run_id": run_id, "message": "max_iterations must be an integer in 1..6"})
+                        continue
+                    control.max_iterations = max_iterations
+
+            else:
+                await send({"type": "error", "message": f"Unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task, control in list(runs.values()):
+            control.cancel()
+            task.cancel()
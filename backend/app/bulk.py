@@ -0,0 +1,301 @@
+"""
+Offline bulk optimizer.
+
+Streams prompts from a JSONL or CSV file through the optimization pipeline
+without the HTTP server, `--concurrency` runs at a time, and appends one
+JSON line per finished item to the output file as soon as it completes
+(so lines are in completion order; each carries its input "index").
+
+Progress is kept in a manifest next to the output (<output>.manifest.json):
+a watermark below which every item is done plus the done items above it.
+Items are admitted at most a fixed window past the watermark, so the
+manifest, like everything else held in memory, stays bounded regardless of
+the input size. Rerunning the same command resumes: finished items are
+skipped, and an item that was interrupted mid-run resumes from its last
+checkpointed stage (its run id is derived from the output path).
+
+Usage (from backend/):
+    python -m app.bulk prompts.jsonl results.jsonl [--concurrency 8] [--backend gemini]
+    python -m app.bulk prompts.csv results.jsonl --prompt-field text --id-field id
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional
+
+from .models.schemas import OptimizeRequest
+from .services.checkpoints import checkpoint_store
+from .services.pipeline import PipelineCancelled, RunControl, run_to_completion
+from .utils.sse import dumps
+
+
+def read_items(
+    path: Path, prompt_field: str, id_field: Optional[str]
+) -> Iterator[tuple[int, Optional[str], str, Optional[str]]]:
+    """
+    (index, id, prompt, error) of every input record, read lazily (.csv or
+    JSONL). A JSONL line that is not a JSON object yields its error instead
+    of a prompt, so it becomes a failed item rather than stopping the job.
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        is_csv = path.suffix.lower() == ".csv"
+        records = csv.DictReader(f) if is_csv else (line for line in f if line.strip())
+        for index, record in enumerate(records):
+            if not is_csv:
+                try:
+                    record = json.loads(record)
+                except ValueError as e:
+                    yield index, None, "", f"Invalid JSON line: {e}"
+                    continue
+                if not isinstance(record, dict):
+                    yield index, None, "", f"Input line is a JSON {type(record).__name__}, not an object"
+                    continue
+            item_id = record.get(id_field) if id_field else None
+            yield index, None if item_id is None else str(item_id), record.get(prompt_field) or "", None
+
+
+def count_items(path: Path) -> int:
+    """Number of input records, counted in one streaming pass"""
+    if path.suffix.lower() == ".csv":
+        with open(path, encoding="utf-8", newline="") as f:
+            return sum(1 for _ in csv.DictReader(f))
+    with open(path, encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def drop_partial_line(path: Path, chunk_size: int = 65536) -> None:
+    """Truncate a trailing line cut off by an interrupted write, so appends start on a fresh line"""
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        f.seek(end - 1)
+        if f.read(1) == b"\n":
+            return
+        pos = end
+        while pos > 0:
+            start = max(0, pos - chunk_size)
+            f.seek(start)
+            newline = f.read(pos - start).rfind(b"\n")
+            if newline >= 0:
+                f.truncate(start + newline + 1)
+                return
+            pos = start
+        f.truncate(0)
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}h{rest // 60:02d}m" if hours else f"{rest // 60}m{rest % 60:02d}s"
+
+
+class Manifest:
+    """
+    Progress of a bulk job: every index below `watermark` is done, plus the
+    indexes in `done`. Saved atomically, at most every `save_every` seconds.
+    """
+
+    def __init__(self, path: Path, input_path: Path, save_every: float = 1.0):
+        self.path = path
+        self.input = str(input_path.resolve())
+        self.save_every = save_every
+        self.watermark = 0
+        self.done: set[int] = set()
+        self.ok = 0
+        self.failed = 0
+        self._saved_at = 0.0
+
+    def load(self, output: Path) -> None:
+        """Resume from a saved manifest, plus items written to the output after it was saved"""
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data["input"] != self.input:
+                raise SystemExit(f"{self.path} belongs to input {data['input']}; use another output file")
+            self.watermark = data["watermark"]
+            self.done = set(data["done"])
+            self.ok, self.failed = data["ok"], data["failed"]
+        if output.exists():
+            # The line cut off by the interruption is redone; appending onto it would lose the next record
+            drop_partial_line(output)
+            with open(output, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        continue
+                    if not self.is_done(item["index"]):
+                        self.mark(item["index"], "error" not in item)
+
+    def is_done(self, index: int) -> bool:
+        return index < self.watermark or index in self.done
+
+    def mark(self, index: int, ok: bool) -> None:
+        self.done.add(index)
+        if ok:
+            self.ok += 1
+        else:
+            self.failed += 1
+        while self.watermark in self.done:
+            self.done.remove(self.watermark)
+            self.watermark += 1
+
+    def save(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._saved_at < self.save_every:
+            return
+        self._saved_at = now
+        data = {"input": self.input, "watermark": self.watermark, "done": sorted(self.done), "ok": self.ok, "failed": self.failed}
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+def optimize_item(request: OptimizeRequest, run_id: str, control: RunControl) -> dict:
+    """Blocking: run one prompt through the pipeline and build its output line"""
+    try:
+        result = run_to_completion(request, run_id, control, default_priority="bulk", texts=False)
+    except PipelineCancelled:
+        raise
+    except Exception as e:
+        return {"run_id": run_id, "error": str(e)}
+    # Written to the output from here on; its checkpoints are no longer needed
+    checkpoint_store.clear(run_id)
+    return {
+        "run_id": run_id,
+        "final_prompt": result["final_prompt"],
+        "converged": result["converged"],
+        "evaluation": result["evaluation"],
+        "evaluation_status": result["evaluation_status"],
+        "processing_time_seconds": round(result["processing_time_seconds"], 3),
+    }
+
+
+async def run(args: argparse.Namespace) -> Manifest:
+    input_path, output_path = Path(args.input), Path(args.output)
+    manifest = Manifest(output_path.with_name(output_path.name + ".manifest.json"), input_path)
+    manifest.load(output_path)
+    total = count_items(input_path)
+    window = max(args.window, 2 * args.concurrency)
+    job = hashlib.sha1(str(output_path.resolve()).encode("utf-8")).hexdigest()[:12]
+    params = {
+        "backend": args.backend,
+        "max_iterations": args.max_iterations,
+        "evaluation_sample_rate": args.evaluation_sample_rate,
+        "priority": "bulk",
+    }
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="bulk")
+    slots = asyncio.Semaphore(args.concurrency)
+    progress = asyncio.Condition()
+    tasks: set[asyncio.Task] = set()
+    started = time.monotonic()
+    done_at_start = manifest.ok + manifest.failed
+    last_report = 0.0
+    out = open(output_path, "a", encoding="utf-8")
+
+    def report(final: bool = False) -> None:
+        nonlocal last_report
+        now = time.monotonic()
+        if not final and now - last_report < args.report_every:
+            return
+        last_report = now
+        done = manifest.ok + manifest.failed
+        rate = (done - done_at_start) / max(now - started, 1e-9)
+        eta = format_duration((total - done) / rate) if rate > 0 else "?"
+        print(
+            f"[bulk] {done}/{total} ({done / max(total, 1):.1%}) {rate:.2f} items/s, ETA {eta}, "
+            f"failed {manifest.failed}, in flight {len(tasks)}",
+            file=sys.stderr, flush=True,
+        )
+
+    async def process(index: int, item_id: Optional[str], prompt: str, error: Optional[str]) -> None:
+        try:
+            try:
+                if error is not None:
+                    raise ValueError(error)
+                request = OptimizeRequest(prompt=prompt, run_id=f"bulk-{job}-{index}", **params)
+            except ValueError as e:
+                line = {"error": str(e)}
+            else:
+                control = RunControl(request.max_iterations)
+                try:
+                    line = await loop.run_in_executor(executor, optimize_item, request, request.run_id, control)
+                except asyncio.CancelledError:
+                    # Interrupted: stop the run; it resumes from its checkpoints next time
+                    control.cancel()
+                    raise
+            out.write(dumps({"index": index, "id": item_id, **line}) + "\n")
+            out.flush()
+            async with progress:
+                manifest.mark(index, "error" not in line)
+                progress.notify_all()
+            manifest.save()
+            report()
+        finally:
+            slots.release()
+
+    try:
+        for index, item_id, prompt, error in read_items(input_path, args.prompt_field, args.id_field):
+            if manifest.is_done(index):
+                continue
+            await slots.acquire()
+            # Admit items only within the window, so the set of done items above the watermark stays bounded
+            async with progress:
+                await progress.wait_for(lambda: index < manifest.watermark + window)
+            task = asyncio.create_task(process(index, item_id, prompt, error))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        executor.shutdown(wait=True, cancel_futures=True)
+        out.close()
+        manifest.save(force=True)
+        report(final=True)
+    return manifest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("input", help="Prompts as JSONL (one object per line) or .csv")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument("--prompt-field", default="prompt")
+    parser.add_argument("--id-field", default="id", help="Input field copied to the output as \"id\"")
+    parser.add_argument("--concurrency", type=int, default=8, help="Runs in flight")
+    parser.add_argument("--window", type=int, default=256, help="Max items admitted past the oldest unfinished one")
+    parser.add_argument("--backend", default="gemini", choices=["gemini", "grok", "openai_compat"])
+    parser.add_argument("--max-iterations", type=int, default=3)
+    parser.add_argument("--evaluation-sample-rate", type=float, default=None)
+    parser.add_argument("--report-every", type=float, default=5.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+
+    from .services.history import history_store
+    from .services.dedup_cache import dedup_cache
+    from .services import tracing
+    try:
+        manifest = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("[bulk] interrupted; rerun the same command to resume", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        history_store.close()
+        dedup_cache.save()
+        tracing.shutdown()
+    if manifest.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
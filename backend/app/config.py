@@ -18,13 +18,141 @@ class Settings(BaseSettings):
     GEMINI_MODEL: str = "gemini-2.5-flash"
     GROK_MODEL: str = "grok-4"
     
+    # Self-hosted OpenAI-compatible servers (vLLM, llama.cpp, Ollama), comma-separated base URLs
+    OPENAI_COMPAT_BASE_URLS: str = ""
+    OPENAI_COMPAT_MODEL: str = "default"
+    OPENAI_COMPAT_API_KEY: Optional[str] = None
+    OPENAI_COMPAT_MAX_CONCURRENCY: int = 4
+    
+    # Per-stage model tiers: "stage=[backend:]model,...", e.g.
+    # "smart_queue=gemini-2.5-flash-lite,critic=gemini-2.5-flash-lite,verifier=gemini-2.5-pro"
+    STAGE_MODELS: str = ""
+    
+    # Per-stage generation parameters: "stage=value,..." ("*" for every stage),
+    # stop sequences as "stage=SEQ|SEQ". Defaults favour latency: short caps on
+    # the JSON stages and the critique, thinking off except for rewriting stages
+    # (Gemini 2.5+, grok-3-mini effort, Qwen3-style templates on openai_compat)
+    STAGE_MAX_OUTPUT_TOKENS: str = "smart_queue=256,pairwise_eval=768,critic=1024"
+    STAGE_TEMPERATURE: str = "smart_queue=0,pairwise_eval=0"
+    STAGE_STOP_SEQUENCES: str = ""
+    STAGE_THINKING_BUDGET: str = "*=0,proposer=1024,verifier=1024,s_block=1024"
+    # Send chat_template_kwargs.enable_thinking=false to openai_compat servers for thinking budget 0
+    OPENAI_COMPAT_THINKING_SWITCH: bool = True
+    
+    # Provider pool: extra comma-separated keys/models per backend (key x model members)
+    GEMINI_API_KEYS: str = ""
+    XAI_API_KEYS: str = ""
+    GEMINI_MODELS: str = ""
+    GROK_MODELS: str = ""
+    POOL_MAX_OUTSTANDING: int = 8
+    POOL_QUARANTINE_SECONDS: float = 30.0
+    POOL_EWMA_ALPHA: float = 0.3
+    POOL_SPILLOVER: bool = False
+    # Longest a call without its own deadline waits for a free pool member
+    POOL_ACQUIRE_TIMEOUT: float = 120.0
+    
     # Timeouts
     CONNECT_TIMEOUT: int = 10
     READ_TIMEOUT: int = 120
     
-    # D/S Cycle
+    # HTTP connection pool and startup warm-up
+    HTTP_POOL_SIZE: int = 32
+    WARMUP_TIMEOUT: float = 10.0
+    
+    # WebSocket sessions
+    WS_MAX_RUNS: int = 8
+    
+    # Priority classes (interactive, standard, bulk): concurrent runs per class,
+    # shares of UPSTREAM_CALL_SLOTS in-flight provider calls (0 = unlimited), and
+    # bulk throttling while interactive queue waits exceed the target
+    PRIORITY_RUN_LIMITS: str = "interactive=16,standard=12,bulk=4"
+    UPSTREAM_CALL_SLOTS: int = 0
+    PRIORITY_CALL_SHARES: str = "interactive=0.6,standard=0.3,bulk=0.1"
+    PRIORITY_INTERACTIVE_TARGET_MS: float = 500.0
+    PRIORITY_BULK_THROTTLED_CALLS: int = 1
+    # Worker threads running pipeline stages; raised if needed to fit the sum of
+    # PRIORITY_RUN_LIMITS plus THREADPOOL_HEADROOM threads for other endpoints
+    THREADPOOL_SIZE: int = 40
+    THREADPOOL_HEADROOM: int = 8
+    
+    # /optimize response compression (brotli needs the optional brotli package)
+    RESPONSE_COMPRESS_MIN_BYTES: int = 1024
+    RESPONSE_GZIP_LEVEL: int = 6
+    RESPONSE_BROTLI_QUALITY: int = 4
+    
+    # Resumable SSE: ring buffer per run, grace period after disconnect, replay retention
+    STREAM_BUFFER_SIZE: int = 256
+    STREAM_RESUME_GRACE: float = 30.0
+    STREAM_RETENTION: float = 300.0
+    STREAM_SPILL_DIR: Optional[str] = None
+    
+    # Micro-batching of concurrent JSON-output stage calls (smart_queue, pairwise_eval)
+    MICRO_BATCH_ENABLED: bool = False
+    MICRO_BATCH_STAGES: str = "smart_queue,pairwise_eval"
+    MICRO_BATCH_WINDOW_MS: int = 20
+    MICRO_BATCH_MAX_ITEMS: int = 8
+    
+    # OpenTelemetry tracing (needs opentelemetry-sdk); TRACING_EXPORTER: "file" or "otlp"
+    TRACING_ENABLED: bool = False
+    TRACING_EXPORTER: str = "file"
+    TRACING_FILE: str = "data/traces.jsonl"
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACING_SAMPLE_RATE: float = 0.1
+    TRACING_SERVICE_NAME: str = "promptoptimizer"
+    
+    # Admin endpoints and on-demand profiling (X-Profile: <ADMIN_TOKEN>, or sampled)
+    ADMIN_TOKEN: Optional[str] = None
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_INTERVAL_MS: int = 10
+    PROFILE_DIR: str = "data/profiles"
+    PROFILE_MAX_STORED: int = 200
+    
+    # Stage checkpoints (resume a retried run_id) and in-place retries of transient provider errors
+    CHECKPOINT_ENABLED: bool = True
+    CHECKPOINT_DB_PATH: str = "data/checkpoints.db"
+    CHECKPOINT_TTL: int = 86400
+    STAGE_RETRIES: int = 2
+    STAGE_RETRY_BACKOFF: float = 1.0
+    
+    # Incremental re-optimization (base_run_id): concurrent section calls per run
+    INCREMENTAL_SECTION_WORKERS: int = 4
+    
+    # D/S Cycle; DS_STRATEGY: "sequential" (D -> S per iteration) or "fanout"
+    # (concurrent D per focus merged by one S, at most DS_FANOUT_ROUNDS rounds)
     MAX_DS_ITERATIONS: int = 3
     CONVERGENCE_THRESHOLD: float = 0.05
+    DS_STRATEGY: str = "sequential"
+    DS_FANOUT_FOCUSES: str = "edge_cases,constraints,examples,output_format"
+    DS_FANOUT_ROUNDS: int = 2
+    
+    # Smart Queue: "llm", "local" or "hybrid" (local triage, LLM only when unsure)
+    SMART_QUEUE_MODE: str = "hybrid"
+    TRIAGE_CONFIDENCE_THRESHOLD: float = 0.6
+    # Weights fitted with `python -m app.services.triage logs.jsonl --fit`; built-in defaults if missing
+    TRIAGE_WEIGHTS_PATH: str = "data/triage_weights.json"
+    
+    # Pairwise evaluation
+    EVALUATION_SAMPLE_RATE: float = 1.0
+    EVALUATION_WORKERS: int = 4
+    EVALUATION_RESULT_TTL: int = 3600
+    
+    # Optimization history (SQLite)
+    HISTORY_ENABLED: bool = True
+    HISTORY_DB_PATH: str = "data/history.db"
+    HISTORY_COMPRESS_MIN_BYTES: int = 512
+    HISTORY_QUEUE_SIZE: int = 10000
+    
+    # Near-duplicate cache (MinHash LSH); DEDUP_MODE: "off", "reuse" or "warm_start".
+    # Partitioned by the request's own API key; runs on server-side keys share
+    # one partition only with DEDUP_SHARE_SERVER_KEY_RUNS (single-tenant deployments)
+    DEDUP_ENABLED: bool = False
+    DEDUP_MODE: str = "warm_start"
+    DEDUP_SHARE_SERVER_KEY_RUNS: bool = False
+    DEDUP_THRESHOLD: float = 0.8
+    DEDUP_NUM_PERM: int = 64
+    DEDUP_MAX_ENTRIES: int = 1_000_000
+    DEDUP_SNAPSHOT_PATH: str = "data/dedup_index.json"
+    DEDUP_SNAPSHOT_EVERY: int = 500
     
     class Config:
         env_file = ".env"
@@ -1,11 +1,40 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
+import asyncio
 import os
 from pathlib import Path
 from .api.routes import router
 from .config import settings
+from .services.lifecycle import warm_up
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start warm-up in the background so /api/health answers immediately;
+    /api/ready reports when providers and caches are warm.
+    """
+    from anyio import to_thread
+    from .services.priority import threadpool_size
+    # Every admitted run must be able to get a worker thread
+    to_thread.current_default_thread_limiter().total_tokens = threadpool_size()
+    warmup_task = asyncio.create_task(warm_up(settings.WARMUP_TIMEOUT))
+    yield
+    warmup_task.cancel()
+    
+    # Stop live runs, apply queued history writes, snapshot caches and flush traces before the process exits
+    from .services.history import history_store
+    from .services.dedup_cache import dedup_cache
+    from .services.run_streams import run_streams
+    from .services import tracing
+    run_streams.shutdown()
+    history_store.close()
+    dedup_cache.save()
+    tracing.shutdown()
+
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -14,6 +43,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # CORS middleware
@@ -23,6 +53,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Run-Id"],
 )
 
 # Include API routes
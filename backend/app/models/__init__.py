@@ -5,8 +5,13 @@ from .schemas import (
     PCVResult,
     DSIteration,
     PairwiseEvaluation,
+    EvaluationStatusResponse,
+    HistoryItem,
+    HistoryPage,
+    HistoryDetail,
     ErrorResponse,
     HealthResponse,
+    ReadinessResponse,
 )
 
 __all__ = [
@@ -16,6 +21,11 @@ __all__ = [
     "PCVResult",
     "DSIteration",
     "PairwiseEvaluation",
+    "EvaluationStatusResponse",
+    "HistoryItem",
+    "HistoryPage",
+    "HistoryDetail",
     "ErrorResponse",
     "HealthResponse",
+    "ReadinessResponse",
 ]
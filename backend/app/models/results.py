@@ -0,0 +1,87 @@
+"""
+Internal pipeline results.
+
+Plain slotted dataclasses without validation; they are validated once,
+when the API response model is built.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(slots=True)
+class SmartQueueData:
+    """Smart Queue analysis result"""
+    clarity: float
+    structure: float
+    constraints: float
+    needs_optimization: bool
+    comment: str
+    source: str = "llm"
+
+    def dict(self) -> dict:
+        return {
+            "clarity": self.clarity,
+            "structure": self.structure,
+            "constraints": self.constraints,
+            "needs_optimization": self.needs_optimization,
+            "comment": self.comment,
+            "source": self.source,
+        }
+
+
+@dataclass(slots=True)
+class PCVData:
+    """Proposer-Critic-Verifier result"""
+    proposed_prompt: str
+    critique: str
+    final_prompt: str
+
+    def dict(self) -> dict:
+        return {
+            "proposed_prompt": self.proposed_prompt,
+            "critique": self.critique,
+            "final_prompt": self.final_prompt,
+        }
+
+
+@dataclass(slots=True)
+class DSIterationData:
+    """Single D/S iteration result"""
+    iteration: int
+    d_block_output: str
+    s_block_output: str
+    length: int
+    change_rate: float
+
+    def dict(self) -> dict:
+        return {
+            "iteration": self.iteration,
+            "d_block_output": self.d_block_output,
+            "s_block_output": self.s_block_output,
+            "length": self.length,
+            "change_rate": self.change_rate,
+        }
+
+
+@dataclass(slots=True)
+class EvaluationData:
+    """Pairwise comparison result"""
+    clarity: float
+    structure: float
+    constraints: float
+    usefulness: float
+    comment: str
+
+    def dict(self) -> dict:
+        return {
+            "clarity": self.clarity,
+            "structure": self.structure,
+            "constraints": self.constraints,
+            "usefulness": self.usefulness,
+            "comment": self.comment,
+        }
+
+
+def as_dict(result) -> Optional[dict]:
+    """dict() of an optional result"""
+    return result.dict() if result is not None else None
@@ -3,15 +3,36 @@ from typing import Optional, Literal
 from datetime import datetime
 
 
+class GenerationConfig(BaseModel):
+    """Generation parameters of a pipeline stage; unset fields keep the server setting"""
+    max_output_tokens: Optional[int] = Field(None, ge=1, le=65536, description="Cap on answer tokens")
+    temperature: Optional[float] = Field(None, ge=0.0, le=2.0, description="Sampling temperature")
+    stop: Optional[list[str]] = Field(None, max_length=4, description="Stop sequences")
+    thinking_budget: Optional[int] = Field(None, ge=-1, le=32768, description="Thinking tokens: 0 = off, -1 = model decides")
+
+
 class OptimizeRequest(BaseModel):
     """Request model for prompt optimization"""
     prompt: str = Field(..., min_length=1, description="Prompt to optimize")
-    backend: Literal["gemini", "grok"] = Field(default="gemini", description="LLM backend to use")
+    backend: Literal["gemini", "grok", "openai_compat"] = Field(default="gemini", description="LLM backend to use (openai_compat: self-hosted server from OPENAI_COMPAT_BASE_URLS)")
     gemini_api_key: Optional[str] = Field(None, description="Gemini API key (if not set in env)")
     xai_api_key: Optional[str] = Field(None, description="xAI API key (if not set in env)")
     max_iterations: int = Field(default=3, ge=1, le=6, description="Max D/S iterations")
     convergence_threshold: float = Field(default=0.05, ge=0.01, le=0.20, description="Convergence threshold")
+    ds_strategy: Optional[Literal["sequential", "fanout"]] = Field(None, description="D/S cycle: sequential D -> S iterations, or concurrent focused D steps merged by one S per round (defaults to server setting)")
     force_optimization: bool = Field(default=True, description="Force optimization even if Smart Queue says no")
+    defer_evaluation: bool = Field(default=False, description="Return the optimized prompt before pairwise evaluation finishes")
+    evaluation_sample_rate: Optional[float] = Field(None, ge=0.0, le=1.0, description="Fraction of runs to evaluate (defaults to server setting)")
+    similarity_reuse: Optional[Literal["off", "warm_start"]] = Field(None, description="Use of a near-duplicate earlier run; can only restrict the server's DEDUP_MODE")
+    stream_mode: Literal["full", "delta"] = Field(default="full", description="SSE payloads: full texts or diffs against the previous text")
+    stream_compression: bool = Field(default=False, description="gzip-encode the SSE stream")
+    stage_models: Optional[dict[str, str]] = Field(None, description="Per-stage model tier, e.g. {\"critic\": \"gemini:gemini-2.5-flash-lite\"}; overrides STAGE_MODELS")
+    generation: Optional[dict[str, GenerationConfig]] = Field(None, description="Per-stage generation parameters keyed by stage or \"*\", e.g. {\"critic\": {\"max_output_tokens\": 512}}; override the STAGE_* settings")
+    deadline_ms: Optional[int] = Field(None, ge=100, le=3_600_000, description="Hard time budget for the whole run; stages that do not fit are cut short")
+    priority: Optional[Literal["interactive", "standard", "bulk"]] = Field(None, description="Scheduling class (defaults: interactive for streams and WebSocket, standard for /optimize)")
+    run_id: Optional[str] = Field(None, pattern=r"^[A-Za-z0-9_-]{1,64}$", description="Client-chosen run id; retrying with the same id resumes from the last checkpointed stage")
+    base_run_id: Optional[str] = Field(None, pattern=r"^[A-Za-z0-9_-]{1,64}$", description="Incremental mode: earlier run this prompt is an edit of; only changed sections are optimized again")
+    verbosity: Literal["final", "summary", "full"] = Field(default="full", description="/optimize response fields: final prompt only, without intermediate texts (summary), or everything")
 
 
 class SmartQueueResult(BaseModel):
@@ -21,6 +42,7 @@ class SmartQueueResult(BaseModel):
     constraints: float = Field(..., ge=0.0, le=1.0)
     needs_optimization: bool
     comment: str
+    source: Literal["llm", "local"] = Field(default="llm", description="Whether the LLM or local triage produced the scores")
 
 
 class PCVResult(BaseModel):
@@ -48,17 +70,29 @@ class PairwiseEvaluation(BaseModel):
     comment: str
 
 
+class IncrementalResult(BaseModel):
+    """Section reuse of an incremental run"""
+    base_run_id: str
+    mode: Literal["sections", "whole_prompt"] = Field("sections", description="sections: changed sections re-optimized; whole_prompt: the base run had no section map, so its final prompt was adapted to the edit in one call")
+    sections: int
+    reused: int = Field(..., description="Sections unchanged since the base run, not optimized again")
+    adapted: int = Field(..., description="Edited sections adapted from their previous optimized version")
+    optimized: int = Field(..., description="New sections optimized from scratch")
+
+
 class OptimizeResponse(BaseModel):
     """Response model for prompt optimization"""
     success: bool
+    run_id: str
     original_prompt: str
     final_prompt: str
     
-    # Pipeline results
-    smart_queue: SmartQueueResult
-    pcv: PCVResult
-    ds_iterations: list[DSIteration]
-    evaluation: PairwiseEvaluation
+    # Pipeline results (intermediate texts only with verbosity="full")
+    smart_queue: Optional[SmartQueueResult] = None
+    pcv: Optional[PCVResult] = None
+    ds_iterations: list[DSIteration] = Field(default_factory=list)
+    evaluation: Optional[PairwiseEvaluation] = None
+    evaluation_status: Literal["complete", "pending", "skipped", "failed"] = "complete"
     
     # Metadata
     original_length: int
@@ -66,12 +100,69 @@ class OptimizeResponse(BaseModel):
     length_change_percent: float
     converged: bool
     convergence_iteration: Optional[int] = None
+    reused_from: Optional[str] = Field(None, description="run_id of the near-duplicate run that was reused")
+    similarity: Optional[float] = None
+    incremental: Optional[IncrementalResult] = None
+    stages_cut_short: list[str] = Field(default_factory=list, description="Stages skipped or interrupted by deadline_ms")
     
     # Timing
     processing_time_seconds: float
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
 
+# Fields an /optimize response keeps per verbosity (None: all of them)
+RESPONSE_FIELDS = {
+    "full": None,
+    "summary": set(OptimizeResponse.model_fields) - {"pcv", "ds_iterations"},
+    "final": {"success", "run_id", "final_prompt", "evaluation_status", "stages_cut_short", "processing_time_seconds", "timestamp"},
+}
+
+
+def response_exclude(verbosity: str) -> Optional[set[str]]:
+    """OptimizeResponse fields to leave out of the body for a verbosity"""
+    keep = RESPONSE_FIELDS[verbosity]
+    return None if keep is None else set(OptimizeResponse.model_fields) - keep
+
+
+class EvaluationStatusResponse(BaseModel):
+    """Deferred pairwise evaluation lookup result"""
+    run_id: str
+    status: Literal["pending", "complete", "skipped", "failed"]
+    evaluation: Optional[PairwiseEvaluation] = None
+    error: Optional[str] = None
+
+
+class HistoryItem(BaseModel):
+    """Summary of a stored optimization run"""
+    run_id: str
+    created_at: float
+    backend: str
+    model: Optional[str] = None
+    score: Optional[float] = None
+    converged: bool
+    iterations: int
+    original_length: int
+    final_length: int
+    processing_time: float
+    prompt_tokens: int
+    completion_tokens: int
+    preview: str
+
+
+class HistoryPage(BaseModel):
+    """Page of history items with a keyset cursor for the next page"""
+    items: list[HistoryItem]
+    next_cursor: Optional[str] = None
+
+
+class HistoryDetail(HistoryItem):
+    """Full stored optimization run"""
+    params: dict
+    original_prompt: str
+    final_prompt: str
+    stages: dict
+
+
 class ErrorResponse(BaseModel):
     """Error response model"""
     success: bool = False
@@ -85,3 +176,10 @@ class HealthResponse(BaseModel):
     status: str
     version: str = "1.0.0"
     timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ReadinessResponse(BaseModel):
+    """Readiness check response"""
+    status: Literal["ready", "starting"]
+    checks: dict = Field(default_factory=dict)
+    warmup_seconds: Optional[float] = None
@@ -0,0 +1,179 @@
+"""
+Stage checkpoints of optimization runs.
+
+Each completed stage output of a run is stored (SQLite, synchronously) under
+its run id, together with a fingerprint of the request. A retry with the same
+run id and request skips the stages already stored; transient provider
+errors are retried in place (STAGE_RETRIES) before a run gives up.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+from ..config import settings
+from ..models.schemas import OptimizeRequest
+from ..services.llm_provider import CallCancelled, DeadlineExceeded
+from ..services.metrics import metrics
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    run_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (run_id, stage)
+);
+CREATE INDEX IF NOT EXISTS idx_checkpoints_created ON checkpoints (created_at);
+"""
+
+# Request fields that do not change stage outputs; a retry may change them freely
+NON_SEMANTIC_FIELDS = {
+    "gemini_api_key",
+    "xai_api_key",
+    "run_id",
+    "max_iterations",
+    "defer_evaluation",
+    "evaluation_sample_rate",
+    "stream_mode",
+    "stream_compression",
+    "deadline_ms",
+    "priority",
+    "verbosity",
+}
+
+
+def request_fingerprint(request: OptimizeRequest) -> str:
+    params = request.dict(exclude=NON_SEMANTIC_FIELDS)
+    return hashlib.sha256(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def is_transient(error: Exception) -> bool:
+    """Provider errors worth retrying: connection failures, timeouts, 429 and 5xx"""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    from requests.exceptions import ChunkedEncodingError, ConnectionError, HTTPError, Timeout
+
+    if isinstance(error, (ConnectionError, ChunkedEncodingError, Timeout)):
+        return True
+    if isinstance(error, HTTPError):
+        status = getattr(error.response, "status_code", None)
+        return status == 429 or (status is not None and status >= 500)
+    return False
+
+
+class CheckpointStore:
+    """Per-stage outputs of runs, kept for CHECKPOINT_TTL seconds"""
+
+    def __init__(self, path: Union[str, Path], ttl_seconds: int, prune_every: int = 200):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def load(self, run_id: str) -> tuple[Optional[str], dict[str, Any]]:
+        """Fingerprint and stage outputs stored for a run (None, {} if none)"""
+        rows = self._conn().execute(
+            "SELECT stage, fingerprint, value FROM checkpoints WHERE run_id = ? AND created_at >= ?",
+            (run_id, time.time() - self.ttl_seconds),
+        ).fetchall()
+        if not rows:
+            return None, {}
+        return rows[0][1], {stage: json.loads(zlib.decompress(value)) for stage, _, value in rows}
+
+    def save(self, run_id: str, fingerprint: str, stage: str, value: Any) -> None:
+        blob = zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"), 6)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (run_id, stage, fingerprint, created_at, value) VALUES (?, ?, ?, ?, ?)",
+                (run_id, stage, fingerprint, time.time(), blob),
+            )
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            with conn:
+                conn.execute("DELETE FROM checkpoints WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+
+    def clear(self, run_id: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM checkpoints WHERE run_id = ?", (run_id,))
+
+
+checkpoint_store = CheckpointStore(settings.CHECKPOINT_DB_PATH, settings.CHECKPOINT_TTL)
+
+
+class RunCheckpoint:
+    """
+    Checkpoint of one run: stage outputs found at start plus a writer for new
+    ones. Disabled (stores nothing) with CHECKPOINT_ENABLED off.
+    """
+
+    def __init__(self, request: OptimizeRequest, run_id: str):
+        self.run_id = run_id
+        self.enabled = settings.CHECKPOINT_ENABLED
+        self.fingerprint = request_fingerprint(request)
+        self.stages: dict[str, Any] = {}
+        self.resumed: list[str] = []
+        # Only a client-chosen run id can have been used before
+        if not self.enabled or request.run_id is None:
+            return
+        fingerprint, stages = checkpoint_store.load(run_id)
+        if fingerprint is not None and fingerprint != self.fingerprint:
+            raise ValueError(f"run_id {run_id} was already used for a different request")
+        self.stages = stages
+
+    def run(
+        self,
+        stage: str,
+        fn: Callable[[], Any],
+        encode: Callable[[Any], Any] = lambda value: value,
+        decode: Callable[[Any], Any] = lambda value: value,
+        cancel: Optional[threading.Event] = None,
+    ) -> Any:
+        """
+        Output of a stage: the checkpointed one, or fn() (retried on transient
+        provider errors) which is then checkpointed.
+        """
+        if stage in self.stages:
+            self.resumed.append(stage)
+            metrics.incr("stages_resumed")
+            return decode(self.stages[stage])
+        attempt = 0
+        while True:
+            try:
+                value = fn()
+                break
+            except Exception as e:
+                if attempt >= settings.STAGE_RETRIES or not is_transient(e):
+                    raise
+                attempt += 1
+                metrics.incr("stage_retries")
+                backoff = settings.STAGE_RETRY_BACKOFF * 2 ** (attempt - 1)
+                if cancel is None:
+                    time.sleep(backoff)
+                elif cancel.wait(backoff):
+                    raise CallCancelled()
+        if self.enabled:
+            encoded = encode(value)
+            self.stages[stage] = encoded
+            checkpoint_store.save(self.run_id, self.fingerprint, stage, encoded)
+        return value
@@ -0,0 +1,307 @@
+"""
+Near-duplicate index over previously optimized prompts (MinHash LSH).
+
+Prompts are normalized (case, whitespace), split into word shingles and
+summarized as MinHash signatures. Signatures use one-permutation hashing:
+every shingle is hashed once and lands in one of num_perm bins, which keeps
+the cost linear in the prompt length instead of num_perm times it. They are
+bucketed by tenant and band so a lookup only compares against a handful of
+candidates of its own tenant, independent of the number of stored entries.
+"""
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Union
+
+from ..config import settings
+
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Signature scheme stored in snapshots; entries of another scheme are not comparable
+_SCHEME = "oph-crc32-2"
+
+
+def normalize(text: str) -> list[str]:
+    """Lowercase and tokenize into words (numbers are kept: "50 words" is not "500 words")"""
+    return _WORD_RE.findall(text.lower())
+
+
+def same_prompt(a: str, b: str) -> bool:
+    """Whether two prompts differ only in case and whitespace (safe to reuse an answer verbatim)"""
+    return " ".join(a.lower().split()) == " ".join(b.lower().split())
+
+
+def shingles(text: str) -> set[int]:
+    """Hashed word bigrams of the normalized text (each word is hashed once)"""
+    words = [zlib.crc32(w.encode("utf-8")) for w in normalize(text)]
+    if len(words) < 2:
+        return set(words) or {0}
+    return {(a * 0x9E3779B1 + b) & _MAX_HASH for a, b in zip(words, words[1:])}
+
+
+def _choose_bands(threshold: float, num_perm: int) -> int:
+    """Pick the band count whose LSH S-curve midpoint is closest to threshold"""
+    best, best_err = 1, float("inf")
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        err = abs((1 / bands) ** (1 / rows) - threshold)
+        if err < best_err:
+            best, best_err = bands, err
+    return best
+
+
+@dataclass
+class DedupHit:
+    """A stored prompt similar to the looked-up one"""
+    run_id: str
+    original_prompt: str
+    final_prompt: str
+    similarity: float
+
+
+class MinHashLSHIndex:
+    """In-memory MinHash LSH index with snapshot/restore to disk"""
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 64,
+        max_entries: int = 1_000_000,
+        seed: int = 1,
+    ):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.max_entries = max_entries
+        self.bands = _choose_bands(threshold, num_perm)
+        self.rows = num_perm // self.bands
+
+        rng = random.Random(seed)
+        self._hash = (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._entries: dict[int, tuple[bytes, str, str, str, str]] = {}
+        self._buckets: list[dict[bytes, list[int]]] = [{} for _ in range(self.bands)]
+        self._next_id = 0
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_seconds = 0.0
+        self.signature_seconds = 0.0
+
+    def signature(self, text: str) -> bytes:
+        """
+        MinHash signature packed as num_perm 32-bit values: the minimum hash
+        per bin, with empty bins filled from the next non-empty one.
+        """
+        a, b = self._hash
+        n = self.num_perm
+        empty = _MAX_HASH + 1
+        bins = [empty] * n
+        for h in shingles(text):
+            value = (a * h + b) % _MERSENNE_PRIME
+            slot = value % n
+            value = (value // n) & _MAX_HASH
+            if value < bins[slot]:
+                bins[slot] = value
+        filled = next((v for v in reversed(bins) if v != empty), 0)
+        for i in range(n - 1, -1, -1):
+            if bins[i] == empty:
+                bins[i] = filled
+            else:
+                filled = bins[i]
+        return array("I", bins).tobytes()
+
+    def _band_keys(self, sig: bytes, tenant: str) -> list[bytes]:
+        """Bucket keys of a signature; entries of other tenants never share a bucket"""
+        width = self.rows * 4
+        prefix = tenant.encode("utf-8") + b"\0"
+        return [prefix + sig[i * width : (i + 1) * width] for i in range(self.bands)]
+
+    @staticmethod
+    def _similarity(a: bytes, b: bytes) -> float:
+        va, vb = array("I", a), array("I", b)
+        return sum(x == y for x, y in zip(va, vb)) / len(va)
+
+    def _remove(self, entry_id: int) -> None:
+        sig, tenant = self._entries.pop(entry_id)[:2]
+        for band, key in enumerate(self._band_keys(sig, tenant)):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.remove(entry_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def _insert(self, sig: bytes, tenant: str, run_id: str, original_prompt: str, final_prompt: str) -> None:
+        """Store an entry (caller holds the lock)"""
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (sig, tenant, run_id, original_prompt, final_prompt)
+        for band, key in enumerate(self._band_keys(sig, tenant)):
+            self._buckets[band].setdefault(key, []).append(entry_id)
+
+    def add(self, original_prompt: str, final_prompt: str, run_id: str, tenant: str) -> None:
+        """Index an optimized prompt of a tenant; the oldest entry is evicted when full"""
+        sig = self.signature(original_prompt)
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+            self._insert(sig, tenant, run_id, original_prompt, final_prompt)
+
+    def lookup(self, prompt: str, tenant: str, threshold: Optional[float] = None) -> Optional[DedupHit]:
+        """Most similar prompt of the tenant at or above the threshold, if any"""
+        threshold = self.threshold if threshold is None else threshold
+        start = time.perf_counter()
+        sig = self.signature(prompt)
+        signed = time.perf_counter()
+
+        best: Optional[DedupHit] = None
+        with self._lock:
+            candidates = set()
+            for band, key in enumerate(self._band_keys(sig, tenant)):
+                candidates.update(self._buckets[band].get(key, ()))
+            for entry_id in candidates:
+                entry_sig, _, run_id, original, final = self._entries[entry_id]
+                similarity = self._similarity(sig, entry_sig)
+                if similarity >= threshold and (best is None or similarity > best.similarity):
+                    best = DedupHit(run_id, original, final, similarity)
+
+            self.lookups += 1
+            self.hits += best is not None
+            self.signature_seconds += signed - start
+            self.lookup_seconds += time.perf_counter() - signed
+        return best
+
+    def stats(self) -> dict:
+        """Hit rate and mean lookup latency, in total and split into signature and index probe"""
+        lookups = max(self.lookups, 1)
+        return {
+            "entries": len(self._entries),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / lookups, 4),
+            "avg_lookup_ms": round((self.signature_seconds + self.lookup_seconds) / lookups * 1000, 4),
+            "avg_signature_ms": round(self.signature_seconds / lookups * 1000, 4),
+            "avg_index_lookup_ms": round(self.lookup_seconds / lookups * 1000, 4),
+            "threshold": self.threshold,
+            "bands": self.bands,
+            "rows": self.rows,
+        }
+
+    def snapshot(self, path: Union[str, Path]) -> None:
+        """
+        Atomically write the index entries to disk (JSON, signatures
+        hex-encoded). Only the entry list is copied under the lock; encoding
+        and writing happen outside it, so lookups are not stalled.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            entries = list(self._entries.values())
+        state = {
+            "scheme": _SCHEME,
+            "num_perm": self.num_perm,
+            "hash": self._hash,
+            "entries": [[sig.hex(), *rest] for sig, *rest in entries],
+        }
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def restore(self, path: Union[str, Path]) -> bool:
+        """Load a snapshot written by snapshot(); returns False if none exists"""
+        path = Path(path)
+        if not path.exists():
+            return False
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("scheme") != _SCHEME or state["num_perm"] != self.num_perm or tuple(state["hash"]) != self._hash:
+            return False
+        with self._lock:
+            self._reset()
+            for sig, tenant, run_id, original, final in state["entries"]:
+                self._insert(bytes.fromhex(sig), tenant, run_id, original, final)
+        return True
+
+
+class DedupCache:
+    """
+    Near-duplicate cache partitioned by tenant, with lazy restore and
+    periodic snapshots (one at a time: a snapshot due while another is still
+    being written is skipped).
+    """
+
+    def __init__(self, snapshot_path: str, snapshot_every: int, **index_kwargs):
+        self.index = MinHashLSHIndex(**index_kwargs)
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self._loaded = False
+        self._added = 0
+        self._load_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                try:
+                    self.index.restore(self.snapshot_path)
+                except (OSError, ValueError, KeyError, TypeError):
+                    pass
+                self._loaded = True
+
+    def lookup(self, prompt: str, tenant: str, threshold: Optional[float] = None) -> Optional[DedupHit]:
+        self._ensure_loaded()
+        return self.index.lookup(prompt, tenant, threshold)
+
+    def add(self, original_prompt: str, final_prompt: str, run_id: str, tenant: str) -> None:
+        self._ensure_loaded()
+        self.index.add(original_prompt, final_prompt, run_id, tenant)
+        self._added += 1
+        if self.snapshot_every and self._added % self.snapshot_every == 0 and self._snapshot_lock.acquire(blocking=False):
+            threading.Thread(target=self._background_save, name="dedup-snapshot", daemon=True).start()
+
+    def _background_save(self) -> None:
+        try:
+            self.index.snapshot(self.snapshot_path)
+        except OSError:
+            pass  # the next periodic snapshot retries
+        finally:
+            self._snapshot_lock.release()
+
+    def save(self) -> None:
+        """Write a snapshot now, after any one in progress"""
+        if self._loaded:
+            with self._snapshot_lock:
+                self.index.snapshot(self.snapshot_path)
+
+    def stats(self) -> dict:
+        self._ensure_loaded()
+        return self.index.stats()
+
+
+dedup_cache = DedupCache(
+    settings.DEDUP_SNAPSHOT_PATH,
+    settings.DEDUP_SNAPSHOT_EVERY,
+    threshold=settings.DEDUP_THRESHOLD,
+    num_perm=settings.DEDUP_NUM_PERM,
+    max_entries=settings.DEDUP_MAX_ENTRIES,
+)
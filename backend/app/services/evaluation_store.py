@@ -0,0 +1,96 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from ..config import settings
+from ..models.results import EvaluationData
+
+
+class EvaluationStore:
+    """
+    Runs deferred pairwise evaluations in the background and keeps their
+    results, keyed by run id, for a bounded time.
+    """
+
+    def __init__(self, max_workers: int = 4, max_entries: int = 1000, ttl_seconds: int = 3600):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pairwise-eval")
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def should_evaluate(sample_rate: float) -> bool:
+        """Decide whether this run is in the evaluated fraction of traffic"""
+        return sample_rate >= 1.0 or random.random() < sample_rate
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        while self._entries:
+            run_id, entry = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and entry["created_at"] >= cutoff:
+                break
+            self._entries.pop(run_id)
+
+    def _set(self, run_id: str, **fields) -> None:
+        with self._lock:
+            entry = self._entries.get(run_id)
+            if entry is not None:
+                entry.update(fields)
+
+    def submit(
+        self,
+        run_id: str,
+        evaluate: Callable[[], EvaluationData],
+        on_complete: Optional[Callable[[EvaluationData], None]] = None,
+    ) -> None:
+        """Schedule an evaluation; its result becomes available via get()"""
+        with self._lock:
+            self._entries[run_id] = {
+                "status": "pending",
+                "evaluation": None,
+                "error": None,
+                "created_at": time.time(),
+            }
+            self._prune()
+
+        def run():
+            try:
+                evaluation = evaluate()
+            except Exception as e:
+                self._set(run_id, status="failed", error=str(e))
+                return
+            self._set(run_id, status="complete", evaluation=evaluation)
+            if on_complete is not None:
+                on_complete(evaluation)
+
+        self._executor.submit(run)
+
+    def record(self, run_id: str, evaluation: Optional[EvaluationData], status: str) -> None:
+        """Store an evaluation that was computed (or skipped) inline"""
+        with self._lock:
+            self._entries[run_id] = {
+                "status": status,
+                "evaluation": evaluation,
+                "error": None,
+                "created_at": time.time(),
+            }
+            self._prune()
+
+    def fail(self, run_id: str, error: str) -> None:
+        """Mark a pending evaluation that was run inline as failed"""
+        self._set(run_id, status="failed", error=error)
+
+    def get(self, run_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(run_id)
+            return dict(entry) if entry is not None else None
+
+
+evaluation_store = EvaluationStore(
+    max_workers=settings.EVALUATION_WORKERS,
+    ttl_seconds=settings.EVALUATION_RESULT_TTL,
+)
@@ -0,0 +1,329 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Optional, Union
+
+from ..config import settings
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL UNIQUE,
+    tenant TEXT,
+    created_at REAL NOT NULL,
+    backend TEXT NOT NULL,
+    model TEXT,
+    score REAL,
+    converged INTEGER NOT NULL,
+    iterations INTEGER NOT NULL,
+    original_length INTEGER NOT NULL,
+    final_length INTEGER NOT NULL,
+    processing_time REAL NOT NULL,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    preview TEXT NOT NULL,
+    params TEXT NOT NULL,
+    original_prompt BLOB NOT NULL,
+    final_prompt BLOB NOT NULL,
+    stages BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_created ON runs (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_runs_tenant_created ON runs (tenant, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_runs_backend_created ON runs (backend, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_runs_score_created ON runs (score, created_at DESC, id DESC);
+"""
+
+SUMMARY_COLUMNS = (
+    "id, run_id, created_at, backend, model, score, converged, iterations, original_length, "
+    "final_length, processing_time, prompt_tokens, completion_tokens, preview"
+)
+
+
+def evaluation_score(evaluation: Optional[dict]) -> Optional[float]:
+    """Mean of the pairwise evaluation axes, used for filtering and sorting"""
+    if not evaluation:
+        return None
+    axes = ("clarity", "structure", "constraints", "usefulness")
+    return round(sum(float(evaluation.get(a, 0.0)) for a in axes) / len(axes), 4)
+
+
+class HistoryStore:
+    """
+    SQLite-backed history of optimization runs.
+
+    Writes are queued and applied in batches by a background thread, so
+    recording a run never blocks the request path. A score update that
+    arrives before its run's row is held and applied when the row is
+    inserted. Texts above compress_min_bytes are stored zlib-compressed.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        compress_min_bytes: int = 512,
+        queue_size: int = 10000,
+        batch_size: int = 256,
+    ):
+        self.path = Path(path)
+        self.compress_min_bytes = compress_min_bytes
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=queue_size)
+        # run_id -> score of updates that matched no row yet (writer thread only)
+        self._held_scores: dict[str, Optional[float]] = {}
+        self._held_limit = queue_size
+        self._local = threading.local()
+        self._writer: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    # --- connections -------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Databases created before runs were scoped per tenant lack the column
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(runs)")}
+        if columns and "tenant" not in columns:
+            conn.execute("ALTER TABLE runs ADD COLUMN tenant TEXT")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._start_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+                self._writer.start()
+
+    # --- encoding ----------------------------------------------------------
+
+    def _pack(self, text: str) -> Union[str, bytes]:
+        raw = text.encode("utf-8")
+        if len(raw) < self.compress_min_bytes:
+            return text
+        return zlib.compress(raw, 6)
+
+    @staticmethod
+    def _unpack(value: Union[str, bytes, None]) -> Optional[str]:
+        if isinstance(value, bytes):
+            return zlib.decompress(value).decode("utf-8")
+        return value
+
+    # --- writes ------------------------------------------------------------
+
+    def record(self, run: dict[str, Any]) -> None:
+        """
+        Queue a finished run for persistence without blocking.
+
+        Expected keys: run_id, tenant, backend, model, params,
+        original_prompt, final_prompt, stages, evaluation, converged,
+        iterations, original_length, final_length, processing_time,
+        token_usage.
+        """
+        usage = run.get("token_usage") or {}
+        row = (
+            run["run_id"],
+            run.get("created_at", time.time()),
+            run["backend"],
+            run.get("model"),
+            evaluation_score(run.get("evaluation")),
+            int(bool(run["converged"])),
+            run["iterations"],
+            run["original_length"],
+            run["final_length"],
+            run["processing_time"],
+            usage.get("prompt_tokens", 0),
+            usage.get("completion_tokens", 0),
+            run["original_prompt"][:200],
+            json.dumps(run.get("params", {}), ensure_ascii=False),
+            self._pack(run["original_prompt"]),
+            self._pack(run["final_prompt"]),
+            self._pack(json.dumps(run.get("stages", {}), ensure_ascii=False, default=str)),
+            run.get("tenant"),
+        )
+        self._enqueue(("insert", row))
+
+    def update_evaluation(self, run_id: str, evaluation: dict) -> None:
+        """Queue a score update for a run whose evaluation finished later"""
+        self._enqueue(("score", (evaluation_score(evaluation), run_id)))
+
+    def _enqueue(self, item: tuple) -> None:
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _hold_score(self, run_id: str, score: Optional[float]) -> None:
+        self._held_scores.pop(run_id, None)
+        self._held_scores[run_id] = score
+        if len(self._held_scores) > self._held_limit:
+            del self._held_scores[next(iter(self._held_scores))]
+            self.dropped += 1
+
+    def _with_held_score(self, row: tuple) -> tuple:
+        if row[0] not in self._held_scores:
+            return row
+        return row[:4] + (self._held_scores.pop(row[0]),) + row[5:]
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            inserts = [self._with_held_score(data) for op, data in filter(None, batch) if op == "insert"]
+            scores = [data for op, data in filter(None, batch) if op == "score"]
+            try:
+                with conn:
+                    if inserts:
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO runs (run_id, created_at, backend, model, score, converged, "
+                            "iterations, original_length, final_length, processing_time, prompt_tokens, "
+                            "completion_tokens, preview, params, original_prompt, final_prompt, stages, tenant) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            inserts,
+                        )
+                    for score, run_id in scores:
+                        if conn.execute("UPDATE runs SET score = ? WHERE run_id = ?", (score, run_id)).rowcount == 0:
+                            self._hold_score(run_id, score)
+            except sqlite3.Error:
+                self.dropped += len(inserts) + len(scores)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if stop:
+                conn.close()
+                return
+
+    def flush(self) -> None:
+        """Block until all queued writes are applied"""
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        """Flush pending writes and stop the writer thread"""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join(timeout=10)
+            self._writer = None
+
+    # --- reads -------------------------------------------------------------
+
+    @staticmethod
+    def _encode_cursor(created_at: float, row_id: int) -> str:
+        return f"{created_at!r}:{row_id}"
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> tuple[float, int]:
+        try:
+            created_at, row_id = cursor.rsplit(":", 1)
+            return float(created_at), int(row_id)
+        except ValueError:
+            raise ValueError(f"Invalid history cursor: {cursor}")
+
+    def query(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        tenant: Optional[str] = None,
+        backend: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        min_score: Optional[float] = None,
+        max_score: Optional[float] = None,
+    ) -> tuple[list[dict], Optional[str]]:
+        """
+        Newest-first page of run summaries using keyset pagination, limited
+        to one tenant's runs when `tenant` is given (None: every run).
+
+        Returns the rows and an opaque cursor for the next page (None at the end).
+        """
+        where, args = [], []
+        if cursor:
+            where.append("(created_at, id) < (?, ?)")
+            args.extend(self._decode_cursor(cursor))
+        if tenant is not None:
+            where.append("tenant = ?")
+            args.append(tenant)
+        if backend:
+            where.append("backend = ?")
+            args.append(backend)
+        if since is not None:
+            where.append("created_at >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("created_at < ?")
+            args.append(until)
+        if min_score is not None:
+            where.append("score >= ?")
+            args.append(min_score)
+        if max_score is not None:
+            where.append("score <= ?")
+            args.append(max_score)
+
+        sql = f"SELECT {SUMMARY_COLUMNS} FROM runs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        args.append(limit + 1)
+
+        rows = [dict(r) for r in self._reader().execute(sql, args).fetchall()]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self._encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+        for row in rows:
+            row["converged"] = bool(row["converged"])
+            del row["id"]
+        return rows, next_cursor
+
+    def get(self, run_id: str, tenant: Optional[str] = None) -> Optional[dict]:
+        """
+        Full record of a single run, with texts decompressed. With `tenant`,
+        another tenant's run is reported as missing.
+        """
+        row = self._reader().execute(
+            f"SELECT {SUMMARY_COLUMNS}, tenant, params, original_prompt, final_prompt, stages FROM runs WHERE run_id = ?",
+            (run_id,),
+        ).fetchone()
+        if row is None or (tenant is not None and row["tenant"] != tenant):
+            return None
+        data = dict(row)
+        del data["id"]
+        data["converged"] = bool(data["converged"])
+        data["params"] = json.loads(data["params"])
+        data["original_prompt"] = self._unpack(data["original_prompt"])
+        data["final_prompt"] = self._unpack(data["final_prompt"])
+        data["stages"] = json.loads(self._unpack(data["stages"]))
+        return data
+
+
+history_store = HistoryStore(
+    settings.HISTORY_DB_PATH,
+    compress_min_bytes=settings.HISTORY_COMPRESS_MIN_BYTES,
+    queue_size=settings.HISTORY_QUEUE_SIZE,
+)
@@ -0,0 +1,147 @@
+"""
+Incremental re-optimization of edited prompts.
+
+An incremental run names an earlier run (base_run_id) and carries the
+edited prompt. Both prompts are split into sections (before markdown
+headings, else at blank lines) and diffed: a section that is unchanged since
+the base run reuses its optimized text, an edited one is adapted from its
+previous optimized version, and a new one is optimized on its own, each with
+a single section-sized call. Every incremental run stores its section map in
+history, so a chain of edits stays incremental. A base run without a section
+map (an ordinary run of a multi-section prompt) cannot be diffed; its final
+prompt is then adapted to the edit as a whole, in one call.
+"""
+import difflib
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from ..config import settings
+from ..services.history import history_store
+
+
+_HEADING_RE = re.compile(r"^ {0,3}#{1,6}\s")
+_FENCE_RE = re.compile(r"^ {0,3}(```|~~~)")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+
+
+def section_key(text: str) -> str:
+    """Identity of a section, insensitive to whitespace and re-wrapping"""
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def split_sections(text: str) -> list[str]:
+    """Sections of a prompt: split before markdown headings, else into paragraphs"""
+    lines = text.strip().splitlines()
+    fenced = False
+    starts = []
+    for i, line in enumerate(lines):
+        if _FENCE_RE.match(line):
+            fenced = not fenced
+        elif not fenced and _HEADING_RE.match(line):
+            starts.append(i)
+    if not starts:
+        return [p.strip() for p in _PARAGRAPH_RE.split(text.strip()) if p.strip()]
+    bounds = ([0] if starts[0] else []) + starts + [len(lines)]
+    sections = ("\n".join(lines[a:b]).strip() for a, b in zip(bounds, bounds[1:]))
+    return [s for s in sections if s]
+
+
+def join_sections(sections: list[str]) -> str:
+    return "\n\n".join(sections)
+
+
+def outline(sections: list[str], width: int = 80) -> str:
+    """First line of every section, as context for optimizing one of them"""
+    return "\n".join(f"{i + 1}. {s.splitlines()[0][:width]}" for i, s in enumerate(sections))
+
+
+@dataclass
+class SectionPlan:
+    """What an incremental run does with one section of the new prompt"""
+    index: int
+    text: str
+    key: str
+    action: str  # "reuse", "adapt" or "optimize"
+    optimized: Optional[str] = None
+    previous: Optional[str] = None
+    previous_optimized: Optional[str] = None
+
+    def record(self) -> dict:
+        """Entry of the section map kept in the run's history"""
+        return {"key": self.key, "text": self.text, "optimized": self.optimized}
+
+
+def load_base(run_id: str, tenant: str) -> dict:
+    """
+    History record of the run an incremental run starts from. Only runs of
+    the same tenant can be a base; another tenant's run is reported unknown.
+    """
+    if not settings.HISTORY_ENABLED:
+        raise ValueError("Incremental re-optimization needs HISTORY_ENABLED")
+    run = history_store.get(run_id, tenant)
+    if run is None:
+        # The base run may have finished moments ago, with its record still queued
+        history_store.flush()
+        run = history_store.get(run_id, tenant)
+    if run is None:
+        raise ValueError(f"Unknown base run id: {run_id}")
+    return run
+
+
+def base_sections(run: dict) -> list[dict]:
+    """
+    Section map of a base run. Runs that were not incremental have none
+    (empty: adapt the whole prompt instead), unless their prompt is a single
+    section, which maps to the whole result.
+    """
+    sections = (run.get("stages") or {}).get("sections")
+    if sections:
+        return sections
+    original = split_sections(run["original_prompt"])
+    if len(original) == 1:
+        return [{"key": section_key(original[0]), "text": original[0], "optimized": run["final_prompt"]}]
+    return []
+
+
+def plan_sections(old: list[dict], new: list[str]) -> list[SectionPlan]:
+    """
+    Diff the new prompt's sections against a base section map. Sections
+    found in the map (also after moving) are reused; sections replacing old
+    ones in place are adapted from them; the rest are optimized.
+    """
+    by_key = {entry["key"]: entry for entry in old}
+    keys = [section_key(text) for text in new]
+    plans = [
+        SectionPlan(i, text, key, "reuse", by_key[key]["optimized"]) if key in by_key else SectionPlan(i, text, key, "optimize")
+        for i, (text, key) in enumerate(zip(new, keys))
+    ]
+    matcher = difflib.SequenceMatcher(None, [entry["key"] for entry in old], keys, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "replace":
+            continue
+        for entry, plan in zip(old[i1:i2], plans[j1:j2]):
+            if plan.action == "optimize":
+                plan.action = "adapt"
+                plan.previous = entry["text"]
+                plan.previous_optimized = entry["optimized"]
+    return plans
+
+
+def summary(base_run_id: str, plans: list[SectionPlan], mode: str = "sections") -> dict:
+    """
+    Section counts per action, reported by the 'incremental' event. In
+    "whole_prompt" mode the prompt was adapted as one unit.
+    """
+    if mode == "whole_prompt":
+        return {"base_run_id": base_run_id, "mode": mode, "sections": 1, "reused": 0, "adapted": 1, "optimized": 0}
+    counts = {action: sum(p.action == action for p in plans) for action in ("reuse", "adapt", "optimize")}
+    return {
+        "base_run_id": base_run_id,
+        "mode": mode,
+        "sections": len(plans),
+        "reused": counts["reuse"],
+        "adapted": counts["adapt"],
+        "optimized": counts["optimize"],
+    }
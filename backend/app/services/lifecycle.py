@@ -0,0 +1,64 @@
+import asyncio
+import time
+from importlib import import_module
+from typing import Any
+
+
+class Readiness:
+    """Tracks start-up warm-up so readiness can be reported separately from liveness"""
+
+    def __init__(self):
+        self.ready = False
+        self.started_at = time.time()
+        self.ready_at = None
+        self.checks: dict[str, Any] = {}
+
+    def status(self) -> dict:
+        return {
+            "status": "ready" if self.ready else "starting",
+            "checks": dict(self.checks),
+            "warmup_seconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+        }
+
+
+readiness = Readiness()
+
+
+def _warm_up_sync() -> None:
+    """Import and initialize everything the first request would otherwise pay for"""
+    from .llm_provider import prewarm_connections
+    from .dedup_cache import dedup_cache
+    from .history import history_store
+    from .triage import triage_classifier
+
+    # Modules the API routes import on first use
+    for module in ("pipeline", "profiling", "run_streams", "provider_pool"):
+        import_module(f"{__package__}.{module}")
+    readiness.checks["modules"] = True
+
+    triage_classifier.score("warm up")
+    readiness.checks["triage"] = True
+
+    history_store.query(limit=1)
+    readiness.checks["history"] = True
+
+    dedup_cache.stats()
+    readiness.checks["dedup_cache"] = True
+
+    readiness.checks["providers"] = prewarm_connections()
+
+
+async def warm_up(timeout: float) -> None:
+    """
+    Run warm-up in a worker thread. Readiness is reported once it finishes,
+    fails or times out: warm-up only saves latency, it is never required.
+    """
+    try:
+        await asyncio.wait_for(asyncio.to_thread(_warm_up_sync), timeout)
+    except asyncio.TimeoutError:
+        readiness.checks["timeout"] = True
+    except Exception as e:
+        readiness.checks["error"] = str(e)
+    finally:
+        readiness.ready = True
+        readiness.ready_at = time.time()
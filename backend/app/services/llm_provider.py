@@ -1,33 +1,291 @@
-import requests
 import json
-from typing import Optional
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Iterator, Optional, Union
 from ..config import settings
+from ..services import tracing
+
+
+PROVIDER_HOSTS = {
+    "gemini": "https://generativelanguage.googleapis.com",
+    "grok": "https://api.x.ai",
+}
+
+BACKENDS = ("gemini", "grok", "openai_compat")
+
+# Stage names used by PromptOptimizer._call (per-stage model tiering keys)
+PIPELINE_STAGES = (
+    "smart_queue",
+    "proposer",
+    "critic",
+    "verifier",
+    "d_block",
+    "s_block",
+    "warm_start",
+    "section",
+    "pairwise_eval",
+)
+
+# Gemini models with a thinking budget (2.5 and later)
+_GEMINI_THINKING_RE = re.compile(r"gemini-(2\.5|[3-9])")
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Shared HTTP session so provider calls reuse pooled keep-alive connections.
+    `requests` is imported on first use to keep it out of app startup.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=len(PROVIDER_HOSTS), pool_maxsize=settings.HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def prewarm_connections(timeout: float = 3.0) -> dict[str, bool]:
+    """Open pooled connections to the backends with server-side keys and to self-hosted servers"""
+    keys = {"gemini": settings.GEMINI_API_KEY, "grok": settings.XAI_API_KEY}
+    session = get_http_session()
+    warmed = {}
+    for backend, url in PROVIDER_HOSTS.items():
+        if not keys[backend]:
+            continue
+        try:
+            session.head(url, timeout=timeout)
+            warmed[backend] = True
+        except Exception:
+            warmed[backend] = False
+    for server in openai_compat_servers():
+        try:
+            session.head(server.base_url, timeout=timeout)
+            warmed[server.base_url] = True
+        except Exception:
+            warmed[server.base_url] = False
+    return warmed
+
+
+class CallCancelled(Exception):
+    """Raised when a provider call is aborted because its run was cancelled"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call does not finish within the run's remaining deadline"""
+    
+    def __init__(self, stage: Optional[str] = None):
+        super().__init__(f"Deadline exceeded in {stage}" if stage else "Deadline exceeded")
+        self.stage = stage
+
+
+@dataclass(frozen=True)
+class GenerationParams:
+    """
+    Generation controls of a call; None leaves the backend's default.
+    thinking_budget is in tokens: 0 turns thinking off, -1 lets the model decide.
+    """
+    max_output_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    stop: Optional[tuple[str, ...]] = None
+    thinking_budget: Optional[int] = None
+    
+    def scaled(self, items: int) -> "GenerationParams":
+        """The same controls for a combined request answering `items` calls"""
+        if self.max_output_tokens is None:
+            return self
+        return replace(self, max_output_tokens=self.max_output_tokens * items)
+
+
+class PerThread:
+    """
+    Provider attribute kept per thread. One provider instance serves
+    concurrent calls (fan-out D, section workers), and each caller reads back
+    the usage of its own call right after it, on the same thread.
+    """
+    
+    def __init__(self, default: Any = None):
+        self.default = default
+    
+    def __set_name__(self, owner, name: str):
+        self.name = name
+    
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        return getattr(obj._per_thread, self.name, self.default)
+    
+    def __set__(self, obj, value) -> None:
+        setattr(obj._per_thread, self.name, value)
 
 
 class LLMProvider:
     """Base class for LLM providers"""
     
+    # Usage and streamed characters of the calling thread's last call
+    last_usage = PerThread()
+    last_partial_chars = PerThread(0)
+    
     def __init__(self, api_key: Optional[str] = None):
+        self._per_thread = threading.local()
         self.api_key = api_key
+        self.model: Optional[str] = None
     
-    def call(self, system_prompt: str, user_prompt: str) -> str:
+    def call(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        cancel: Optional[threading.Event] = None,
+        timeout: Optional[float] = None,
+        params: Optional[GenerationParams] = None,
+    ) -> str:
+        """
+        Run one completion. With a `cancel` event the call is made in
+        streaming mode and aborted (connection closed) as soon as it is set.
+        `timeout` is a total budget in seconds; DeadlineExceeded is raised
+        when it runs out. `params` are mapped to the backend's own fields.
+        """
         raise NotImplementedError
+    
+    @staticmethod
+    def _timeouts(timeout: Optional[float]) -> tuple[float, float]:
+        if timeout is None:
+            return settings.CONNECT_TIMEOUT, settings.READ_TIMEOUT
+        return min(settings.CONNECT_TIMEOUT, timeout), min(settings.READ_TIMEOUT, timeout)
+    
+    def _post_json(self, url: str, payload: dict, headers: Optional[dict] = None, timeout: Optional[float] = None) -> dict:
+        """Non-streaming POST returning the decoded JSON body"""
+        from requests.exceptions import Timeout
+        
+        with tracing.span("llm.http", **self._span_attributes(url, streaming=False)) as span:
+            try:
+                resp = get_http_session().post(url, headers=headers, json=payload, timeout=self._timeouts(timeout))
+            except Timeout:
+                if timeout is not None:
+                    raise DeadlineExceeded()
+                raise
+            span.set_attribute("http.status_code", resp.status_code)
+            resp.raise_for_status()
+            return resp.json()
+    
+    def _span_attributes(self, url: str, streaming: bool) -> dict:
+        """Trace attributes of an upstream request (the URL without its query, which may hold a key)"""
+        return {
+            "llm.provider": type(self).__name__,
+            "llm.model": self.model,
+            "llm.streaming": streaming,
+            "http.url": url.split("?", 1)[0],
+        }
+    
+    def _stream_events(
+        self,
+        url: str,
+        payload: dict,
+        cancel: threading.Event,
+        headers: Optional[dict] = None,
+        timeout: Optional[float] = None,
+    ) -> Iterator[dict]:
+        """
+        POST a streaming request and yield the JSON of each SSE `data:` line.
+        A watcher thread closes the connection once `cancel` is set or the
+        timeout budget runs out, which also stops generation (and billing)
+        upstream.
+        """
+        from requests.exceptions import Timeout
+        
+        if cancel.is_set():
+            raise CallCancelled()
+        
+        expires = time.monotonic() + timeout if timeout is not None else None
+        # Not a current span: the generator yields while it is open
+        span = tracing.start_span("llm.http", **self._span_attributes(url, streaming=True))
+        try:
+            resp = get_http_session().post(
+                url,
+                headers=headers,
+                json=payload,
+                stream=True,
+                timeout=self._timeouts(timeout)
+            )
+        except BaseException as e:
+            tracing.fail(span, e)
+            span.end()
+            if isinstance(e, Timeout) and timeout is not None:
+                raise DeadlineExceeded()
+            raise
+        span.set_attribute("http.status_code", resp.status_code)
+        done = threading.Event()
+        expired = threading.Event()
+        
+        def close_on_cancel():
+            while not done.is_set():
+                if cancel.wait(0.1):
+                    resp.close()
+                    return
+                if expires is not None and time.monotonic() >= expires:
+                    expired.set()
+                    resp.close()
+                    return
+        
+        threading.Thread(target=close_on_cancel, name="llm-cancel-watch", daemon=True).start()
+        try:
+            resp.raise_for_status()
+            first = True
+            # Raw bytes: SSE is UTF-8, but requests would decode text/* without a charset as Latin-1
+            for line in resp.iter_lines():
+                if cancel.is_set():
+                    raise CallCancelled()
+                if expired.is_set():
+                    raise DeadlineExceeded()
+                if not line or not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:"):].strip()
+                if data == b"[DONE]":
+                    break
+                if first:
+                    span.add_event("first_chunk")
+                    first = False
+                yield json.loads(data)
+        except (CallCancelled, DeadlineExceeded) as e:
+            tracing.fail(span, e)
+            raise
+        except Exception as e:
+            tracing.fail(span, e)
+            if cancel.is_set():
+                raise CallCancelled()
+            if expired.is_set() or (expires is not None and time.monotonic() >= expires):
+                raise DeadlineExceeded()
+            raise
+        finally:
+            done.set()
+            resp.close()
+            span.end()
 
 
 class GeminiProvider(LLMProvider):
     """Gemini API provider"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
         super().__init__(api_key or settings.GEMINI_API_KEY)
+        self.model = model or settings.GEMINI_MODEL
         if not self.api_key:
             raise ValueError("Gemini API key is required")
     
-    def call(self, system_prompt: str, user_prompt: str) -> str:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{settings.GEMINI_MODEL}:generateContent?key={self.api_key}"
-        
+    def _payload(self, system_prompt: str, user_prompt: str) -> dict:
         full_prompt = system_prompt.strip() + "\n\nUser prompt:\n" + user_prompt.strip()
         
-        payload = {
+        return {
             "contents": [
                 {
                     "parts": [
@@ -36,36 +294,135 @@ class GeminiProvider(LLMProvider):
                 }
             ]
         }
+    
+    def _generation_config(self, params: GenerationParams) -> dict:
+        """generationConfig of a call"""
+        config: dict[str, Any] = {}
+        if params.temperature is not None:
+            config["temperature"] = params.temperature
+        if params.stop:
+            config["stopSequences"] = list(params.stop[:5])
+        thinks = bool(_GEMINI_THINKING_RE.search(self.model))
+        budget = params.thinking_budget
+        if thinks and budget is not None:
+            # Pro cannot turn thinking off and Flash-Lite thinks at least 512 tokens once on
+            if "pro" in self.model and budget != -1:
+                budget = max(budget, 128)
+            elif "flash-lite" in self.model and 0 < budget < 512:
+                budget = 512
+            config["thinkingConfig"] = {"thinkingBudget": budget}
+        if params.max_output_tokens is not None:
+            if not thinks or budget is not None and budget >= 0:
+                # Thoughts count against maxOutputTokens; the cap is meant for the answer
+                config["maxOutputTokens"] = params.max_output_tokens + (max(budget, 0) if thinks else 0)
+            # With dynamic thinking the answer cannot be capped apart from the thoughts
+        return config
+    
+    def _record_usage(self, data: dict) -> None:
+        usage = data.get("usageMetadata", {})
+        self.last_usage = {
+            "prompt_tokens": usage.get("promptTokenCount", 0),
+            "completion_tokens": usage.get("candidatesTokenCount", 0) + usage.get("thoughtsTokenCount", 0),
+        }
+    
+    def call(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        cancel: Optional[threading.Event] = None,
+        timeout: Optional[float] = None,
+        params: Optional[GenerationParams] = None,
+    ) -> str:
+        base = f"{PROVIDER_HOSTS['gemini']}/v1beta/models/{self.model}"
+        payload = self._payload(system_prompt, user_prompt)
+        if params is not None:
+            config = self._generation_config(params)
+            if config:
+                payload["generationConfig"] = config
+        
+        if cancel is not None:
+            return self._call_streaming(f"{base}:streamGenerateContent?alt=sse&key={self.api_key}", payload, cancel, timeout)
         
-        resp = requests.post(
-            url,
-            json=payload,
-            timeout=(settings.CONNECT_TIMEOUT, settings.READ_TIMEOUT)
-        )
-        resp.raise_for_status()
-        data = resp.json()
+        data = self._post_json(f"{base}:generateContent?key={self.api_key}", payload, timeout=timeout)
+        self._record_usage(data)
         
         try:
             return data["candidates"][0]["content"]["parts"][0]["text"]
         except (KeyError, IndexError):
             raise ValueError(f"Unexpected Gemini response: {json.dumps(data, ensure_ascii=False, indent=2)}")
+    
+    def _call_streaming(self, url: str, payload: dict, cancel: threading.Event, timeout: Optional[float]) -> str:
+        parts: list[str] = []
+        self.last_partial_chars = 0
+        try:
+            for chunk in self._stream_events(url, payload, cancel, timeout=timeout):
+                for part in chunk.get("candidates", [{}])[0].get("content", {}).get("parts", []):
+                    if "text" in part and not part.get("thought"):
+                        parts.append(part["text"])
+                        self.last_partial_chars += len(part["text"])
+                if "usageMetadata" in chunk:
+                    self._record_usage(chunk)
+        except (KeyError, IndexError, AttributeError):
+            raise ValueError("Unexpected Gemini streaming response")
+        
+        if not parts:
+            raise ValueError("Empty Gemini response")
+        return "".join(parts)
 
 
-class GrokProvider(LLMProvider):
-    """Grok (xAI) API provider"""
+class ChatCompletionsProvider(LLMProvider):
+    """Provider for OpenAI-style /v1/chat/completions endpoints"""
     
-    def __init__(self, api_key: Optional[str] = None):
-        super().__init__(api_key or settings.XAI_API_KEY)
-        if not self.api_key:
-            raise ValueError("xAI API key is required")
+    name = "OpenAI-compatible"
     
-    def call(self, system_prompt: str, user_prompt: str) -> str:
-        url = "https://api.x.ai/v1/chat/completions"
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
+    def __init__(self, base_url: str, api_key: Optional[str] = None, model: Optional[str] = None):
+        super().__init__(api_key)
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+    
+    def _record_usage(self, data: dict) -> None:
+        usage = data.get("usage") or {}
+        self.last_usage = {
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
         }
+    
+    def _generation_fields(self, params: GenerationParams) -> dict:
+        """Request fields of a call's generation controls"""
+        fields: dict[str, Any] = {}
+        if params.max_output_tokens is not None:
+            fields["max_tokens"] = params.max_output_tokens
+        if params.temperature is not None:
+            fields["temperature"] = params.temperature
+        if params.stop:
+            fields["stop"] = list(params.stop[:4])
+        return fields
+    
+    def call(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        cancel: Optional[threading.Event] = None,
+        timeout: Optional[float] = None,
+        params: Optional[GenerationParams] = None,
+    ) -> str:
+        return self._complete(self.base_url, system_prompt, user_prompt, cancel, timeout, params)
+    
+    def _complete(
+        self,
+        base_url: str,
+        system_prompt: str,
+        user_prompt: str,
+        cancel: Optional[threading.Event],
+        timeout: Optional[float],
+        params: Optional[GenerationParams],
+    ) -> str:
+        """One completion against base_url (passed per call: the instance may serve several servers at once)"""
+        url = f"{base_url}/chat/completions"
+        
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
         
         messages = [
             {"role": "system", "content": system_prompt.strip()},
@@ -73,30 +430,263 @@ class GrokProvider(LLMProvider):
         ]
         
         payload = {
-            "model": settings.GROK_MODEL,
+            "model": self.model,
             "messages": messages
         }
+        if params is not None:
+            payload.update(self._generation_fields(params))
+        
+        if cancel is not None:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+            return self._call_streaming(url, payload, cancel, headers, timeout)
         
-        resp = requests.post(
-            url,
-            headers=headers,
-            json=payload,
-            timeout=(settings.CONNECT_TIMEOUT, settings.READ_TIMEOUT)
-        )
-        resp.raise_for_status()
-        data = resp.json()
+        data = self._post_json(url, payload, headers, timeout)
+        self._record_usage(data)
         
         try:
             return data["choices"][0]["message"]["content"]
         except (KeyError, IndexError):
-            raise ValueError(f"Unexpected Grok response: {json.dumps(data, ensure_ascii=False, indent=2)}")
+            raise ValueError(f"Unexpected {self.name} response: {json.dumps(data, ensure_ascii=False, indent=2)}")
+    
+    def _call_streaming(
+        self,
+        url: str,
+        payload: dict,
+        cancel: threading.Event,
+        headers: dict,
+        timeout: Optional[float],
+    ) -> str:
+        parts: list[str] = []
+        self.last_partial_chars = 0
+        for chunk in self._stream_events(url, payload, cancel, headers, timeout):
+            for choice in chunk.get("choices") or []:
+                text = (choice.get("delta") or {}).get("content")
+                if text:
+                    parts.append(text)
+                    self.last_partial_chars += len(text)
+            if chunk.get("usage"):
+                self._record_usage(chunk)
+        
+        if not parts:
+            raise ValueError(f"Empty {self.name} response")
+        return "".join(parts)
+
+
+class GrokProvider(ChatCompletionsProvider):
+    """Grok (xAI) API provider"""
+    
+    name = "Grok"
+    
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
+        super().__init__(f"{PROVIDER_HOSTS['grok']}/v1", api_key or settings.XAI_API_KEY, model or settings.GROK_MODEL)
+        if not self.api_key:
+            raise ValueError("xAI API key is required")
+    
+    def _generation_fields(self, params: GenerationParams) -> dict:
+        fields = super()._generation_fields(params)
+        if self.model.startswith("grok-4"):
+            # Always-on reasoning counts against max_tokens and takes no stop sequences
+            fields.pop("max_tokens", None)
+            fields.pop("stop", None)
+        elif "mini" in self.model and params.thinking_budget is not None and params.thinking_budget >= 0:
+            # grok-3-mini takes an effort level instead of a token budget
+            fields["reasoning_effort"] = "low" if params.thinking_budget <= 1024 else "high"
+        return fields
+
+
+class OpenAICompatProvider(ChatCompletionsProvider):
+    """
+    Self-hosted OpenAI-compatible server (vLLM, llama.cpp server, Ollama, ...).
+
+    Calls go to the configured server with the fewest calls in flight; each
+    server admits at most OPENAI_COMPAT_MAX_CONCURRENCY concurrent calls and
+    the rest wait for a slot (within the call's timeout).
+    """
+    
+    name = "OpenAI-compatible"
+    
+    def __init__(self, model: Optional[str] = None):
+        servers = openai_compat_servers()
+        if not servers:
+            raise ValueError("OPENAI_COMPAT_BASE_URLS is not configured")
+        super().__init__("", settings.OPENAI_COMPAT_API_KEY, model or settings.OPENAI_COMPAT_MODEL)
+        self.servers = servers
+    
+    def _generation_fields(self, params: GenerationParams) -> dict:
+        fields = super()._generation_fields(params)
+        if params.thinking_budget == 0 and settings.OPENAI_COMPAT_THINKING_SWITCH:
+            # Chat templates of thinking models (Qwen3, ...) on vLLM and llama.cpp server
+            fields["chat_template_kwargs"] = {"enable_thinking": False}
+        return fields
+    
+    def call(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        cancel: Optional[threading.Event] = None,
+        timeout: Optional[float] = None,
+        params: Optional[GenerationParams] = None,
+    ) -> str:
+        server = min(self.servers, key=lambda srv: srv.in_flight)
+        with server.slot(cancel, timeout) as remaining:
+            return self._complete(server.base_url, system_prompt, user_prompt, cancel, remaining, params)
+
+
+class _CompatServer:
+    """Concurrency cap and in-flight count of one self-hosted server"""
+    
+    def __init__(self, base_url: str, max_concurrency: int):
+        self.base_url = base_url.rstrip("/")
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def slot(self, cancel: Optional[threading.Event], timeout: Optional[float]):
+        """Hold a concurrency slot; yields the timeout left after waiting"""
+        start = time.monotonic()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            while not self._slots.acquire(timeout=0.1):
+                if cancel is not None and cancel.is_set():
+                    raise CallCancelled()
+                if timeout is not None and time.monotonic() - start >= timeout:
+                    raise DeadlineExceeded()
+            try:
+                yield None if timeout is None else timeout - (time.monotonic() - start)
+            finally:
+                self._slots.release()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
 
 
-def get_llm_provider(backend: str, gemini_key: Optional[str] = None, xai_key: Optional[str] = None) -> LLMProvider:
-    """Factory function to get LLM provider"""
+_compat_servers: Optional[list[_CompatServer]] = None
+
+
+def openai_compat_servers() -> list[_CompatServer]:
+    """Configured self-hosted servers, created on first use"""
+    global _compat_servers
+    if _compat_servers is None:
+        with _session_lock:
+            if _compat_servers is None:
+                _compat_servers = [
+                    _CompatServer(url.strip(), settings.OPENAI_COMPAT_MAX_CONCURRENCY)
+                    for url in settings.OPENAI_COMPAT_BASE_URLS.split(",")
+                    if url.strip()
+                ]
+    return _compat_servers
+
+
+def get_llm_provider(
+    backend: str,
+    gemini_key: Optional[str] = None,
+    xai_key: Optional[str] = None,
+    model: Optional[str] = None,
+) -> LLMProvider:
+    """
+    Factory function to get LLM provider. Requests without their own key are
+    routed through the pool of server-side keys; `model` overrides the
+    backend's default model.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    if backend == "openai_compat":
+        return OpenAICompatProvider(model)
+    
+    request_key = gemini_key if backend == "gemini" else xai_key
+    if not request_key:
+        from .provider_pool import PooledProvider, get_provider_pool
+        pool = get_provider_pool()
+        if pool.has_backend(backend):
+            return PooledProvider(pool, backend, model)
+    
     if backend == "gemini":
-        return GeminiProvider(gemini_key)
-    elif backend == "grok":
-        return GrokProvider(xai_key)
+        return GeminiProvider(gemini_key, model)
+    return GrokProvider(xai_key, model)
+
+
+def parse_stage_models(spec: Union[str, dict[str, str], None]) -> dict[str, tuple[Optional[str], str]]:
+    """
+    Parse a per-stage model mapping into {stage: (backend or None, model)}.
+    Accepts "stage=[backend:]model,..." or a dict of stage -> "[backend:]model".
+    """
+    if not spec:
+        return {}
+    if isinstance(spec, str):
+        items = []
+        for pair in spec.split(","):
+            if pair.strip():
+                stage, sep, target = pair.partition("=")
+                if not sep:
+                    raise ValueError(f"Invalid stage model mapping: {pair.strip()!r}")
+                items.append((stage, target))
     else:
-        raise ValueError(f"Unknown backend: {backend}")
+        items = list(spec.items())
+    
+    parsed = {}
+    for stage, target in items:
+        stage, target = stage.strip(), target.strip()
+        if stage not in PIPELINE_STAGES:
+            raise ValueError(f"Unknown pipeline stage: {stage}")
+        backend, sep, model = target.partition(":")
+        if not sep:
+            backend, model = None, target
+        elif backend not in BACKENDS:
+            raise ValueError(f"Unknown backend for stage {stage}: {backend}")
+        parsed[stage] = (backend, model)
+    return parsed
+
+
+GENERATION_FIELDS: dict[str, Callable[[str], Any]] = {
+    "max_output_tokens": int,
+    "temperature": float,
+    "stop": lambda value: tuple(seq for seq in value.split("|") if seq),
+    "thinking_budget": int,
+}
+
+
+def parse_stage_values(spec: str, convert: Callable[[str], Any]) -> dict[str, Any]:
+    """Parse "stage=value,..." ("*" for every stage) into {stage: converted value}"""
+    parsed = {}
+    for pair in spec.split(","):
+        if not pair.strip():
+            continue
+        stage, sep, value = pair.partition("=")
+        stage = stage.strip()
+        if not sep:
+            raise ValueError(f"Invalid stage value: {pair.strip()!r}")
+        if stage != "*" and stage not in PIPELINE_STAGES:
+            raise ValueError(f"Unknown pipeline stage: {stage}")
+        parsed[stage] = convert(value.strip())
+    return parsed
+
+
+def stage_generation(overrides: Optional[dict[str, dict]] = None) -> dict[str, GenerationParams]:
+    """
+    Generation params of every pipeline stage: the STAGE_* settings, then the
+    request's overrides, each keyed by stage or "*" (a stage's own entry wins).
+    """
+    configured = {
+        "max_output_tokens": settings.STAGE_MAX_OUTPUT_TOKENS,
+        "temperature": settings.STAGE_TEMPERATURE,
+        "stop": settings.STAGE_STOP_SEQUENCES,
+        "thinking_budget": settings.STAGE_THINKING_BUDGET,
+    }
+    by_field = {name: parse_stage_values(configured[name], convert) for name, convert in GENERATION_FIELDS.items()}
+    overrides = overrides or {}
+    for key in overrides:
+        if key != "*" and key not in PIPELINE_STAGES:
+            raise ValueError(f"Unknown pipeline stage: {key}")
+    
+    result = {}
+    for stage in PIPELINE_STAGES:
+        values = {name: values.get(stage, values.get("*")) for name, values in by_field.items()}
+        for key in ("*", stage):
+            values.update({name: value for name, value in (overrides.get(key) or {}).items() if value is not None})
+        if values["stop"] is not None:
+            values["stop"] = tuple(values["stop"]) or None
+        result[stage] = GenerationParams(**values)
+    return result
@@ -0,0 +1,69 @@
+"""
+Process-wide counters exposed at /api/metrics.
+"""
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    """Thread-safe named counters and per-stage/model call statistics"""
+
+    def __init__(self):
+        self._counters: defaultdict[str, float] = defaultdict(float)
+        self._stages: defaultdict[tuple[str, str], list[float]] = defaultdict(lambda: [0, 0.0, 0, 0])
+        self._timings: defaultdict[str, list[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def observe_stage(self, stage: str, model: str, seconds: float, prompt_tokens: int, completion_tokens: int) -> None:
+        """Accumulate one LLM call of a pipeline stage on a given model"""
+        with self._lock:
+            entry = self._stages[(stage, model)]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += prompt_tokens
+            entry[3] += completion_tokens
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Accumulate a named duration (count, total, max)"""
+        with self._lock:
+            entry = self._timings[name]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def timing_stats(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                name: {"count": count, "avg_ms": round(total / count * 1000, 2), "max_ms": round(peak * 1000, 2)}
+                for name, (count, total, peak) in sorted(self._timings.items())
+            }
+
+    def stage_stats(self) -> list[dict]:
+        with self._lock:
+            return [
+                {
+                    "stage": stage,
+                    "model": model,
+                    "calls": calls,
+                    "avg_seconds": round(seconds / calls, 4),
+                    "avg_prompt_tokens": round(prompt_tokens / calls, 1),
+                    "avg_completion_tokens": round(completion_tokens / calls, 1),
+                }
+                for (stage, model), (calls, seconds, prompt_tokens, completion_tokens) in sorted(self._stages.items())
+            ]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        return {**counters, "stages": self.stage_stats(), "timings": self.timing_stats()}
+
+
+metrics = Metrics()
@@ -0,0 +1,208 @@
+"""
+Micro-batching of short JSON-output stage calls (smart_queue, pairwise_eval).
+
+Concurrent calls of the same stage on the same provider configuration are
+collected for up to MICRO_BATCH_WINDOW_MS (or MICRO_BATCH_MAX_ITEMS) and
+sent as one request whose prompt lists every item and asks for a JSON array
+of results. The first caller of a window hands the batch to a sender thread;
+results are split back to the waiting callers. Every caller, the first one
+included, waits with its own deadline and cancel event; the combined request
+gets the latest deadline of its items and is aborted only once all of them
+have given up. If the combined answer cannot be split, every item falls back
+to its own call.
+"""
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional
+
+from ..config import settings
+from ..services.llm_provider import CallCancelled, DeadlineExceeded, GenerationParams, LLMProvider
+from ..services.metrics import metrics
+from ..utils.json_parser import safe_json_array_from_llm
+
+
+# Only stages whose output is a single JSON object can be batched
+BATCHABLE_STAGES = ("smart_queue", "pairwise_eval")
+
+BATCH_INSTRUCTIONS = """
+
+BATCH MODE:
+You will receive {n} independent inputs, marked "### ITEM 1" to "### ITEM {n}".
+Apply the task above to each of them separately.
+Respond ONLY with a JSON array of exactly {n} results, in item order, each
+being the JSON object described above. No code fences, no extra text.
+"""
+
+
+def batch_key(stage: str, provider: LLMProvider, params: Optional[GenerationParams] = None) -> tuple:
+    """Calls can share a batch only when they would hit the same endpoint and model with the same params"""
+    return (
+        stage,
+        params,
+        type(provider).__name__,
+        getattr(provider, "backend", None),
+        getattr(provider, "base_url", None),
+        provider.model,
+        provider.api_key,
+    )
+
+
+class _Item:
+    """One caller's call in a batch"""
+
+    def __init__(self, prompt: str, provider: LLMProvider, cancel: Optional[threading.Event], timeout: Optional[float]):
+        self.prompt = prompt
+        self.provider = provider
+        self.cancel = cancel
+        self.expires = time.monotonic() + timeout if timeout is not None else None
+        self.future: Future = Future()
+        self.abandoned = False
+
+    def remaining(self) -> Optional[float]:
+        return None if self.expires is None else max(self.expires - time.monotonic(), 0.001)
+
+
+class _Batch:
+    def __init__(self, provider: LLMProvider, system_prompt: str, params: Optional[GenerationParams]):
+        self.provider = provider
+        self.system_prompt = system_prompt
+        self.params = params
+        self.items: list[_Item] = []
+        self.full = threading.Event()
+        # Set once every caller has given up, which aborts the combined request
+        self.cancel = threading.Event()
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        """No more items join; abort right away if every caller already left"""
+        with self._lock:
+            self.closed = True
+            if all(item.abandoned for item in self.items):
+                self.cancel.set()
+
+    def abandon(self, item: _Item) -> None:
+        """A caller stopped waiting (cancelled or out of time)"""
+        with self._lock:
+            item.abandoned = True
+            if self.closed and all(i.abandoned for i in self.items):
+                self.cancel.set()
+
+    def remaining(self) -> Optional[float]:
+        """Time left until the last caller's deadline (None if any has none)"""
+        left = [item.remaining() for item in self.items]
+        return None if None in left else max(left)
+
+
+class MicroBatcher:
+    """Collects concurrent same-stage calls into combined provider requests"""
+
+    def __init__(self, window_ms: int, max_items: int, fallback_workers: int = 8):
+        self.window = window_ms / 1000
+        self.max_items = max_items
+        self._open: dict[tuple, _Batch] = {}
+        self._lock = threading.Lock()
+        self._sender = ThreadPoolExecutor(max_workers=fallback_workers, thread_name_prefix="batch-sender")
+        self._fallback = ThreadPoolExecutor(max_workers=fallback_workers, thread_name_prefix="batch-fallback")
+
+    def call(
+        self,
+        stage: str,
+        provider: LLMProvider,
+        system_prompt: str,
+        user_prompt: str,
+        cancel: Optional[threading.Event] = None,
+        timeout: Optional[float] = None,
+        params: Optional[GenerationParams] = None,
+    ) -> tuple[str, dict]:
+        """Run one call through a batch; returns (raw text, this item's token usage)"""
+        key = batch_key(stage, provider, params)
+        item = _Item(user_prompt, provider, cancel, timeout)
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch(provider, system_prompt, params)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_items:
+                del self._open[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            batch.close()
+            self._sender.submit(self._send, batch)
+
+        return self._wait(batch, item)
+
+    @staticmethod
+    def _wait(batch: _Batch, item: _Item) -> tuple[str, dict]:
+        while True:
+            try:
+                return item.future.result(timeout=0.05)
+            except FutureTimeout:
+                if item.cancel is not None and item.cancel.is_set():
+                    batch.abandon(item)
+                    raise CallCancelled()
+                if item.expires is not None and time.monotonic() >= item.expires:
+                    batch.abandon(item)
+                    raise DeadlineExceeded()
+
+    @staticmethod
+    def _single(system_prompt: str, item: _Item, params: Optional[GenerationParams] = None) -> None:
+        try:
+            text = item.provider.call(system_prompt, item.prompt, cancel=item.cancel, timeout=item.remaining(), params=params)
+            item.future.set_result((text, item.provider.last_usage or {}))
+        except Exception as e:
+            item.future.set_exception(e)
+
+    def _send(self, batch: _Batch) -> None:
+        """Send a closed batch and resolve its futures (runs on a sender thread)"""
+        items = batch.items
+        if len(items) == 1:
+            self._single(batch.system_prompt, items[0], batch.params)
+            return
+
+        system = batch.system_prompt + BATCH_INSTRUCTIONS.format(n=len(items))
+        user = "\n\n".join(f"### ITEM {i}\n{item.prompt.strip()}" for i, item in enumerate(items, 1))
+        try:
+            # The output cap is per item
+            params = batch.params.scaled(len(items)) if batch.params is not None else None
+            raw = batch.provider.call(system, user, cancel=batch.cancel, timeout=batch.remaining(), params=params)
+        except Exception as e:
+            for item in items:
+                item.future.set_exception(e)
+            return
+
+        results = safe_json_array_from_llm(raw)
+        if results is None or len(results) != len(items) or not all(isinstance(r, dict) for r in results):
+            # Could not split the combined answer: give every item its own call
+            metrics.incr("micro_batch_fallbacks")
+            # Each caller's own provider is idle while it waits, so it can make the call
+            for item in items:
+                if not item.abandoned:
+                    self._fallback.submit(self._single, batch.system_prompt, item, batch.params)
+            return
+
+        metrics.incr("micro_batch_requests")
+        metrics.incr("micro_batched_calls", len(items))
+        usage = batch.provider.last_usage or {}
+        share = {k: v // len(items) for k, v in usage.items()}
+        for result, item in zip(results, items):
+            item.future.set_result((json.dumps(result, ensure_ascii=False), share))
+
+
+micro_batcher = MicroBatcher(settings.MICRO_BATCH_WINDOW_MS, settings.MICRO_BATCH_MAX_ITEMS)
+
+
+def batched_stages() -> set[str]:
+    """Stages configured for micro-batching (empty when disabled)"""
+    if not settings.MICRO_BATCH_ENABLED:
+        return set()
+    stages = {s.strip() for s in settings.MICRO_BATCH_STAGES.split(",") if s.strip()}
+    return stages & set(BATCHABLE_STAGES)
@@ -1,23 +1,195 @@
 import textwrap
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
-from ..models.schemas import (
-    SmartQueueResult,
-    PCVResult,
-    DSIteration,
-    PairwiseEvaluation,
+from ..models.results import (
+    SmartQueueData,
+    PCVData,
+    DSIterationData,
+    EvaluationData,
 )
-from ..services.llm_provider import LLMProvider
+from ..services.llm_provider import CallCancelled, DeadlineExceeded, GenerationParams, LLMProvider
+from ..services.metrics import metrics
+from ..services.micro_batcher import batched_stages, micro_batcher
+from ..services.priority import scheduler
+from ..services.triage import triage_classifier
+from ..services import tracing
+from ..config import settings
 from ..utils.json_parser import safe_json_from_llm, approximate_length
 
 
+# Focus directives of the fan-out D/S strategy (DS_FANOUT_FOCUSES picks from these)
+DS_FOCUSES = {
+    "edge_cases": "edge cases, unusual inputs and how to handle failures",
+    "constraints": "explicit constraints and requirements: scope, length, tone, what to avoid",
+    "examples": "short illustrative examples of inputs and expected outputs",
+    "output_format": "the exact format and structure of the expected output",
+}
+
+
+# Axes of the pairwise_eval verdict; a reply missing any of them is not a verdict
+EVAL_AXES = ("clarity", "structure", "constraints", "usefulness")
+
+
+class EvaluationError(ValueError):
+    """The judge's pairwise_eval reply is not a complete verdict (e.g. cut off at the output cap)"""
+
+
+def parse_focuses(spec: str) -> list[str]:
+    """Parse "edge_cases,examples" into a list of DS_FOCUSES keys"""
+    focuses = [name.strip() for name in spec.split(",") if name.strip()]
+    unknown = [name for name in focuses if name not in DS_FOCUSES]
+    if unknown or not focuses:
+        raise ValueError(f"Invalid D/S focuses {spec!r}; expected some of {', '.join(DS_FOCUSES)}")
+    return focuses
+
+
+def join_expansions(expansions: dict[str, str]) -> str:
+    """Fan-out D outputs as one text, as recorded in a D/S iteration"""
+    return "\n\n".join(f"### FOCUS: {focus}\n{text}" for focus, text in expansions.items())
+
+
 class PromptOptimizer:
     """Main service for prompt optimization pipeline"""
     
-    def __init__(self, provider: LLMProvider):
+    def __init__(
+        self,
+        provider: LLMProvider,
+        cancel_event: Optional[threading.Event] = None,
+        deadline: Optional[float] = None,
+        stage_providers: Optional[dict[str, LLMProvider]] = None,
+        priority: str = "standard",
+        generation: Optional[dict[str, GenerationParams]] = None,
+    ):
         self.provider = provider
+        self.priority = priority
+        self.generation = generation or {}
+        self.stage_providers = stage_providers or {}
+        self.cancel_event = cancel_event
+        self.deadline = deadline  # time.monotonic() timestamp
+        self.stage_metrics: list[dict] = []
+        self.aborted_calls = 0
+        self.trace_parent = None  # the run's root span, when traced
+    
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline, or None without one"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+    
+    def has_time_for(self, calls: int) -> bool:
+        """Whether `calls` more calls are expected to fit before the deadline"""
+        remaining = self.remaining()
+        if remaining is None:
+            return True
+        timed = [m["seconds"] for m in self.stage_metrics if m["stage"] != "smart_queue"]
+        if not timed:
+            return remaining > 0
+        return remaining >= calls * sum(timed) / len(timed)
+    
+    def detached(self) -> "PromptOptimizer":
+        """Optimizer on the same provider without the run's deadline or cancel event"""
+        return PromptOptimizer(
+            self.provider, stage_providers=self.stage_providers, priority=self.priority, generation=self.generation
+        )
+    
+    def _call(self, stage: str, system_prompt: str, user_prompt: str) -> str:
+        """
+        Call the provider for a pipeline stage (the stage's tier if one is
+        configured, with the stage's generation params), recording model,
+        latency and token usage.
+        """
+        provider = self.stage_providers.get(stage, self.provider)
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise CallCancelled()
+        if self.deadline is not None and self.remaining() <= 0:
+            raise DeadlineExceeded(stage)
+        
+        batched = stage in batched_stages()
+        with tracing.span(
+            f"stage.{stage}",
+            parent=self.trace_parent,
+            **{
+                "llm.stage": stage,
+                "llm.backend": getattr(provider, "backend", None) or getattr(provider, "name", None) or type(provider).__name__,
+                "llm.batched": batched,
+                "llm.prompt_chars": len(system_prompt) + len(user_prompt),
+                "run.priority": self.priority,
+            },
+        ) as span:
+            try:
+                # Waiting for an upstream slot of the run's class counts against the deadline
+                with scheduler.call_slot(self.priority, self.cancel_event, self.remaining()) as waited:
+                    span.set_attribute("queue.wait_ms", round(waited * 1000, 2))
+                    kwargs = {}
+                    if self.cancel_event is not None:
+                        kwargs["cancel"] = self.cancel_event
+                    if self.deadline is not None:
+                        kwargs["timeout"] = max(self.remaining(), 0.001)
+                    if stage in self.generation:
+                        kwargs["params"] = self.generation[stage]
+                    start = time.perf_counter()
+                    if batched:
+                        result, usage = micro_batcher.call(stage, provider, system_prompt, user_prompt, **kwargs)
+                    else:
+                        result = provider.call(system_prompt, user_prompt, **kwargs)
+                        usage = provider.last_usage or {}
+            except CallCancelled:
+                self.aborted_calls += 1
+                raise
+            except DeadlineExceeded:
+                raise DeadlineExceeded(stage)
+            seconds = time.perf_counter() - start
+            model = getattr(provider, "last_model", None) or provider.model or ""
+            span.set_attributes({
+                "llm.model": model,
+                "llm.prompt_tokens": usage.get("prompt_tokens", 0),
+                "llm.completion_tokens": usage.get("completion_tokens", 0),
+                "llm.output_chars": len(result),
+            })
+        self.stage_metrics.append({
+            "stage": stage,
+            "model": model,
+            "seconds": round(seconds, 4),
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+        })
+        metrics.observe_stage(stage, model, seconds, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        return result
+    
+    def _parse_json(self, stage: str, raw: str) -> Optional[dict]:
+        """Parse a JSON-output stage's answer, traced as its own span"""
+        with tracing.span("json.parse", parent=self.trace_parent, **{"llm.stage": stage, "json.chars": len(raw)}) as span:
+            data = safe_json_from_llm(raw)
+            span.set_attribute("json.parsed", data is not None)
+        return data
     
-    def smart_queue(self, prompt: str) -> SmartQueueResult:
-        """Analyze prompt quality and decide if optimization is needed"""
+    def token_usage(self) -> dict[str, int]:
+        """Total token usage across all recorded stages"""
+        return {
+            "prompt_tokens": sum(m["prompt_tokens"] for m in self.stage_metrics),
+            "completion_tokens": sum(m["completion_tokens"] for m in self.stage_metrics),
+        }
+    
+    def smart_queue(self, prompt: str) -> SmartQueueData:
+        """
+        Analyze prompt quality and decide if optimization is needed.
+
+        Depending on SMART_QUEUE_MODE the local triage model answers alone
+        ("local"), escalates to the LLM only when its confidence is below
+        TRIAGE_CONFIDENCE_THRESHOLD ("hybrid"), or is skipped ("llm").
+        """
+        mode = settings.SMART_QUEUE_MODE
+        if mode in ("local", "hybrid"):
+            triage = triage_classifier.score(prompt)
+            if mode == "local" or triage.confidence >= settings.TRIAGE_CONFIDENCE_THRESHOLD:
+                return triage.result
+        
+        return self.llm_smart_queue(prompt)
+    
+    def llm_smart_queue(self, prompt: str) -> SmartQueueData:
+        """Ask the LLM to score prompt quality"""
         system = textwrap.dedent(
             """
             You are a prompt quality analyzer.
@@ -42,8 +214,8 @@ class PromptOptimizer:
             """
         )
         
-        raw = self.provider.call(system, prompt)
-        data = safe_json_from_llm(raw)
+        raw = self._call("smart_queue", system, prompt)
+        data = self._parse_json("smart_queue", raw)
         
         if data is None:
             data = {
@@ -54,7 +226,7 @@ class PromptOptimizer:
                 "comment": f"[parser failed, model said]: {str(raw)[:400]}",
             }
         
-        return SmartQueueResult(
+        return SmartQueueData(
             clarity=data.get("clarity", 0.5),
             structure=data.get("structure", 0.5),
             constraints=data.get("constraints", 0.5),
@@ -75,7 +247,7 @@ class PromptOptimizer:
             - Do NOT answer the task, only rewrite the prompt.
             """
         )
-        return self.provider.call(system, prompt)
+        return self._call("proposer", system, prompt)
     
     def critic_step(self, proposed_prompt: str) -> str:
         """Analyze proposed prompt and suggest improvements (Critic phase)"""
@@ -97,7 +269,7 @@ class PromptOptimizer:
             - Write in English.
             """
         )
-        return self.provider.call(system, proposed_prompt)
+        return self._call("critic", system, proposed_prompt)
     
     def verifier_step(self, original_prompt: str, proposed_prompt: str, critique: str) -> str:
         """Create final verified prompt (Verifier phase)"""
@@ -135,22 +307,22 @@ class PromptOptimizer:
             """
         )
         
-        return self.provider.call(system, user)
+        return self._call("verifier", system, user)
     
-    def run_pcv(self, prompt: str) -> PCVResult:
+    def run_pcv(self, prompt: str) -> PCVData:
         """Run full Proposer-Critic-Verifier cycle"""
         proposed = self.proposer_step(prompt)
         critique = self.critic_step(proposed)
         final = self.verifier_step(prompt, proposed, critique)
         
-        return PCVResult(
+        return PCVData(
             proposed_prompt=proposed,
             critique=critique,
             final_prompt=final
         )
     
-    def d_block(self, prompt: str) -> str:
-        """Diversification step - expand the prompt"""
+    def d_block(self, prompt: str, focus: Optional[str] = None) -> str:
+        """Diversification step - expand the prompt (only along one DS_FOCUSES direction if given)"""
         system = textwrap.dedent(
             """
             You are in the DIVERSIFICATION (D) phase of a D/S cycle.
@@ -166,7 +338,15 @@ class PromptOptimizer:
             - Output ONLY the expanded prompt text.
             """
         )
-        return self.provider.call(system, prompt)
+        if focus is not None:
+            system += f"\nFocus ONLY on: {DS_FOCUSES[focus]}. Leave everything else as it is.\n"
+        return self._call("d_block", system, prompt)
+    
+    def fanout_d(self, prompt: str, focuses: list[str]) -> dict[str, str]:
+        """Concurrent D steps, one per focus directive"""
+        with ThreadPoolExecutor(max_workers=len(focuses), thread_name_prefix="ds-fanout") as pool:
+            futures = {focus: pool.submit(self.d_block, prompt, focus) for focus in focuses}
+            return {focus: future.result() for focus, future in futures.items()}
     
     def s_block(self, prompt: str) -> str:
         """Stabilization step - refine and consolidate"""
@@ -185,20 +365,108 @@ class PromptOptimizer:
             - Return ONLY the stabilized prompt text.
             """
         )
-        return self.provider.call(system, prompt)
+        return self._call("s_block", system, prompt)
     
+    def s_merge(self, prompt: str, expansions: dict[str, str]) -> str:
+        """Stabilization step that merges fan-out expansions of the same prompt"""
+        system = textwrap.dedent(
+            """
+            You are in the STABILIZATION (S) phase of a D/S cycle.
+
+            Task:
+            - You receive a PROMPT and several EXPANSIONS of it, each adding detail
+              along one focus (edge cases, constraints, examples, output format).
+            - Merge the useful additions of all expansions into the prompt:
+              - Remove redundancy and contradictions
+              - Improve coherence
+              - Ensure clarity
+              - Keep all important details
+
+            Output:
+            - Return ONLY the merged, stabilized prompt text.
+            """
+        )
+        
+        user = f"PROMPT:\n{prompt}\n\nEXPANSIONS:\n{join_expansions(expansions)}\n"
+        
+        return self._call("s_block", system, user)
+    
+    def warm_start(self, prompt: str, similar_original: str, similar_final: str) -> str:
+        """Stabilization step that adapts the optimized version of a near-duplicate prompt"""
+        system = textwrap.dedent(
+            """
+            You are in the STABILIZATION (S) phase of a D/S cycle.
+
+            Task:
+            - You receive a NEW prompt, a PREVIOUS prompt that is nearly identical to it,
+              and the already optimized version of the PREVIOUS prompt.
+            - Adapt the optimized version so it matches the NEW prompt exactly:
+              names, numbers, entities and any other details that differ.
+            - Keep the structure, constraints and output format of the optimized version.
+
+            Output:
+            - Return ONLY the adapted prompt text.
+            """
+        )
+        
+        user = textwrap.dedent(
+            f"""
+            NEW PROMPT:
+            {prompt}
+
+            PREVIOUS PROMPT:
+            {similar_original}
+
+            OPTIMIZED PREVIOUS PROMPT:
+            {similar_final}
+            """
+        )
+        
+        return self._call("warm_start", system, user)
+
+    def section_step(
+        self,
+        section: str,
+        outline: str,
+        previous: Optional[str] = None,
+        previous_optimized: Optional[str] = None,
+    ) -> str:
+        """Optimize one section of a longer prompt, adapting its previous optimized version if given"""
+        system = textwrap.dedent(
+            """
+            You are optimizing ONE SECTION of a longer LLM prompt.
+
+            Task:
+            - Rewrite the SECTION into a clearer, more structured instruction.
+            - Preserve its intent and keep its heading, if it has one.
+            - Stay within the section: the OUTLINE lists all sections of the prompt,
+              do not repeat what the other sections cover.
+            - If a PREVIOUS version of the section and its OPTIMIZED version are given,
+              adapt the optimized version to the changes instead of starting over.
+
+            Output:
+            - Return ONLY the optimized section text.
+            """
+        )
+
+        user = f"OUTLINE:\n{outline}\n\nSECTION:\n{section}\n"
+        if previous is not None:
+            user += f"\nPREVIOUS SECTION:\n{previous}\n\nOPTIMIZED PREVIOUS SECTION:\n{previous_optimized}\n"
+
+        return self._call("section", system, user)
+
     def run_ds_cycle(
         self,
         initial_prompt: str,
         max_iterations: int = 3,
         convergence_threshold: float = 0.05
-    ) -> tuple[str, list[DSIteration], bool, Optional[int]]:
+    ) -> tuple[str, list[DSIterationData], bool, Optional[int]]:
         """
         Run D/S (Diversification/Stabilization) cycle
         
         Returns:
             - final_prompt: str
-            - iterations: list of DSIteration
+            - iterations: list of DSIterationData
             - converged: bool
             - convergence_iteration: Optional[int]
         """
@@ -217,7 +485,7 @@ class PromptOptimizer:
             change_rate = abs(cur_len - prev_len) / max(prev_len, 1)
             
             iterations.append(
-                DSIteration(
+                DSIterationData(
                     iteration=i,
                     d_block_output=d_out,
                     s_block_output=s_out,
@@ -235,7 +503,7 @@ class PromptOptimizer:
         
         return current, iterations, converged, convergence_iteration
     
-    def pairwise_eval(self, original_prompt: str, final_prompt: str) -> PairwiseEvaluation:
+    def pairwise_eval(self, original_prompt: str, final_prompt: str) -> EvaluationData:
         """Compare original vs final prompt"""
         system = textwrap.dedent(
             """
@@ -262,8 +530,9 @@ class PromptOptimizer:
               "structure": 0.66,
               "constraints": 0.33,
               "usefulness": 1.0,
-              "comment": "short English explanation"
+              "comment": "one short English sentence"
             }
+            Keep "comment" to a single sentence of at most 25 words.
             """
         )
         
@@ -277,22 +546,18 @@ class PromptOptimizer:
             """
         )
         
-        raw = self.provider.call(system, user)
-        data = safe_json_from_llm(raw)
+        raw = self._call("pairwise_eval", system, user)
+        data = self._parse_json("pairwise_eval", raw)
         
-        if data is None:
-            data = {
-                "clarity": 0.0,
-                "structure": 0.0,
-                "constraints": 0.0,
-                "usefulness": 0.0,
-                "comment": f"[parser failed, model said]: {str(raw)[:400]}",
-            }
+        # A truncated or malformed reply is an evaluation error, not a tie
+        if not isinstance(data, dict) or not all(isinstance(data.get(axis), (int, float)) for axis in EVAL_AXES):
+            metrics.incr("evaluation_parse_errors")
+            raise EvaluationError(f"Unreadable pairwise_eval reply: {str(raw)[:400]}")
         
-        return PairwiseEvaluation(
-            clarity=data.get("clarity", 0.0),
-            structure=data.get("structure", 0.0),
-            constraints=data.get("constraints", 0.0),
-            usefulness=data.get("usefulness", 0.0),
-            comment=data.get("comment", "")
+        return EvaluationData(
+            clarity=data["clarity"],
+            structure=data["structure"],
+            constraints=data["constraints"],
+            usefulness=data["usefulness"],
+            comment=str(data.get("comment", ""))
         )
@@ -0,0 +1,688 @@
+"""
+Optimization pipeline shared by the HTTP, SSE and WebSocket endpoints.
+"""
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from typing import AsyncIterator, Iterator, Optional
+
+from starlette.concurrency import iterate_in_threadpool
+
+from ..config import settings
+from ..models.results import EvaluationData, SmartQueueData, as_dict
+from ..models.schemas import OptimizeRequest
+from ..services.checkpoints import RunCheckpoint
+from ..services.dedup_cache import dedup_cache, DedupHit, same_prompt
+from ..services.evaluation_store import evaluation_store
+from ..services.history import history_store
+from ..services.incremental import (
+    SectionPlan,
+    base_sections,
+    join_sections,
+    load_base,
+    outline,
+    plan_sections,
+    split_sections,
+    summary,
+)
+from ..services.llm_provider import (
+    CallCancelled,
+    DeadlineExceeded,
+    GenerationParams,
+    LLMProvider,
+    get_llm_provider,
+    parse_stage_models,
+    stage_generation,
+)
+from ..services.metrics import metrics
+from ..services.optimizer import EvaluationError, PromptOptimizer, join_expansions, parse_focuses
+from ..services.priority import RunAdmission, scheduler
+from ..services import tracing
+from ..services.triage import triage_classifier
+from ..utils.json_parser import approximate_length
+
+
+class PipelineCancelled(Exception):
+    """Raised inside a run when its RunControl was cancelled"""
+
+
+class RunControl:
+    """Thread-safe handle for steering a run from outside the worker thread"""
+
+    def __init__(self, max_iterations: int):
+        self.max_iterations = max_iterations
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def cancel_event(self) -> threading.Event:
+        """Event handed to the provider so an in-flight call can be aborted"""
+        return self._cancelled
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def check(self) -> None:
+        """Stop the run at the next stage boundary if it was cancelled"""
+        if self._cancelled.is_set():
+            raise PipelineCancelled()
+
+
+def stage_providers(request: OptimizeRequest) -> dict[str, LLMProvider]:
+    """Providers for stages tiered by STAGE_MODELS, overridden per request"""
+    tiers = {**parse_stage_models(settings.STAGE_MODELS), **parse_stage_models(request.stage_models)}
+    return {
+        stage: get_llm_provider(
+            backend=backend or request.backend,
+            gemini_key=request.gemini_api_key,
+            xai_key=request.xai_api_key,
+            model=model,
+        )
+        for stage, (backend, model) in tiers.items()
+    }
+
+
+def generation_params(request: OptimizeRequest) -> dict[str, GenerationParams]:
+    """Generation params per stage from the STAGE_* settings, overridden per request"""
+    overrides = {key: config.dict(exclude_none=True) for key, config in (request.generation or {}).items()}
+    return stage_generation(overrides)
+
+
+def default_model(backend: str) -> str:
+    """Model a backend uses when no stage tier overrides it"""
+    return {
+        "gemini": settings.GEMINI_MODEL,
+        "grok": settings.GROK_MODEL,
+        "openai_compat": settings.OPENAI_COMPAT_MODEL,
+    }[backend]
+
+
+def evaluation_sample_rate(request: OptimizeRequest) -> float:
+    """Per-request sample rate, falling back to the server default"""
+    if request.evaluation_sample_rate is not None:
+        return request.evaluation_sample_rate
+    return settings.EVALUATION_SAMPLE_RATE
+
+
+def record_history(
+    run_id: str,
+    request: OptimizeRequest,
+    optimizer: PromptOptimizer,
+    final_prompt: str,
+    stages: dict,
+    evaluation,
+    converged: bool,
+    iterations: int,
+    processing_time: float,
+) -> None:
+    """Queue a finished run for the history store (never blocks the request)"""
+    if not settings.HISTORY_ENABLED:
+        return
+    history_store.record({
+        "run_id": run_id,
+        "tenant": history_tenant(request),
+        "backend": request.backend,
+        "model": default_model(request.backend),
+        "params": request.dict(exclude={"prompt", "gemini_api_key", "xai_api_key"}),
+        "original_prompt": request.prompt,
+        "final_prompt": final_prompt,
+        "stages": {**stages, "timings": optimizer.stage_metrics},
+        "evaluation": as_dict(evaluation),
+        "converged": converged,
+        "iterations": iterations,
+        "original_length": approximate_length(request.prompt),
+        "final_length": approximate_length(final_prompt),
+        "processing_time": processing_time,
+        "token_usage": optimizer.token_usage(),
+    })
+
+
+# Near-duplicate modes from least to most reuse; a request can only step down
+REUSE_MODES = ("off", "warm_start", "reuse")
+
+
+def key_tenant(api_key: str) -> str:
+    """Tenant id of an API key: a short hash, so the key itself is never stored"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def own_key_tenant(request: OptimizeRequest) -> Optional[str]:
+    """Tenant of a request that brings its own API key, else None"""
+    key = {"gemini": request.gemini_api_key, "grok": request.xai_api_key}.get(request.backend)
+    return key_tenant(key) if key else None
+
+
+def history_tenant(request: OptimizeRequest) -> str:
+    """
+    Owner recorded with a run in history: the hash of its own API key, or
+    "server" for runs on server-side keys (listed only to the admin).
+    """
+    return own_key_tenant(request) or "server"
+
+
+def dedup_tenant(request: OptimizeRequest) -> Optional[str]:
+    """
+    Partition of the near-duplicate cache a request may read and write: a
+    hash of its own API key. Runs on server-side keys get the shared
+    partition only with DEDUP_SHARE_SERVER_KEY_RUNS, else none.
+    """
+    tenant = own_key_tenant(request)
+    if tenant:
+        return tenant
+    return "server" if settings.DEDUP_SHARE_SERVER_KEY_RUNS else None
+
+
+def lookup_similar(request: OptimizeRequest) -> tuple[Optional[DedupHit], str]:
+    """
+    Find a previously optimized near-duplicate prompt of the same tenant, if
+    reuse is enabled. A verbatim reuse needs the same prompt up to case and
+    whitespace; other near-duplicates are only a warm start.
+    """
+    mode = settings.DEDUP_MODE if settings.DEDUP_MODE in REUSE_MODES else "off"
+    if request.similarity_reuse is not None:
+        mode = min(mode, request.similarity_reuse, key=REUSE_MODES.index)
+    tenant = dedup_tenant(request)
+    if not settings.DEDUP_ENABLED or mode == "off" or tenant is None:
+        return None, "off"
+    hit = dedup_cache.lookup(request.prompt, tenant)
+    if hit is not None and mode == "reuse" and not same_prompt(request.prompt, hit.original_prompt):
+        mode = "warm_start"
+    return hit, mode
+
+
+def remember_optimized(request: OptimizeRequest, final_prompt: str, run_id: str) -> None:
+    """Index the result of a full run (PCV and D/S, not cut short) for near-duplicate lookups"""
+    tenant = dedup_tenant(request)
+    if settings.DEDUP_ENABLED and tenant is not None:
+        dedup_cache.add(request.prompt, final_prompt, run_id, tenant)
+
+
+def record_cancellation(optimizer: Optional[PromptOptimizer], control: RunControl) -> None:
+    """
+    Count a cancelled run and estimate the tokens it did not spend: the
+    remaining planned calls (PCV, the D/S budget and evaluation) at the
+    run's average tokens per call so far.
+    """
+    metrics.incr("runs_cancelled")
+    if optimizer is None:
+        return
+    metrics.incr("llm_calls_aborted", optimizer.aborted_calls)
+    calls = len(optimizer.stage_metrics)
+    if not calls:
+        return
+    usage = optimizer.token_usage()
+    per_call = (usage["prompt_tokens"] + usage["completion_tokens"]) / calls
+    planned = 1 + 3 + 2 * control.max_iterations + 1
+    metrics.incr("llm_calls_saved", max(0, planned - calls))
+    metrics.incr("estimated_tokens_saved", round(max(0, planned - calls) * per_call))
+
+
+def on_deferred_evaluation(run_id: str):
+    """Callback that writes a late evaluation score back to history"""
+    def update(evaluation):
+        if settings.HISTORY_ENABLED:
+            history_store.update_evaluation(run_id, evaluation.dict())
+    return update
+
+
+def optimize_sections(
+    plans: list[SectionPlan],
+    optimizer: PromptOptimizer,
+    stage,
+    cut_short: list[str],
+) -> Iterator[dict]:
+    """
+    Optimize the sections of an incremental run that are not reused,
+    INCREMENTAL_SECTION_WORKERS at a time, yielding an event per finished
+    section. A section cut short by the deadline keeps its text.
+    """
+    context = outline([plan.text for plan in plans])
+    todo = [plan for plan in plans if plan.action != "reuse"]
+    if not todo:
+        return
+    
+    def optimize(plan: SectionPlan) -> Optional[str]:
+        try:
+            return stage(
+                f"section_{plan.key[:16]}",
+                lambda: optimizer.section_step(plan.text, context, plan.previous, plan.previous_optimized),
+            )
+        except DeadlineExceeded:
+            return None
+    
+    with ThreadPoolExecutor(max_workers=min(settings.INCREMENTAL_SECTION_WORKERS, len(todo)), thread_name_prefix="section") as pool:
+        futures = {pool.submit(optimize, plan): plan for plan in todo}
+        try:
+            for future in as_completed(futures):
+                plan = futures[future]
+                plan.optimized = future.result()
+                if plan.optimized is None:
+                    plan.optimized = plan.text
+                    if "section" not in cut_short:
+                        cut_short.append("section")
+                yield {'stage': 'section', 'status': 'complete', 'data': {'index': plan.index, 'action': plan.action, 'output': plan.optimized}}
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def optimization_events(
+    request: OptimizeRequest,
+    run_id: str,
+    control: Optional[RunControl] = None,
+    background_evaluation: bool = False,
+    raise_errors: bool = False,
+    default_priority: str = "standard",
+    admission: Optional[RunAdmission] = None,
+) -> Iterator[dict]:
+    """
+    Run the full pipeline, yielding an event dict at every stage boundary.
+
+    Blocking: iterate it from a worker thread. `control` lets the caller
+    cancel the run or change max_iterations while it is in progress. With
+    background_evaluation a deferred evaluation is handed to the evaluation
+    store instead of trailing the 'complete' event; with raise_errors
+    exceptions propagate instead of becoming an 'error' event.
+    
+    The run waits for a slot of its priority class (request.priority, else
+    default_priority) before the first stage and holds it until it ends;
+    async callers acquire `admission` first (see iterate_admitted) so the
+    wait holds no worker thread.
+
+    With request.deadline_ms every call gets the remaining time as its
+    timeout; stages that do not fit are cut short and the best prompt so far
+    is returned (an evaluation that does not fit is deferred).
+    
+    Completed stage outputs are checkpointed under run_id: a retry with the
+    same request.run_id resumes after the last completed stage, and
+    transient provider errors are retried in place.
+    
+    With request.base_run_id the run is incremental: Smart Queue and the
+    PCV and D/S stages are skipped, and only the sections changed since the
+    base run are optimized (see services.incremental).
+    """
+    control = control or RunControl(request.max_iterations)
+    start_time = time.time()
+    deadline = time.monotonic() + request.deadline_ms / 1000 if request.deadline_ms else None
+    optimizer = None
+    cut_short: list[str] = []
+    priority = request.priority or default_priority
+    admission = admission or scheduler.admission(priority)
+    slots = ExitStack()
+    slots.callback(admission.release)
+    root = tracing.start_root("optimize", **{
+        "run.id": run_id,
+        "llm.backend": request.backend,
+        "prompt.chars": len(request.prompt),
+        "request.max_iterations": request.max_iterations,
+        "request.deadline_ms": request.deadline_ms,
+        "run.priority": priority,
+    })
+    
+    try:
+        # Initialize LLM provider
+        yield {'stage': 'init', 'message': 'Initializing LLM provider...', 'run_id': run_id}
+        base = load_base(request.base_run_id, history_tenant(request)) if request.base_run_id else None
+        waited = admission.acquire(control.cancel_event)
+        root.set_attribute("queue.wait_ms", round(waited * 1000, 2))
+        
+        provider = get_llm_provider(
+            backend=request.backend,
+            gemini_key=request.gemini_api_key,
+            xai_key=request.xai_api_key
+        )
+        optimizer = PromptOptimizer(
+            provider, control.cancel_event, deadline, stage_providers(request), priority, generation_params(request)
+        )
+        optimizer.trace_parent = root
+        checkpoint = RunCheckpoint(request, run_id)
+        if checkpoint.stages:
+            yield {'stage': 'resumed', 'data': {'run_id': run_id, 'stages': sorted(checkpoint.stages)}}
+        
+        def stage(name, fn, encode=lambda value: value, decode=lambda value: value):
+            """Checkpointed output of a stage (see RunCheckpoint.run)"""
+            return checkpoint.run(name, fn, encode, decode, control.cancel_event)
+        
+        # Stage 1: Smart Queue (an incremental run was judged with its base run)
+        smart_queue_result = None
+        if base is None:
+            yield {'stage': 'smart_queue', 'status': 'running', 'message': 'Analyzing prompt quality...'}
+            control.check()
+            try:
+                smart_queue_result = stage(
+                    "smart_queue", lambda: optimizer.smart_queue(request.prompt),
+                    SmartQueueData.dict, lambda data: SmartQueueData(**data),
+                )
+            except DeadlineExceeded as e:
+                cut_short.append(e.stage)
+                smart_queue_result = triage_classifier.score(request.prompt).result
+            yield {'stage': 'smart_queue', 'status': 'complete', 'data': smart_queue_result.dict()}
+        
+        # Check if optimization needed
+        if smart_queue_result is not None and not smart_queue_result.needs_optimization and not request.force_optimization:
+            processing_time = time.time() - start_time
+            record_history(
+                run_id, request, optimizer, request.prompt,
+                stages={"smart_queue": smart_queue_result.dict()},
+                evaluation=None, converged=True, iterations=0,
+                processing_time=processing_time,
+            )
+            length = approximate_length(request.prompt)
+            root.set_attributes({"run.outcome": "not_needed", "llm.calls": len(optimizer.stage_metrics)})
+            yield {'stage': 'complete', 'message': 'No optimization needed', 'final_prompt': request.prompt, 'data': {'final_prompt': request.prompt, 'original_length': length, 'final_length': length, 'length_change_percent': 0.0, 'converged': True, 'convergence_iteration': 0, 'processing_time_seconds': processing_time, 'run_id': run_id, 'reused_from': None, 'similarity': None, 'evaluation_status': 'skipped', 'stages_cut_short': cut_short}}
+            return
+        
+        # The reuse decision is checkpointed too, so a resumed run continues the same path
+        similar, reuse_mode = None, "off"
+        if base is None:
+            similar, reuse_mode = stage(
+                "similar", lambda: lookup_similar(request),
+                lambda found: [vars(found[0]) if found[0] else None, found[1]],
+                lambda data: (DedupHit(**data[0]) if data[0] else None, data[1]),
+            )
+        root.set_attribute("cache.hit", similar is not None)
+        proposed = critique = pcv_final = None
+        ds_iterations = []
+        sections: list[SectionPlan] = []
+        incremental = None
+        if base is not None:
+            yield {'stage': 'incremental', 'status': 'running', 'message': f'Re-optimizing sections changed since run {request.base_run_id}...'}
+            control.check()
+            old_sections = base_sections(base)
+            if old_sections:
+                sections = plan_sections(old_sections, split_sections(request.prompt))
+                incremental = summary(request.base_run_id, sections)
+                root.set_attributes({f"incremental.{k}": v for k, v in incremental.items()})
+                yield from optimize_sections(sections, optimizer, stage, cut_short)
+                current = join_sections([plan.optimized for plan in sections])
+            else:
+                # No section map to diff against: adapt the base run's result as a whole, in one call
+                incremental = summary(request.base_run_id, [], mode="whole_prompt")
+                root.set_attributes({f"incremental.{k}": v for k, v in incremental.items()})
+                try:
+                    current = stage("warm_start", lambda: optimizer.warm_start(request.prompt, base["original_prompt"], base["final_prompt"]))
+                    yield {'stage': 'warm_start', 'status': 'complete', 'data': {'output': current}}
+                except DeadlineExceeded as e:
+                    cut_short.append(e.stage)
+                    current = request.prompt
+                    yield {'stage': 'deadline', 'message': f'Deadline reached in {e.stage}', 'data': {'stages_cut_short': cut_short}}
+            converged, convergence_iteration = True, 0
+            yield {'stage': 'incremental', 'status': 'complete', 'data': incremental}
+        elif similar is not None:
+            yield {'stage': 'similar_prompt', 'status': 'complete', 'data': {'run_id': similar.run_id, 'similarity': similar.similarity}}
+            current = similar.final_prompt
+            converged, convergence_iteration = True, 0
+            if reuse_mode == "warm_start":
+                yield {'stage': 'warm_start', 'status': 'running', 'message': 'Adapting optimized near-duplicate...'}
+                control.check()
+                try:
+                    current = stage("warm_start", lambda: optimizer.warm_start(request.prompt, similar.original_prompt, similar.final_prompt))
+                    yield {'stage': 'warm_start', 'status': 'complete', 'data': {'output': current}}
+                except DeadlineExceeded as e:
+                    cut_short.append(e.stage)
+                    yield {'stage': 'deadline', 'message': f'Deadline reached in {e.stage}', 'data': {'stages_cut_short': cut_short}}
+        else:
+            current = request.prompt
+            converged = False
+            convergence_iteration = None
+            try:
+                # Stage 2: PCV - Proposer
+                yield {'stage': 'pcv_proposer', 'status': 'running', 'message': 'Proposer rewriting prompt...'}
+                control.check()
+                proposed = stage("proposer", lambda: optimizer.proposer_step(request.prompt))
+                current = proposed
+                yield {'stage': 'pcv_proposer', 'status': 'complete', 'data': {'proposed_prompt': proposed}}
+            
+                # Stage 3: PCV - Critic
+                yield {'stage': 'pcv_critic', 'status': 'running', 'message': 'Critic analyzing proposal...'}
+                control.check()
+                critique = stage("critic", lambda: optimizer.critic_step(proposed))
+                yield {'stage': 'pcv_critic', 'status': 'complete', 'data': {'critique': critique}}
+            
+                # Stage 4: PCV - Verifier
+                yield {'stage': 'pcv_verifier', 'status': 'running', 'message': 'Verifier creating final version...'}
+                control.check()
+                pcv_final = stage("verifier", lambda: optimizer.verifier_step(request.prompt, proposed, critique))
+                current = pcv_final
+                yield {'stage': 'pcv_verifier', 'status': 'complete', 'data': {'final_prompt': pcv_final}}
+            
+                # Stage 5: D/S Cycle (fan-out rounds: one concurrent D per focus, merged by one S)
+                prev_len = approximate_length(current)
+                fanout = (request.ds_strategy or settings.DS_STRATEGY) == "fanout"
+                focuses = parse_focuses(settings.DS_FANOUT_FOCUSES) if fanout else []
+            
+                # max_iterations is read from the control so it can change mid-run
+                i = 0
+                while i < control.max_iterations and not (fanout and i >= settings.DS_FANOUT_ROUNDS):
+                    # Stop when another D+S pair is not expected to fit in the deadline
+                    if not optimizer.has_time_for(2):
+                        cut_short.append("ds_cycle")
+                        yield {'stage': 'deadline', 'message': f'Deadline reached before D/S iteration {i + 1}', 'data': {'stages_cut_short': cut_short}}
+                        break
+                    i += 1
+                    # D-Block
+                    yield {'stage': f'ds_iteration_{i}_d', 'status': 'running', 'message': f'D/S Iteration {i}: Diversification' + (f' x{len(focuses)}...' if fanout else '...')}
+                    control.check()
+                    if fanout:
+                        expansions = stage(f"dsf_{i}_d", lambda: optimizer.fanout_d(current, focuses))
+                        d_out = join_expansions(expansions)
+                    else:
+                        d_out = stage(f"ds_{i}_d", lambda: optimizer.d_block(current))
+                    yield {'stage': f'ds_iteration_{i}_d', 'status': 'complete', 'data': {'output': d_out}}
+                
+                    # S-Block
+                    yield {'stage': f'ds_iteration_{i}_s', 'status': 'running', 'message': f'D/S Iteration {i}: Stabilization...'}
+                    control.check()
+                    if fanout:
+                        s_out = stage(f"dsf_{i}_s", lambda: optimizer.s_merge(current, expansions))
+                    else:
+                        s_out = stage(f"ds_{i}_s", lambda: optimizer.s_block(d_out))
+                
+                    current = s_out
+                    cur_len = approximate_length(current)
+                    change_rate = abs(cur_len - prev_len) / max(prev_len, 1)
+                
+                    yield {'stage': f'ds_iteration_{i}_s', 'status': 'complete', 'data': {'output': s_out, 'length': cur_len, 'change_rate': change_rate, 'iteration': i}}
+                    ds_iterations.append({'iteration': i, 'd_block_output': d_out, 's_block_output': s_out, 'length': cur_len, 'change_rate': change_rate})
+                
+                    prev_len = cur_len
+                
+                    if change_rate < request.convergence_threshold:
+                        converged = True
+                        convergence_iteration = i
+                        yield {'stage': 'ds_converged', 'message': f'Converged at iteration {i}'}
+                        break
+            except DeadlineExceeded as e:
+                # Keep the best prompt produced so far
+                cut_short.append(e.stage)
+                yield {'stage': 'deadline', 'message': f'Deadline reached in {e.stage}', 'data': {'stages_cut_short': cut_short}}
+        
+        final_prompt = current
+        
+        # Stage 6: Evaluation
+        evaluation = None
+        if not evaluation_store.should_evaluate(evaluation_sample_rate(request)):
+            evaluation_status = "skipped"
+            evaluation_store.record(run_id, None, evaluation_status)
+        elif request.defer_evaluation or not optimizer.has_time_for(1):
+            if not request.defer_evaluation:
+                cut_short.append("pairwise_eval")
+            evaluation_status = "pending"
+            evaluation_store.record(run_id, None, evaluation_status)
+        else:
+            yield {'stage': 'evaluation', 'status': 'running', 'message': 'Comparing original vs optimized...'}
+            control.check()
+            try:
+                evaluation = stage(
+                    "pairwise_eval", lambda: optimizer.pairwise_eval(request.prompt, final_prompt),
+                    EvaluationData.dict, lambda data: EvaluationData(**data),
+                )
+                evaluation_status = "complete"
+                evaluation_store.record(run_id, evaluation, evaluation_status)
+                yield {'stage': 'evaluation', 'status': 'complete', 'data': evaluation.dict()}
+            except DeadlineExceeded as e:
+                cut_short.append(e.stage)
+                evaluation_status = "pending"
+                evaluation_store.record(run_id, None, evaluation_status)
+            except EvaluationError as e:
+                # The optimized prompt stands; only its evaluation failed
+                evaluation_status = "failed"
+                evaluation_store.record(run_id, None, evaluation_status)
+                evaluation_store.fail(run_id, str(e))
+                yield {'stage': 'evaluation', 'status': 'failed', 'error': str(e)}
+        
+        # Final summary
+        processing_time = time.time() - start_time
+        original_length = approximate_length(request.prompt)
+        final_length = approximate_length(final_prompt)
+        length_change_percent = ((final_length - original_length) / original_length) * 100
+        if similar is None and base is None and not cut_short:
+            remember_optimized(request, final_prompt, run_id)
+        record_history(
+            run_id, request, optimizer, final_prompt,
+            stages={
+                "smart_queue": smart_queue_result.dict() if smart_queue_result else None,
+                "pcv": {"proposed_prompt": proposed, "critique": critique, "final_prompt": pcv_final} if similar is None and base is None else None,
+                "ds_iterations": ds_iterations,
+                "reused_from": similar.run_id if similar else None,
+                "stages_cut_short": cut_short,
+                "incremental": incremental,
+                "sections": [plan.record() for plan in sections] or None,
+            },
+            evaluation=evaluation, converged=converged, iterations=len(ds_iterations),
+            processing_time=processing_time,
+        )
+        root.set_attributes({
+            "run.outcome": "complete",
+            "run.converged": converged,
+            "run.iterations": len(ds_iterations),
+            "run.stages_cut_short": cut_short,
+            "run.evaluation_status": evaluation_status,
+            "llm.calls": len(optimizer.stage_metrics),
+            **{f"llm.{k}": v for k, v in optimizer.token_usage().items()},
+        })
+        
+        yield {'stage': 'complete', 'data': {'final_prompt': final_prompt, 'original_length': original_length, 'final_length': final_length, 'length_change_percent': length_change_percent, 'converged': converged, 'convergence_iteration': convergence_iteration, 'processing_time_seconds': processing_time, 'run_id': run_id, 'reused_from': similar.run_id if similar else None, 'similarity': similar.similarity if similar else None, 'evaluation_status': evaluation_status, 'stages_cut_short': cut_short}}
+        
+        # Deferred evaluation runs without the deadline, after the result is out
+        if evaluation_status == "pending":
+            evaluator = optimizer.detached() if deadline is not None else optimizer
+            if background_evaluation:
+                evaluation_store.submit(
+                    run_id,
+                    lambda: evaluator.pairwise_eval(request.prompt, final_prompt),
+                    on_complete=on_deferred_evaluation(run_id),
+                )
+                return
+            yield {'stage': 'evaluation', 'status': 'running', 'message': 'Comparing original vs optimized...'}
+            try:
+                control.check()
+                evaluation = evaluator.pairwise_eval(request.prompt, final_prompt)
+            except (PipelineCancelled, CallCancelled):
+                evaluation_store.fail(run_id, "cancelled")
+                raise
+            except Exception as e:
+                # The run is already complete; only its evaluation failed
+                evaluation_store.fail(run_id, str(e))
+                yield {'stage': 'evaluation', 'status': 'failed', 'error': str(e)}
+                return
+            evaluation_store.record(run_id, evaluation, "complete")
+            on_deferred_evaluation(run_id)(evaluation)
+            yield {'stage': 'evaluation', 'status': 'complete', 'data': evaluation.dict()}
+        
+    except (PipelineCancelled, CallCancelled):
+        root.set_attribute("run.outcome", "cancelled")
+        record_cancellation(optimizer, control)
+        yield {'stage': 'cancelled', 'run_id': run_id}
+    except GeneratorExit:
+        # Closed between stages by a consumer that went away
+        if control.cancelled:
+            root.set_attribute("run.outcome", "cancelled")
+            record_cancellation(optimizer, control)
+        raise
+    except Exception as e:
+        root.set_attribute("run.outcome", "error")
+        tracing.fail(root, e)
+        if raise_errors:
+            raise
+        yield {'stage': 'error', 'error': str(e)}
+    finally:
+        slots.close()
+        root.end()
+
+
+def run_to_completion(
+    request: OptimizeRequest,
+    run_id: str,
+    control: Optional[RunControl] = None,
+    default_priority: str = "standard",
+    texts: bool = True,
+    admission: Optional[RunAdmission] = None,
+) -> dict:
+    """
+    Run the pipeline for a non-streaming caller and collect the
+    OptimizeResponse fields from its events. A deferred evaluation goes to
+    the evaluation store; raises PipelineCancelled if the run was cancelled.
+    With texts=False the intermediate PCV and D/S texts are not collected.
+    """
+    result = {"smart_queue": None, "pcv": None, "ds_iterations": [], "evaluation": None}
+    pcv: dict = {}
+    d_out = None
+    events = optimization_events(
+        request, run_id, control,
+        background_evaluation=True, raise_errors=True, default_priority=default_priority, admission=admission,
+    )
+    for event in events:
+        stage, data = event['stage'], event.get('data') or {}
+        if stage == 'cancelled':
+            raise PipelineCancelled()
+        if stage == 'complete':
+            result.update(data)
+        if event.get('status') != 'complete':
+            continue
+        if stage == 'smart_queue':
+            result["smart_queue"] = data
+        elif stage == 'evaluation':
+            result["evaluation"] = data
+        elif stage == 'incremental':
+            result["incremental"] = data
+        elif not texts:
+            continue
+        elif stage.startswith('pcv_'):
+            pcv.update(data)
+        elif stage.endswith('_d'):
+            d_out = data['output']
+        elif stage.endswith('_s'):
+            result["ds_iterations"].append({
+                'iteration': data['iteration'],
+                'd_block_output': d_out,
+                's_block_output': data['output'],
+                'length': data['length'],
+                'change_rate': data['change_rate'],
+            })
+    if len(pcv) == 3:
+        result["pcv"] = pcv
+    return result
+
+
+async def iterate_admitted(events: Iterator[dict], admission: RunAdmission, control: RunControl) -> AsyncIterator[dict]:
+    """
+    Iterate a run's events from the event loop. Its priority slot is awaited
+    here first, so a queued run holds no threadpool thread; then each stage
+    runs in the threadpool.
+    """
+    try:
+        try:
+            await admission.acquire_async(control.cancel_event)
+        except CallCancelled:
+            pass  # the run then reports its own cancellation
+        async for event in iterate_in_threadpool(events):
+            yield event
+    finally:
+        admission.release()
@@ -0,0 +1,266 @@
+"""
+Priority classes for runs and upstream calls.
+
+Every run belongs to a class: interactive (streaming UI), standard (plain API
+calls) or bulk (batch jobs). Each class has its own run concurrency limit
+(PRIORITY_RUN_LIMITS) and, when UPSTREAM_CALL_SLOTS is set, a share of the
+in-flight provider calls (PRIORITY_CALL_SHARES). A class may borrow idle slots
+beyond its share unless a higher class is waiting. Bulk calls are throttled to
+PRIORITY_BULK_THROTTLED_CALLS while interactive queue waits exceed
+PRIORITY_INTERACTIVE_TARGET_MS. Queue waits are reported per class.
+
+Endpoints wait for run admission on the event loop (RunAdmission.acquire_async),
+so queued runs hold no threadpool thread; the threadpool is sized to fit every
+admitted run (threadpool_size).
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from ..config import settings
+from ..services.llm_provider import CallCancelled, DeadlineExceeded
+from ..services.metrics import metrics
+
+
+PRIORITY_CLASSES = ("interactive", "standard", "bulk")
+
+# How long a slow interactive wait keeps bulk throttled without newer samples
+THROTTLE_MEMORY_SECONDS = 10.0
+
+
+def parse_class_values(spec: str, cast=float) -> dict[str, float]:
+    """Parse "interactive=16,standard=8,bulk=2" into {class: value}"""
+    values = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, sep, value = item.partition("=")
+        name = name.strip()
+        if not sep or name not in PRIORITY_CLASSES:
+            raise ValueError(f"Invalid priority class entry {item.strip()!r}; expected one of {', '.join(PRIORITY_CLASSES)}")
+        values[name] = cast(value.strip())
+    return values
+
+
+class RunAdmission:
+    """
+    A run's slot in its priority class. Acquired either on the event loop
+    before the run takes a worker thread, or blocking from the run's thread;
+    release() is idempotent.
+    """
+
+    def __init__(self, scheduler: "PriorityScheduler", priority: str):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.waited: Optional[float] = None
+        self._released = False
+
+    @property
+    def acquired(self) -> bool:
+        return self.waited is not None
+
+    def acquire(self, cancel: Optional[threading.Event] = None) -> float:
+        if not self.acquired:
+            self.waited = self.scheduler._admit(self.priority, cancel)
+        return self.waited
+
+    async def acquire_async(self, cancel: Optional[threading.Event] = None) -> float:
+        if not self.acquired:
+            self.waited = await self.scheduler._admit_async(self.priority, cancel)
+        return self.waited
+
+    def release(self) -> None:
+        if self.acquired and not self._released:
+            self._released = True
+            self.scheduler._release_run(self.priority)
+
+
+class PriorityScheduler:
+    """Per-class run admission and upstream call slots sharing one condition"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.runs = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.calls = dict.fromkeys(PRIORITY_CLASSES, 0)
+        # FIFO queues of waiting tickets per class, so waiters are served in order
+        self.waiting_runs: dict[str, deque] = {cls: deque() for cls in PRIORITY_CLASSES}
+        self.waiting_calls: dict[str, deque] = {cls: deque() for cls in PRIORITY_CLASSES}
+        self._interactive_wait = 0.0  # EWMA of interactive queue waits (seconds)
+        self._interactive_seen = 0.0
+        self.run_limits = parse_class_values(settings.PRIORITY_RUN_LIMITS, int)
+        shares = parse_class_values(settings.PRIORITY_CALL_SHARES)
+        total = settings.UPSTREAM_CALL_SLOTS
+        self.call_reserved = {cls: max(1, math.floor(shares.get(cls, 0) * total)) for cls in PRIORITY_CLASSES} if total else {}
+
+    def throttling_bulk(self) -> bool:
+        """Whether interactive traffic is currently queueing beyond its target"""
+        if time.monotonic() - self._interactive_seen > THROTTLE_MEMORY_SECONDS:
+            return False
+        return self._interactive_wait * 1000 > settings.PRIORITY_INTERACTIVE_TARGET_MS
+
+    def _observe_wait(self, kind: str, priority: str, seconds: float) -> None:
+        metrics.observe(f"queue_wait.{kind}.{priority}", seconds)
+        if priority == "interactive":
+            self._interactive_wait = 0.3 * seconds + 0.7 * self._interactive_wait
+            self._interactive_seen = time.monotonic()
+
+    def _higher_waiting(self, priority: str) -> bool:
+        higher = PRIORITY_CLASSES[:PRIORITY_CLASSES.index(priority)]
+        return any(self.waiting_calls[cls] for cls in higher)
+
+    def _may_call(self, priority: str) -> bool:
+        if priority == "bulk" and self.throttling_bulk() and self.calls["bulk"] >= settings.PRIORITY_BULK_THROTTLED_CALLS:
+            return False
+        total = settings.UPSTREAM_CALL_SLOTS
+        if not total:
+            return True
+        if sum(self.calls.values()) >= total:
+            return False
+        return self.calls[priority] < self.call_reserved[priority] or not self._higher_waiting(priority)
+
+    def _wait_turn(
+        self,
+        queue: deque,
+        ready,
+        cancel: Optional[threading.Event],
+        timeout: Optional[float],
+        on_block=None,
+    ) -> None:
+        """
+        Queue up and wait until first in line and ready(); called with the
+        lock held. Raises CallCancelled or DeadlineExceeded while waiting.
+        """
+        ticket = object()
+        queue.append(ticket)
+        expires = time.monotonic() + timeout if timeout is not None else None
+        blocked = False
+        try:
+            while not (queue[0] is ticket and ready()):
+                if not blocked and on_block is not None:
+                    on_block()
+                blocked = True
+                if cancel is not None and cancel.is_set():
+                    raise CallCancelled()
+                if expires is not None and time.monotonic() >= expires:
+                    raise DeadlineExceeded()
+                self._cond.wait(0.05)
+        finally:
+            queue.remove(ticket)
+            self._cond.notify_all()
+
+    def _may_run(self, priority: str) -> bool:
+        limit = self.run_limits.get(priority)
+        return not limit or self.runs[priority] < limit
+
+    def _admit(self, priority: str, cancel: Optional[threading.Event]) -> float:
+        """Blocking run admission; returns the seconds waited"""
+        start = time.perf_counter()
+        with self._cond:
+            self._wait_turn(self.waiting_runs[priority], lambda: self._may_run(priority), cancel, None)
+            self.runs[priority] += 1
+            waited = time.perf_counter() - start
+            self._observe_wait("run", priority, waited)
+        return waited
+
+    async def _admit_async(self, priority: str, cancel: Optional[threading.Event], poll: float = 0.02) -> float:
+        """Run admission awaited on the event loop, in the same FIFO as blocking waiters"""
+        start = time.perf_counter()
+        queue = self.waiting_runs[priority]
+        ticket = object()
+        with self._cond:
+            queue.append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    if queue[0] is ticket and self._may_run(priority):
+                        self.runs[priority] += 1
+                        break
+                if cancel is not None and cancel.is_set():
+                    raise CallCancelled()
+                await asyncio.sleep(poll)
+        finally:
+            with self._cond:
+                queue.remove(ticket)
+                self._cond.notify_all()
+        waited = time.perf_counter() - start
+        self._observe_wait("run", priority, waited)
+        return waited
+
+    def _release_run(self, priority: str) -> None:
+        with self._cond:
+            self.runs[priority] -= 1
+            self._cond.notify_all()
+
+    def admission(self, priority: str) -> RunAdmission:
+        """A not yet acquired run slot of a class"""
+        return RunAdmission(self, priority)
+
+    @contextmanager
+    def run_slot(self, priority: str, cancel: Optional[threading.Event] = None) -> Iterator[float]:
+        """Admit a run of a class (blocking); yields the seconds it waited in the queue"""
+        admission = self.admission(priority)
+        try:
+            yield admission.acquire(cancel)
+        finally:
+            admission.release()
+
+    @contextmanager
+    def call_slot(
+        self,
+        priority: str,
+        cancel: Optional[threading.Event] = None,
+        timeout: Optional[float] = None,
+    ) -> Iterator[float]:
+        """Hold an upstream call slot of a class; yields the seconds waited"""
+        start = time.perf_counter()
+
+        def count_throttled():
+            if priority == "bulk" and self.throttling_bulk():
+                metrics.incr("bulk_calls_throttled")
+
+        with self._cond:
+            self._wait_turn(self.waiting_calls[priority], lambda: self._may_call(priority), cancel, timeout, count_throttled)
+            self.calls[priority] += 1
+            waited = time.perf_counter() - start
+            self._observe_wait("call", priority, waited)
+        try:
+            yield waited
+        finally:
+            with self._cond:
+                self.calls[priority] -= 1
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "classes": {
+                    cls: {
+                        "running": self.runs[cls],
+                        "waiting": len(self.waiting_runs[cls]),
+                        "run_limit": self.run_limits.get(cls),
+                        "calls_in_flight": self.calls[cls],
+                        "calls_waiting": len(self.waiting_calls[cls]),
+                        "call_slots_reserved": self.call_reserved.get(cls),
+                    }
+                    for cls in PRIORITY_CLASSES
+                },
+                "upstream_call_slots": settings.UPSTREAM_CALL_SLOTS or None,
+                "interactive_wait_ms": round(self._interactive_wait * 1000, 1),
+                "bulk_throttled": self.throttling_bulk(),
+            }
+
+
+scheduler = PriorityScheduler()
+
+
+def threadpool_size() -> int:
+    """
+    Worker threads for the server's threadpool: an admitted run holds at most
+    one at a time, so every class limit fits, plus headroom for other endpoints.
+    """
+    runs = sum(scheduler.run_limits.get(cls, 0) for cls in PRIORITY_CLASSES)
+    return max(settings.THREADPOOL_SIZE, runs + settings.THREADPOOL_HEADROOM)
@@ -0,0 +1,240 @@
+"""
+On-demand sampling profiler for individual runs.
+
+A run is profiled when the request carries X-Profile with the admin token,
+or at random with PROFILE_SAMPLE_RATE. While a profiled run executes, a
+background thread samples the stacks of the worker threads running it every
+PROFILE_INTERVAL_MS; the result is stored per run id as collapsed stacks
+("frame;frame;frame count" lines, the input of flamegraph.pl and speedscope).
+Sampling is wall-clock, so time blocked on the provider shows up as socket
+frames next to the CPU work.
+"""
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from ..config import settings
+from ..services.metrics import metrics
+
+
+_RUN_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    path = Path(code.co_filename)
+    return f"{code.co_name} ({path.parent.name}/{path.name}:{code.co_firstlineno})"
+
+
+def collapse(frame) -> str:
+    """Stack of a frame as one collapsed line, outermost frame first"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class ProfileSession:
+    """Samples collected for one run, from whichever threads execute it"""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.threads: set[int] = set()
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def active(self) -> Iterator[None]:
+        """Mark the current thread as running this session's code"""
+        ident = threading.get_ident()
+        with self._lock:
+            self.threads.add(ident)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.threads.discard(ident)
+
+    def thread_ids(self) -> list[int]:
+        """Threads currently running this session, safe to call from the sampler"""
+        with self._lock:
+            return list(self.threads)
+
+    def add_sample(self, stack: str) -> None:
+        """Count one sampled stack (called by the sampler thread)"""
+        with self._lock:
+            self.stacks[stack] += 1
+            self.samples += 1
+
+    def counts(self) -> tuple[int, list[tuple[str, int]]]:
+        """Sample total and stacks by count, copied consistently while the sampler may still run"""
+        with self._lock:
+            return self.samples, self.stacks.most_common()
+
+
+class SamplingProfiler:
+    """One sampler thread shared by all sessions; it runs only while any are open"""
+
+    def __init__(self, interval_ms: int):
+        self.interval = interval_ms / 1000
+        self._sessions: set[ProfileSession] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def open(self, run_id: str) -> ProfileSession:
+        session = ProfileSession(run_id)
+        with self._lock:
+            self._sessions.add(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="run-profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def close(self, session: ProfileSession) -> None:
+        with self._lock:
+            self._sessions.discard(session)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+                sessions = list(self._sessions)
+            try:
+                frames = sys._current_frames()
+                for session in sessions:
+                    for ident in session.thread_ids():
+                        frame = frames.get(ident)
+                        if frame is not None:
+                            session.add_sample(collapse(frame))
+                del frames
+            except Exception:
+                # A bad sample must not stop profiling for every open session
+                metrics.incr("profiler_errors")
+
+
+class ProfileStore:
+    """Collapsed-stack profiles on disk, keeping the newest PROFILE_MAX_STORED"""
+
+    def __init__(self, directory: str, max_stored: int):
+        self.directory = Path(directory)
+        self.max_stored = max_stored
+        self._lock = threading.Lock()
+
+    def _path(self, run_id: str) -> Optional[Path]:
+        if not _RUN_ID_RE.match(run_id):
+            return None
+        return self.directory / f"{run_id}.folded"
+
+    def save(self, session: ProfileSession) -> None:
+        path = self._path(session.run_id)
+        if path is None:
+            return
+        seconds = time.perf_counter() - session.started
+        samples, stacks = session.counts()
+        lines = [f"# run_id={session.run_id} samples={samples} seconds={seconds:.3f} interval_ms={settings.PROFILE_INTERVAL_MS}"]
+        lines += [f"{stack} {count}" for stack, count in stacks]
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+            self._prune()
+
+    def _prune(self) -> None:
+        files = sorted(self.directory.glob("*.folded"), key=lambda p: p.stat().st_mtime)
+        for old in files[:max(0, len(files) - self.max_stored)]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def get(self, run_id: str) -> Optional[str]:
+        path = self._path(run_id)
+        if path is None or not path.exists():
+            return None
+        return path.read_text(encoding="utf-8")
+
+    def list(self) -> list[dict]:
+        """Stored profiles, newest first, with their header fields"""
+        if not self.directory.exists():
+            return []
+        entries = []
+        for path in sorted(self.directory.glob("*.folded"), key=lambda p: p.stat().st_mtime, reverse=True):
+            with open(path, encoding="utf-8") as f:
+                header = f.readline().lstrip("# ").split()
+            fields = dict(field.split("=", 1) for field in header if "=" in field)
+            entries.append({
+                "run_id": fields.get("run_id"),
+                "samples": int(fields.get("samples", 0)),
+                "seconds": float(fields.get("seconds", 0)),
+                "interval_ms": int(fields.get("interval_ms", 0)),
+            })
+        return entries
+
+
+profiler = SamplingProfiler(settings.PROFILE_INTERVAL_MS)
+profile_store = ProfileStore(settings.PROFILE_DIR, settings.PROFILE_MAX_STORED)
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """Whether a request header carries the configured admin token"""
+    if not settings.ADMIN_TOKEN or token is None:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), settings.ADMIN_TOKEN.encode("utf-8"))
+
+
+def should_profile(profile_header: Optional[str]) -> bool:
+    """Profile on an admin X-Profile header, or at PROFILE_SAMPLE_RATE"""
+    if profile_header is not None and is_admin(profile_header):
+        return True
+    return settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE
+
+
+@contextmanager
+def profile_run(run_id: str, enabled: bool = True) -> Iterator[None]:
+    """Profile a blocking block of code as run_id"""
+    if not enabled:
+        yield
+        return
+    session = profiler.open(run_id)
+    try:
+        with session.active():
+            yield
+    finally:
+        profiler.close(session)
+        profile_store.save(session)
+        metrics.incr("runs_profiled")
+
+
+def profile_events(run_id: str, events: Iterator[dict]) -> Iterator[dict]:
+    """
+    Profile a blocking event iterator as run_id. Each step may run on a
+    different worker thread, so the thread is registered per step and the
+    time between steps is not sampled.
+    """
+    session = profiler.open(run_id)
+    try:
+        while True:
+            with session.active():
+                try:
+                    event = next(events)
+                except StopIteration:
+                    return
+            yield event
+    finally:
+        events.close()
+        profiler.close(session)
+        profile_store.save(session)
+        metrics.incr("runs_profiled")
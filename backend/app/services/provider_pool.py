@@ -0,0 +1,271 @@
+"""
+Pool of server-side provider endpoints (API key x model) per backend.
+
+Calls go to the member with the lowest expected wait, (outstanding + 1) *
+EWMA latency. Members answering 429 are quarantined with exponential
+backoff, and with POOL_SPILLOVER a saturated backend spills over to the
+other one. When every member is saturated or quarantined, a call waits for
+one to free up within its own deadline instead of failing.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from ..config import settings
+from ..services.llm_provider import (
+    CallCancelled,
+    DeadlineExceeded,
+    GeminiProvider,
+    GrokProvider,
+    LLMProvider,
+    PerThread,
+)
+
+
+PROVIDER_CLASSES: dict[str, Callable[..., LLMProvider]] = {
+    "gemini": GeminiProvider,
+    "grok": GrokProvider,
+}
+
+
+def _split(value: Optional[str]) -> list[str]:
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+@dataclass
+class PoolMember:
+    """One API key + model endpoint with its routing statistics"""
+    backend: str
+    api_key: str
+    model: str
+    outstanding: int = 0
+    ewma_seconds: Optional[float] = None
+    calls: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    strikes: int = 0
+    quarantined_until: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    def available(self, now: float) -> bool:
+        return now >= self.quarantined_until and self.outstanding < settings.POOL_MAX_OUTSTANDING
+
+    def score(self, default_seconds: float) -> float:
+        """Expected wait for a new call: queue depth times typical latency"""
+        return (self.outstanding + 1) * (self.ewma_seconds or default_seconds)
+
+    def stats(self, now: float) -> dict:
+        return {
+            "backend": self.backend,
+            "key": f"...{self.api_key[-4:]}",
+            "model": self.model,
+            "outstanding": self.outstanding,
+            "calls": self.calls,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "ewma_latency_ms": round(self.ewma_seconds * 1000, 1) if self.ewma_seconds is not None else None,
+            "quarantined_for": round(max(0.0, self.quarantined_until - now), 1),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+class ProviderPool:
+    """Latency-aware router over the configured members of every backend"""
+
+    def __init__(self, members: list[PoolMember]):
+        self.members = members
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+
+    @classmethod
+    def from_settings(cls) -> "ProviderPool":
+        members = []
+        configured = {
+            "gemini": ([settings.GEMINI_API_KEY, *_split(settings.GEMINI_API_KEYS)], _split(settings.GEMINI_MODELS) or [settings.GEMINI_MODEL]),
+            "grok": ([settings.XAI_API_KEY, *_split(settings.XAI_API_KEYS)], _split(settings.GROK_MODELS) or [settings.GROK_MODEL]),
+        }
+        for backend, (keys, models) in configured.items():
+            for key in dict.fromkeys(k for k in keys if k):
+                for model in models:
+                    members.append(PoolMember(backend, key, model))
+        return cls(members)
+
+    def has_backend(self, backend: str) -> bool:
+        return any(m.backend == backend for m in self.members)
+
+    def _default_seconds(self) -> float:
+        known = [m.ewma_seconds for m in self.members if m.ewma_seconds is not None]
+        return sum(known) / len(known) if known else 1.0
+
+    def acquire(self, backend: str, exclude: set[int], model: Optional[str] = None) -> Optional[PoolMember]:
+        """
+        Reserve the best available member of backend, spilling over if allowed.
+        Members configured for `model` are preferred when there are any.
+        """
+        with self._lock:
+            return self._pick(backend, exclude, model, time.monotonic())
+
+    def _pick(self, backend: str, exclude: set[int], model: Optional[str], now: float) -> Optional[PoolMember]:
+        default = self._default_seconds()
+        backends = [backend]
+        if settings.POOL_SPILLOVER:
+            backends += [b for b in PROVIDER_CLASSES if b != backend]
+        for name in backends:
+            candidates = [
+                m for m in self.members
+                if m.backend == name and id(m) not in exclude and m.available(now)
+            ]
+            if model and name == backend:
+                candidates = [m for m in candidates if m.model == model] or candidates
+            if candidates:
+                member = min(candidates, key=lambda m: m.score(default))
+                member.outstanding += 1
+                return member
+        return None
+
+    def wait_acquire(
+        self,
+        backend: str,
+        model: Optional[str],
+        deadline: float,
+        cancel: Optional[threading.Event] = None,
+    ) -> Optional[PoolMember]:
+        """
+        Reserve the best member, waiting for one to be released or to leave
+        quarantine until `deadline` (time.monotonic()). Returns None when the
+        deadline passes first; raises CallCancelled when cancel is set.
+        """
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                member = self._pick(backend, set(), model, now)
+                if member is not None:
+                    return member
+                if cancel is not None and cancel.is_set():
+                    raise CallCancelled()
+                if now >= deadline:
+                    return None
+                wait = deadline - now
+                if cancel is not None:
+                    wait = min(wait, 0.1)
+                quarantine_ends = [m.quarantined_until for m in self.members if m.quarantined_until > now]
+                if quarantine_ends:
+                    wait = min(wait, min(quarantine_ends) - now)
+                self._released.wait(max(wait, 0.001))
+
+    def release(
+        self,
+        member: PoolMember,
+        seconds: Optional[float] = None,
+        usage: Optional[dict] = None,
+        error: Optional[Exception] = None,
+    ) -> None:
+        """Return a member and fold the call's outcome into its statistics"""
+        with self._lock:
+            member.outstanding -= 1
+            member.calls += 1
+            if seconds is not None:
+                alpha = settings.POOL_EWMA_ALPHA
+                member.ewma_seconds = seconds if member.ewma_seconds is None else alpha * seconds + (1 - alpha) * member.ewma_seconds
+                member.strikes = 0
+            if usage:
+                member.prompt_tokens += usage.get("prompt_tokens", 0)
+                member.completion_tokens += usage.get("completion_tokens", 0)
+            if error is not None:
+                member.errors += 1
+                if _status_code(error) == 429:
+                    member.rate_limited += 1
+                    member.strikes += 1
+                    backoff = settings.POOL_QUARANTINE_SECONDS * 2 ** (member.strikes - 1)
+                    member.quarantined_until = time.monotonic() + min(backoff, 600.0)
+            self._released.notify_all()
+
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [m.stats(now) for m in self.members]
+
+
+class PooledProvider(LLMProvider):
+    """
+    Per-run handle on the shared pool. Each call is routed to a member; a 429
+    quarantines that member and the call is retried on the next best one.
+    With no member free, the call waits for one within its timeout (or
+    POOL_ACQUIRE_TIMEOUT without one) before giving up.
+    """
+
+    # Member and model that served the calling thread's last call
+    last_member = PerThread()
+    last_model = PerThread()
+
+    def __init__(self, pool: ProviderPool, backend: str, model: Optional[str] = None):
+        super().__init__()
+        self.pool = pool
+        self.backend = backend
+        self.model = model
+
+    def call(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
+        timeout = kwargs.get("timeout")
+        started = time.monotonic()
+        deadline = started + (timeout if timeout is not None else settings.POOL_ACQUIRE_TIMEOUT)
+        tried: set[int] = set()
+        last_error: Optional[Exception] = None
+        while True:
+            member = self.pool.acquire(self.backend, tried, self.model)
+            if member is None:
+                member = self.pool.wait_acquire(self.backend, self.model, deadline, kwargs.get("cancel"))
+            if member is None:
+                if timeout is not None:
+                    raise DeadlineExceeded()
+                if last_error is not None:
+                    raise last_error
+                raise RuntimeError(f"All {self.backend} provider keys stayed rate limited or saturated for {settings.POOL_ACQUIRE_TIMEOUT:.0f}s")
+            tried.add(id(member))
+            if timeout is not None:
+                # Time spent waiting for a member comes out of the call's budget
+                kwargs["timeout"] = max(0.001, timeout - (time.monotonic() - started))
+
+            # A pinned model applies only on its own backend, not after spillover
+            model = self.model if self.model and member.backend == self.backend else member.model
+            provider = PROVIDER_CLASSES[member.backend](member.api_key, model)
+            start = time.perf_counter()
+            try:
+                result = provider.call(system_prompt, user_prompt, **kwargs)
+            except (CallCancelled, DeadlineExceeded):
+                self.pool.release(member)
+                raise
+            except Exception as e:
+                self.pool.release(member, error=e)
+                if _status_code(e) != 429:
+                    raise
+                last_error = e
+                continue
+
+            self.pool.release(member, time.perf_counter() - start, provider.last_usage)
+            self.last_usage = provider.last_usage
+            self.last_partial_chars = provider.last_partial_chars
+            self.last_member = member
+            self.last_model = model
+            return result
+
+
+_pool: Optional[ProviderPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_provider_pool() -> ProviderPool:
+    """Process-wide pool, built from settings on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProviderPool.from_settings()
+    return _pool
@@ -0,0 +1,204 @@
+"""
+Resumable event streams for /optimize-stream.
+
+A run's events are produced by a background task, independent of any HTTP
+connection, into a bounded ring buffer (optionally mirrored to a JSONL file
+by a writer thread, so a slow disk never blocks the event loop).
+Connections subscribe from a Last-Event-ID and get the missed events replayed
+before following the run live. A run with no subscribers is cancelled after a
+grace period; finished runs are kept for replay for a retention period.
+"""
+import asyncio
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..services.metrics import metrics
+from ..services.pipeline import RunControl
+
+# One thread does all spill file writes, so each run's events land in order
+_spill_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stream-spill")
+
+
+class RunStream:
+    """Buffered, numbered events of a single run"""
+
+    def __init__(
+        self,
+        run_id: str,
+        control: RunControl,
+        capacity: int,
+        grace_seconds: float,
+        spill_dir: Optional[str] = None,
+    ):
+        self.run_id = run_id
+        self.control = control
+        self.grace_seconds = grace_seconds
+        self.events: deque[tuple[int, dict]] = deque(maxlen=capacity)
+        self.last_id = 0
+        self.done = False
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._grace_handle: Optional[asyncio.TimerHandle] = None
+        self.spill_path = Path(spill_dir) / f"{run_id}.jsonl" if spill_dir else None
+        self._spill_dir_made = False
+        # The latest queued spill write; the writer runs them in order
+        self._spilling: Optional[asyncio.Future] = None
+
+    def publish(self, event: dict) -> None:
+        self.last_id += 1
+        self.events.append((self.last_id, event))
+        if self.spill_path is not None:
+            line = json.dumps([self.last_id, event], ensure_ascii=False) + "\n"
+            self._spilling = asyncio.get_running_loop().run_in_executor(_spill_writer, self._append, line)
+        self._notify()
+
+    def _append(self, line: str) -> None:
+        """Append one event to the spill file (runs on the spill writer thread)"""
+        try:
+            if not self._spill_dir_made:
+                self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+                self._spill_dir_made = True
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError:
+            # Readers that need the event get an events_dropped gap instead
+            metrics.incr("stream_spill_errors")
+
+    def close(self) -> None:
+        self.done = True
+        self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _spilled(self, after_id: int, before_id: int) -> list[tuple[int, dict]]:
+        """Events evicted from the ring, read back from the spill file (runs in the threadpool)"""
+        events = []
+        if self.spill_path is None or not self.spill_path.exists():
+            return events
+        with open(self.spill_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # a later event still being written
+                event_id, event = json.loads(line)
+                if event_id >= before_id:
+                    break
+                if event_id > after_id:
+                    events.append((event_id, event))
+        return events
+
+    async def _read_spilled(self, after_id: int, before_id: int) -> list[tuple[int, dict]]:
+        """Wait for queued spill writes, then read the evicted events off the event loop"""
+        if self.spill_path is None:
+            return []
+        if self._spilling is not None:
+            # Shielded: a subscriber going away must not cancel a queued write
+            await asyncio.shield(self._spilling)
+        return await run_in_threadpool(self._spilled, after_id, before_id)
+
+    def _attach(self) -> None:
+        self.subscribers += 1
+        if self._grace_handle is not None:
+            self._grace_handle.cancel()
+            self._grace_handle = None
+
+    def _detach(self) -> None:
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.done:
+            self._grace_handle = asyncio.get_running_loop().call_later(self.grace_seconds, self._expire)
+
+    def _expire(self) -> None:
+        self._grace_handle = None
+        if self.subscribers == 0 and not self.done:
+            self.control.cancel()
+
+    async def subscribe(self, after_id: int = 0) -> AsyncIterator[tuple[int, dict]]:
+        """Replay events after after_id, then follow the run until it ends"""
+        self._attach()
+        try:
+            sent = after_id
+            while True:
+                changed = self._changed
+                oldest = self.events[0][0] if self.events else self.last_id + 1
+                if sent + 1 < oldest:
+                    for event_id, event in await self._read_spilled(sent, oldest):
+                        yield event_id, event
+                        sent = event_id
+                    if sent + 1 < oldest:
+                        yield oldest - 1, {'stage': 'events_dropped', 'count': oldest - 1 - sent}
+                        sent = oldest - 1
+                for event_id, event in list(self.events):
+                    if event_id > sent:
+                        yield event_id, event
+                        sent = event_id
+                if self.done and sent >= self.last_id:
+                    return
+                await changed.wait()
+        finally:
+            self._detach()
+
+
+class RunStreamRegistry:
+    """Process-wide registry of resumable runs"""
+
+    def __init__(self):
+        self._streams: dict[str, RunStream] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def start(self, run_id: str, events: AsyncIterator[dict], control: RunControl) -> RunStream:
+        """Drive a run's events (see pipeline.iterate_admitted) in the background into a new RunStream"""
+        stream = RunStream(
+            run_id,
+            control,
+            capacity=settings.STREAM_BUFFER_SIZE,
+            grace_seconds=settings.STREAM_RESUME_GRACE,
+            spill_dir=settings.STREAM_SPILL_DIR,
+        )
+        self._streams[run_id] = stream
+
+        async def produce():
+            try:
+                async for event in events:
+                    stream.publish(event)
+                stream.publish({'stage': 'stream_end', 'run_id': run_id})
+            finally:
+                stream.close()
+                asyncio.get_running_loop().call_later(settings.STREAM_RETENTION, self._forget, run_id)
+
+        task = asyncio.create_task(produce())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return stream
+
+    def get(self, run_id: str) -> Optional[RunStream]:
+        return self._streams.get(run_id)
+
+    def _forget(self, run_id: str) -> None:
+        stream = self._streams.pop(run_id, None)
+        if stream is not None and stream.spill_path is not None:
+            # Queued behind the run's pending writes
+            _spill_writer.submit(_remove_spill, stream.spill_path)
+
+    def shutdown(self) -> None:
+        """Cancel runs that are still in progress"""
+        for stream in self._streams.values():
+            if not stream.done:
+                stream.control.cancel()
+
+
+def _remove_spill(path: Path) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+run_streams = RunStreamRegistry()
@@ -0,0 +1,169 @@
+"""
+Optional OpenTelemetry tracing of optimization runs.
+
+With TRACING_ENABLED each run gets a root "optimize" span with a child span
+per pipeline stage call and per upstream HTTP request (retries show up as
+separate requests). Spans are exported to a JSONL file or an OTLP/HTTP
+collector; TRACING_SAMPLE_RATE keeps the overhead down. Needs the
+opentelemetry-sdk package (plus opentelemetry-exporter-otlp-proto-http for
+OTLP); without it, or when disabled, every span is a no-op.
+"""
+import json
+import threading
+import warnings
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+from ..config import settings
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    from opentelemetry.trace import Status, StatusCode
+except ImportError:  # optional dependency
+    trace = None
+
+
+class _NoopSpan:
+    """Stand-in when tracing is off, so call sites need no checks"""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: dict) -> None:
+        pass
+
+    def add_event(self, name: str, attributes: Optional[dict] = None) -> None:
+        pass
+
+    def record_exception(self, exception: BaseException) -> None:
+        pass
+
+    def is_recording(self) -> bool:
+        return False
+
+    def end(self) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_tracer = None
+_provider = None
+# File the "file" exporter appends to, closed by shutdown()
+_trace_file = None
+_unavailable = False
+_lock = threading.Lock()
+
+
+def _build_exporter():
+    global _trace_file
+    if settings.TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT)
+    _trace_file = open(settings.TRACING_FILE, "a", encoding="utf-8")
+    return ConsoleSpanExporter(out=_trace_file, formatter=lambda span: json.dumps(json.loads(span.to_json())) + "\n")
+
+
+def get_tracer():
+    """Process-wide tracer, set up from settings on first use (None when off)"""
+    global _tracer, _provider, _unavailable
+    if not settings.TRACING_ENABLED or _unavailable:
+        return None
+    if _tracer is None:
+        with _lock:
+            if _tracer is None:
+                if trace is None:
+                    warnings.warn("TRACING_ENABLED is set but opentelemetry-sdk is not installed; tracing is off")
+                    _unavailable = True
+                    return None
+                _provider = TracerProvider(
+                    resource=Resource.create({"service.name": settings.TRACING_SERVICE_NAME}),
+                    sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATE)),
+                )
+                _provider.add_span_processor(BatchSpanProcessor(_build_exporter()))
+                _tracer = _provider.get_tracer("promptoptimizer")
+    return _tracer
+
+
+def _parent(parent):
+    """Explicit parent span, else the current one; None when neither records"""
+    if parent is None or parent is NOOP_SPAN:
+        parent = trace.get_current_span()
+    return parent if parent.is_recording() else None
+
+
+def start_root(name: str, **attributes):
+    """Start a new (sampled) trace; the caller must end() the returned span"""
+    tracer = get_tracer()
+    if tracer is None:
+        return NOOP_SPAN
+    return tracer.start_span(name, attributes=_clean(attributes))
+
+
+def start_span(name: str, parent=None, **attributes):
+    """
+    Start a child span that is not made current; the caller must end() it.
+    For spans that outlive a generator yield, where no context can be attached.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        return NOOP_SPAN
+    parent = _parent(parent)
+    if parent is None:
+        return NOOP_SPAN
+    return tracer.start_span(name, context=trace.set_span_in_context(parent), attributes=_clean(attributes))
+
+
+@contextmanager
+def span(name: str, parent=None, **attributes) -> Iterator[Any]:
+    """
+    Span around a block, child of `parent` or of the current span, and
+    current while the block runs. Without either parent nothing is recorded,
+    so untraced code paths (e.g. worker threads) never start new traces.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        yield NOOP_SPAN
+        return
+    parent = _parent(parent)
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    with tracer.start_as_current_span(
+        name,
+        context=trace.set_span_in_context(parent),
+        attributes=_clean(attributes),
+        record_exception=False,
+        set_status_on_exception=False,
+    ) as current:
+        try:
+            yield current
+        except BaseException as e:
+            fail(current, e)
+            raise
+
+
+def fail(span_, error: BaseException) -> None:
+    """Mark a span as failed by `error`"""
+    if span_.is_recording():
+        span_.record_exception(error)
+        span_.set_status(Status(StatusCode.ERROR, type(error).__name__))
+
+
+def _clean(attributes: dict) -> dict:
+    """OpenTelemetry attributes cannot be None"""
+    return {k: v for k, v in attributes.items() if v is not None}
+
+
+def shutdown() -> None:
+    """Flush buffered spans before the process exits and close the trace file"""
+    global _trace_file
+    if _provider is not None:
+        _provider.shutdown()
+    if _trace_file is not None:
+        _trace_file.close()
+        _trace_file = None
@@ -0,0 +1,359 @@
+"""
+Local heuristic triage for the Smart Queue stage.
+
+Scores a prompt on clarity / structure / constraints with a small linear
+model over cheap regex features, so most prompts never need the LLM call.
+The weights are read from TRIAGE_WEIGHTS_PATH (written by --fit below),
+falling back to the hand-tuned DEFAULT_WEIGHTS.
+"""
+import json
+import math
+import os
+import random
+import re
+import warnings
+from dataclasses import dataclass
+from typing import Iterable, Optional, Sequence
+
+from ..config import settings
+from ..models.results import SmartQueueData
+
+
+AXES = ("clarity", "structure", "constraints")
+
+FEATURE_NAMES = (
+    "bias",
+    "log_length",
+    "line_count",
+    "list_markers",
+    "headings",
+    "role",
+    "constraint_terms",
+    "quantities",
+    "format_cues",
+    "examples",
+    "context_terms",
+    "ambiguity_terms",
+    "question_only",
+)
+
+_LIST_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)]|[a-z][.)])\s+", re.MULTILINE | re.IGNORECASE)
+_HEADING_RE = re.compile(r"^\s*(?:#{1,6}\s+\S|[A-Z][A-Za-z /]{2,40}:\s*$)", re.MULTILINE)
+_ROLE_RE = re.compile(r"\b(?:you are|act as|as an? \w+|your role|you will)\b", re.IGNORECASE)
+_CONSTRAINT_RE = re.compile(
+    r"\b(?:must|should|never|always|only|do not|don't|avoid|required?|at (?:most|least)"
+    r"|no more than|exactly|limit|within|ensure)\b",
+    re.IGNORECASE,
+)
+_QUANTITY_RE = re.compile(
+    r"\b\d+\s*(?:words?|sentences?|paragraphs?|characters?|chars|tokens?|items?|bullets?|lines?|points?|steps?)\b",
+    re.IGNORECASE,
+)
+_FORMAT_RE = re.compile(
+    r"\b(?:json|yaml|csv|xml|markdown|table|bullet(?:ed)?|numbered|list|format|schema"
+    r"|headings?|return (?:only|a|an|the)|output)\b",
+    re.IGNORECASE,
+)
+_EXAMPLE_RE = re.compile(r"\b(?:for example|e\.g\.|example|such as|sample)\b", re.IGNORECASE)
+_CONTEXT_RE = re.compile(r"\b(?:audience|context|background|goal|purpose|tone|style|for (?:a|an|my)\b)", re.IGNORECASE)
+_AMBIGUITY_RE = re.compile(
+    r"\b(?:something|stuff|things?|etc|whatever|some|maybe|kind of|sort of|good|nice|better"
+    r"|a bit|somehow|anything|various|appropriate)\b",
+    re.IGNORECASE,
+)
+
+# Hand-tuned starting weights, not fitted on data; fitted weights from
+# `python -m app.services.triage logs.jsonl --fit` replace them via TRIAGE_WEIGHTS_PATH.
+DEFAULT_WEIGHTS: dict[str, tuple[float, ...]] = {
+    #              bias  log_len lines  lists  head   role   cons   qty    fmt    ex     ctx    amb    q_only
+    "clarity":     (-0.6, 0.55,  0.20,  0.35,  0.30,  0.45,  0.40,  0.50,  0.45,  0.40,  0.55, -0.90, -0.45),
+    "structure":   (-1.3, 0.35,  0.70,  1.40,  1.10,  0.35,  0.20,  0.25,  0.70,  0.35,  0.20, -0.35, -0.50),
+    "constraints": (-1.5, 0.30,  0.15,  0.30,  0.15,  0.20,  1.30,  1.10,  0.80,  0.30,  0.35, -0.55, -0.40),
+}
+
+
+def _saturate(count: int, scale: float) -> float:
+    """Map a non-negative count into 0..1 with diminishing returns"""
+    return 1.0 - math.exp(-count / scale)
+
+
+def extract_features(prompt: str) -> list[float]:
+    """Compute the triage feature vector for a single prompt"""
+    text = prompt.strip()
+    words = max(1, len(text.split()))
+    lines = [line for line in text.splitlines() if line.strip()]
+    is_question = text.endswith("?") and len(lines) <= 1
+
+    return [
+        1.0,
+        min(1.0, math.log10(words) / 3.0),
+        _saturate(max(0, len(lines) - 1), 4.0),
+        _saturate(len(_LIST_RE.findall(text)), 3.0),
+        _saturate(len(_HEADING_RE.findall(text)), 2.0),
+        _saturate(len(_ROLE_RE.findall(text)), 1.0),
+        _saturate(len(_CONSTRAINT_RE.findall(text)), 3.0),
+        _saturate(len(_QUANTITY_RE.findall(text)), 1.0),
+        _saturate(len(_FORMAT_RE.findall(text)), 2.0),
+        _saturate(len(_EXAMPLE_RE.findall(text)), 1.0),
+        _saturate(len(_CONTEXT_RE.findall(text)), 2.0),
+        _saturate(len(_AMBIGUITY_RE.findall(text)) * 10 / words, 0.5),
+        1.0 if is_question else 0.0,
+    ]
+
+
+def _sigmoid(x: float) -> float:
+    if x < -30:
+        return 0.0
+    if x > 30:
+        return 1.0
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+@dataclass
+class TriageScore:
+    """Local triage output with the model's confidence in its decision"""
+    result: SmartQueueData
+    confidence: float
+
+
+class TriageClassifier:
+    """CPU-only linear triage model producing SmartQueueData"""
+
+    def __init__(
+        self,
+        weights: Optional[dict[str, Sequence[float]]] = None,
+        optimization_threshold: float = 0.7,
+        confidence_margin: float = 0.15,
+    ):
+        self.weights = {axis: list((weights or DEFAULT_WEIGHTS)[axis]) for axis in AXES}
+        self.optimization_threshold = optimization_threshold
+        self.confidence_margin = confidence_margin
+
+    def _scores_from_features(self, features: Sequence[float]) -> tuple[float, float, float]:
+        return tuple(
+            _sigmoid(sum(w * f for w, f in zip(self.weights[axis], features)))
+            for axis in AXES
+        )
+
+    def _build(self, scores: Sequence[float]) -> TriageScore:
+        clarity, structure, constraints = (round(s, 3) for s in scores)
+        mean = (clarity + structure + constraints) / 3
+        needs_optimization = mean < self.optimization_threshold
+        confidence = min(1.0, abs(mean - self.optimization_threshold) / self.confidence_margin)
+
+        weakest = min(zip(scores, AXES))[1]
+        if needs_optimization:
+            comment = f"[local triage] Weakest axis: {weakest}; optimization recommended."
+        else:
+            comment = "[local triage] Prompt is already well-specified."
+
+        return TriageScore(
+            result=SmartQueueData(
+                clarity=clarity,
+                structure=structure,
+                constraints=constraints,
+                needs_optimization=needs_optimization,
+                comment=comment,
+                source="local",
+            ),
+            confidence=round(confidence, 3),
+        )
+
+    def score(self, prompt: str) -> TriageScore:
+        """Score a single prompt"""
+        return self._build(self._scores_from_features(extract_features(prompt)))
+
+    def score_batch(self, prompts: Iterable[str]) -> list[TriageScore]:
+        """
+        Score many prompts at once.
+
+        Features are extracted into a matrix first and each axis is scored row
+        by row over it; the cost per prompt is dominated by the regex scans.
+        """
+        matrix = [extract_features(p) for p in prompts]
+        columns = {
+            axis: [_sigmoid(sum(w * f for w, f in zip(self.weights[axis], row))) for row in matrix]
+            for axis in AXES
+        }
+        return [
+            self._build((columns["clarity"][i], columns["structure"][i], columns["constraints"][i]))
+            for i in range(len(matrix))
+        ]
+
+    def fit(
+        self,
+        prompts: Sequence[str],
+        targets: Sequence[dict[str, float]],
+        epochs: int = 300,
+        learning_rate: float = 0.5,
+        l2: float = 1e-3,
+    ) -> None:
+        """
+        Refit the weights on logged LLM scores.
+
+        Each target is a dict with "clarity", "structure" and "constraints" in 0..1;
+        every axis is trained as a logistic regression with soft labels.
+        """
+        if not prompts:
+            raise ValueError("Cannot fit triage model on an empty dataset")
+
+        matrix = [extract_features(p) for p in prompts]
+        n = len(matrix)
+        for axis in AXES:
+            w = self.weights[axis]
+            ys = [float(t[axis]) for t in targets]
+            for _ in range(epochs):
+                grad = [0.0] * len(w)
+                for row, y in zip(matrix, ys):
+                    err = _sigmoid(sum(wi * f for wi, f in zip(w, row))) - y
+                    for j, f in enumerate(row):
+                        grad[j] += err * f
+                w = [wi - learning_rate * (g / n + l2 * wi) for wi, g in zip(w, grad)]
+            self.weights[axis] = w
+
+
+def load_weights(path: Optional[str]) -> Optional[dict[str, list[float]]]:
+    """
+    Fitted weights saved by --fit, or None when there is no file. A file for
+    another feature set or a broken one is ignored with a warning.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("features") != list(FEATURE_NAMES):
+            raise ValueError("fitted for a different feature set")
+        weights = {axis: [float(w) for w in data["weights"][axis]] for axis in AXES}
+        if any(len(w) != len(FEATURE_NAMES) for w in weights.values()):
+            raise ValueError("wrong number of weights")
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        warnings.warn(f"Ignoring triage weights {path}: {e}; using the built-in defaults")
+        return None
+    return weights
+
+
+def save_weights(classifier: TriageClassifier, path: str, samples: int) -> None:
+    """Write fitted weights where load_weights() (TRIAGE_WEIGHTS_PATH) picks them up"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"features": list(FEATURE_NAMES), "samples": samples, "weights": classifier.weights}, f, indent=2)
+    os.replace(tmp, path)
+
+
+def split_holdout(
+    prompts: Sequence[str],
+    targets: Sequence[dict],
+    fraction: float = 0.2,
+    seed: int = 0,
+) -> tuple[tuple[list[str], list[dict]], tuple[list[str], list[dict]]]:
+    """Shuffled (train, held-out) split, so calibration is not measured on the fitting data"""
+    order = list(range(len(prompts)))
+    random.Random(seed).shuffle(order)
+    cut = len(order) - max(1, round(len(order) * fraction))
+    if cut < 1:
+        raise ValueError("Need at least two logged prompts to hold some out")
+    train, held_out = order[:cut], order[cut:]
+    return ([prompts[i] for i in train], [targets[i] for i in train]), ([prompts[i] for i in held_out], [targets[i] for i in held_out])
+
+
+def load_logged_scores(path: str) -> tuple[list[str], list[dict]]:
+    """
+    Read logged LLM smart_queue results from a JSONL file.
+
+    Each line must contain "prompt" plus the LLM's "clarity", "structure",
+    "constraints" and "needs_optimization" fields.
+    """
+    prompts, targets = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            prompts.append(row["prompt"])
+            targets.append(row)
+    return prompts, targets
+
+
+def calibration_report(
+    classifier: TriageClassifier,
+    prompts: Sequence[str],
+    llm_scores: Sequence[dict],
+    bins: int = 5,
+    escalation_threshold: Optional[float] = None,
+) -> dict:
+    """
+    Compare local triage against logged LLM scores.
+
+    Reports per-axis mean absolute error, agreement on needs_optimization,
+    agreement among the prompts that would not be escalated (confidence at or
+    above escalation_threshold, TRIAGE_CONFIDENCE_THRESHOLD by default), and a
+    reliability table of agreement per confidence bin.
+    """
+    if not prompts:
+        raise ValueError("Calibration requires at least one logged prompt")
+
+    scored = classifier.score_batch(prompts)
+    mae = {
+        axis: sum(abs(getattr(s.result, axis) - float(t[axis])) for s, t in zip(scored, llm_scores)) / len(scored)
+        for axis in AXES
+    }
+    agree = [s.result.needs_optimization == bool(t["needs_optimization"]) for s, t in zip(scored, llm_scores)]
+    if escalation_threshold is None:
+        escalation_threshold = settings.TRIAGE_CONFIDENCE_THRESHOLD
+    kept = [a for s, a in zip(scored, agree) if s.confidence >= escalation_threshold]
+
+    table = []
+    for b in range(bins):
+        lo, hi = b / bins, (b + 1) / bins
+        idx = [
+            i for i, s in enumerate(scored)
+            if lo <= s.confidence < hi or (b == bins - 1 and s.confidence == 1.0)
+        ]
+        table.append({
+            "confidence_range": [round(lo, 2), round(hi, 2)],
+            "count": len(idx),
+            "agreement": round(sum(agree[i] for i in idx) / len(idx), 3) if idx else None,
+        })
+
+    return {
+        "samples": len(scored),
+        "mae": {axis: round(v, 4) for axis, v in mae.items()},
+        "decision_agreement": round(sum(agree) / len(agree), 4),
+        "not_escalated": {
+            "escalation_threshold": escalation_threshold,
+            "count": len(kept),
+            "share": round(len(kept) / len(scored), 4),
+            "agreement": round(sum(kept) / len(kept), 4) if kept else None,
+        },
+        "reliability": table,
+    }
+
+
+triage_classifier = TriageClassifier(load_weights(settings.TRIAGE_WEIGHTS_PATH))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Calibrate local Smart Queue triage against logged LLM scores")
+    parser.add_argument("logs", help="JSONL file with prompt + LLM smart_queue scores")
+    parser.add_argument("--fit", action="store_true", help="Refit the default weights on the logs and save them")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Share of the logs kept out of fitting for the report")
+    parser.add_argument("--seed", type=int, default=0, help="Shuffle seed of the held-out split")
+    parser.add_argument("--save", default=settings.TRIAGE_WEIGHTS_PATH, help="Where --fit writes the weights")
+    args = parser.parse_args()
+
+    log_prompts, log_targets = load_logged_scores(args.logs)
+    if args.fit:
+        (train_prompts, train_targets), (log_prompts, log_targets) = split_holdout(log_prompts, log_targets, args.holdout, args.seed)
+        clf = TriageClassifier()
+        clf.fit(train_prompts, train_targets)
+        save_weights(clf, args.save, len(train_prompts))
+        print(f"fitted on {len(train_prompts)} prompts, saved to {args.save}; report on {len(log_prompts)} held out")
+    else:
+        clf = triage_classifier
+    print(json.dumps(calibration_report(clf, log_prompts, log_targets), indent=2))
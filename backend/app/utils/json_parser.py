@@ -48,6 +48,37 @@ def safe_json_from_llm(raw: str) -> Optional[dict[str, Any]]:
     return None
 
 
+def safe_json_array_from_llm(raw: str) -> Optional[list[Any]]:
+    """
+    Extract a JSON array from LLM response (batched calls).
+    Tries direct json.loads, ```json...``` blocks, then first [ to last ].
+    """
+    if raw is None:
+        return None
+
+    candidates = [raw]
+    if "```" in raw:
+        for part in raw.split("```"):
+            seg = part.strip()
+            if seg.lower().startswith("json"):
+                seg = seg[4:].strip()
+            if seg.startswith("["):
+                candidates.append(seg)
+    start = raw.find("[")
+    end = raw.rfind("]")
+    if start != -1 and end > start:
+        candidates.append(raw[start : end + 1])
+
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+        except Exception:
+            continue
+        if isinstance(data, list):
+            return data
+    return None
+
+
 def approximate_length(text: str) -> int:
     """Rough estimate of text length by word count"""
     return max(1, len(text.split()))
@@ -0,0 +1,74 @@
+import gzip
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from ..config import settings
+from .sse import dumps
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is used without it
+    brotli = None
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best supported Content-Encoding for an Accept-Encoding header (br, then gzip)"""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                continue
+        if name:
+            accepted[name.lower()] = q
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0)
+
+
+class PydanticJSONResponse(JSONResponse):
+    """
+    JSON response that serializes Pydantic models with their compiled
+    serializer (no jsonable_encoder pass) and everything else with the fast
+    encoder. Returning it from a route also skips FastAPI's second
+    response_model validation; the model is validated once when built.
+
+    `exclude` drops model fields from the output; with `encoding` (from
+    negotiate_encoding) bodies of RESPONSE_COMPRESS_MIN_BYTES or more are
+    compressed, in the worker thread that builds the response.
+    """
+
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        exclude: Optional[set[str]] = None,
+        encoding: Optional[str] = None,
+        **kwargs,
+    ):
+        self.exclude = exclude
+        super().__init__(content, status_code, **kwargs)
+        if encoding is not None and len(self.body) >= settings.RESPONSE_COMPRESS_MIN_BYTES:
+            self.body = compress_body(self.body, encoding)
+            self.headers["Content-Encoding"] = encoding
+            self.headers["Content-Length"] = str(len(self.body))
+            self.headers["Vary"] = "Accept-Encoding"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.model_dump_json(exclude=self.exclude).encode("utf-8")
+        return dumps(content).encode("utf-8")
@@ -0,0 +1,161 @@
+import difflib
+import json
+import re
+import zlib
+from typing import Any, AsyncIterator, Callable, Iterator, Optional, Union
+
+from starlette.concurrency import iterate_in_threadpool
+
+try:
+    import orjson
+except ImportError:  # optional fast encoder
+    orjson = None
+
+
+# Payload fields that carry prompt texts: in "delta" mode each is diffed against
+# the previous one in the stream (critiques are not prompts and are sent in full)
+TEXT_FIELDS = ("output", "proposed_prompt", "final_prompt")
+
+_TOKEN_RE = re.compile(r"\S+\s*|\s+")
+
+
+def dumps(payload: Any) -> str:
+    """Serialize to compact JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(payload).decode("utf-8")
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def _units(text: str) -> int:
+    """Length in UTF-16 code units, as JavaScript strings count (and slice) it"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def text_delta(base: str, new: str) -> list:
+    """
+    Diff new against base as a list of ops applied left to right:
+    [n] keeps n chars of base, [-n] skips n chars of base, "text" inserts text.
+    Counts are UTF-16 code units so the browser can apply them with slice().
+    The diff runs on word/whitespace tokens so it stays fast on multi-KB prompts.
+    """
+    a, b = _TOKEN_RE.findall(base), _TOKEN_RE.findall(new)
+    ops: list = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append(sum(_units(t) for t in a[i1:i2]))
+            continue
+        if i2 > i1:
+            ops.append(-sum(_units(t) for t in a[i1:i2]))
+        if j2 > j1:
+            ops.append("".join(b[j1:j2]))
+    return ops
+
+
+def apply_delta(base: str, ops: list) -> str:
+    """Rebuild a text from its base and text_delta() ops"""
+    encoded = base.encode("utf-16-le")
+    out, pos = [], 0
+    for op in ops:
+        if isinstance(op, str):
+            out.append(op)
+        elif op >= 0:
+            out.append(encoded[2 * pos : 2 * (pos + op)].decode("utf-16-le"))
+            pos += op
+        else:
+            pos -= op
+    return "".join(out)
+
+
+class SSEEncoder:
+    """
+    Encodes pipeline events as Server-Sent Events.
+
+    Every event carries an incrementing id. In "delta" mode prompt text
+    fields are replaced by "<field>_delta" ops against the previous prompt
+    text in the stream, when that is smaller than the full text. With compress=True the stream is
+    gzip-encoded and flushed after every event.
+    """
+
+    def __init__(self, mode: str = "full", compress: bool = False):
+        self.mode = mode
+        self.compress = compress
+        self.last_id = 0
+        self._last_text: Optional[str] = None
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def headers(self) -> dict[str, str]:
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        if self.compress:
+            headers["Content-Encoding"] = "gzip"
+        return headers
+
+    def _encode_texts(self, data: dict) -> dict:
+        out = {}
+        for key, value in data.items():
+            if key in TEXT_FIELDS and isinstance(value, str):
+                if self.mode == "delta" and self._last_text is not None:
+                    ops = text_delta(self._last_text, value)
+                    if len(dumps(ops)) < len(value):
+                        out[f"{key}_delta"] = ops
+                        self._last_text = value
+                        continue
+                self._last_text = value
+            out[key] = value
+        return out
+
+    def encode(self, event: dict, event_id: Optional[int] = None) -> str:
+        """Render one event as an SSE frame; ids count up unless given"""
+        self.last_id = self.last_id + 1 if event_id is None else event_id
+        if self.mode == "delta":
+            event = self._encode_texts(event)
+            if isinstance(event.get("data"), dict):
+                event["data"] = self._encode_texts(event["data"])
+        return f"id: {self.last_id}\ndata: {dumps(event)}\n\n"
+
+    def event(self, event: dict, event_id: Optional[int] = None) -> Union[str, bytes]:
+        frame = self.encode(event, event_id)
+        if self._compressor is None:
+            return frame
+        return self._compressor.compress(frame.encode("utf-8")) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush() if self._compressor is not None else b""
+
+    async def wrap(
+        self,
+        events: Union[Iterator[dict], AsyncIterator[dict]],
+        on_disconnect: Optional[Callable[[], None]] = None,
+    ) -> AsyncIterator[Union[str, bytes]]:
+        """
+        Encode a stream of event dicts; blocking iterators run in the threadpool.
+        on_disconnect is called if the stream is torn down before it finishes,
+        and a suspended source generator is closed right away.
+        """
+        source = events
+        if not hasattr(events, "__aiter__"):
+            events = iterate_in_threadpool(events)
+        finished = False
+        try:
+            async for event in events:
+                yield self.event(event)
+            finished = True
+        finally:
+            if not finished:
+                if on_disconnect is not None:
+                    on_disconnect()
+                if hasattr(source, "close") and not hasattr(source, "__aiter__"):
+                    try:
+                        source.close()
+                    except ValueError:
+                        pass  # still running in the threadpool; it stops via on_disconnect
+        tail = self.finish()
+        if tail:
+            yield tail
+
+    async def wrap_numbered(self, events: AsyncIterator[tuple[int, dict]]) -> AsyncIterator[Union[str, bytes]]:
+        """Encode (event_id, event) pairs, e.g. a replayed RunStream subscription"""
+        async for event_id, event in events:
+            yield self.event(event, event_id)
+        tail = self.finish()
+        if tail:
+            yield tail
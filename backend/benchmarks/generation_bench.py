@@ -0,0 +1,99 @@
+"""
+Per-stage latency of the generation parameters.
+
+Runs the pipeline stages (LLM Smart Queue, proposer, critic, verifier, D, S,
+pairwise evaluation) over a prompt corpus twice per repeat: with the
+per-stage generation parameters of the STAGE_* settings, and with none
+(every backend default). Reports per stage the median latency and mean
+completion tokens of both, and the latency change.
+
+By default the stages go to benchmarks.stub_llm_server, which honours
+max_tokens and simulates a thinking model (--thinking-tokens hidden tokens
+per answer unless thinking is turned off); its numbers show the mechanics,
+not a real model's trade-off. With --backend gemini or grok the stages go to
+the real provider, with the keys and models of the environment.
+
+Usage (from backend/):
+    python -m benchmarks.generation_bench [--backend stub] [--repeat 3] [--thinking-tokens 800]
+    STAGE_THINKING_BUDGET="*=0" python -m benchmarks.generation_bench --backend gemini --repeat 2
+"""
+import argparse
+import socket
+import statistics
+import threading
+from collections import defaultdict
+
+from app.config import settings
+from app.services.llm_provider import get_llm_provider, stage_generation
+from app.services.optimizer import PromptOptimizer
+from benchmarks.pipeline_bench import CORPUS
+from benchmarks.stub_llm_server import serve
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_stages(optimizer: PromptOptimizer, prompt: str) -> None:
+    """One pass over every stage, each fed by the previous one like in a run"""
+    optimizer.llm_smart_queue(prompt)
+    proposed = optimizer.proposer_step(prompt)
+    critique = optimizer.critic_step(proposed)
+    verified = optimizer.verifier_step(prompt, proposed, critique)
+    expanded = optimizer.d_block(verified)
+    final = optimizer.s_block(expanded)
+    optimizer.pairwise_eval(prompt, final)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", choices=["stub", "gemini", "grok", "openai_compat"], default="stub")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the corpus per variant")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="Stub decoding speed")
+    parser.add_argument("--thinking-tokens", type=int, default=800, help="Stub hidden tokens per answer")
+    args = parser.parse_args()
+
+    backend = args.backend
+    if backend == "stub":
+        port = _free_port()
+        serve(port, args.latency, args.tokens_per_second, background=True, thinking_tokens=args.thinking_tokens)
+        settings.OPENAI_COMPAT_BASE_URLS = f"http://127.0.0.1:{port}/v1"
+        backend = "openai_compat"
+    # One call per request, so latencies are the model's and not a batch window's
+    settings.MICRO_BATCH_ENABLED = False
+
+    variants = {"tuned": stage_generation(), "default": {}}
+    samples: dict[str, dict[str, list[dict]]] = {name: defaultdict(list) for name in variants}
+    for _ in range(args.repeat):
+        for prompt in CORPUS:
+            for name, generation in variants.items():
+                # A cancel event makes calls stream, as they do in the pipeline
+                optimizer = PromptOptimizer(get_llm_provider(backend), threading.Event(), generation=generation)
+                run_stages(optimizer, prompt)
+                for entry in optimizer.stage_metrics:
+                    samples[name][entry["stage"]].append(entry)
+
+    print(f"backend: {args.backend}, {args.repeat} x {len(CORPUS)} prompts per variant")
+    print(f"{'stage':<15}{'tuned s':>9}{'default s':>11}{'change':>9}{'tuned tok':>11}{'default tok':>13}")
+    totals = {name: 0.0 for name in variants}
+    for stage in samples["default"]:
+        row = {}
+        for name in variants:
+            entries = samples[name][stage]
+            row[name] = (
+                statistics.median(e["seconds"] for e in entries),
+                statistics.mean(e["completion_tokens"] for e in entries),
+            )
+            totals[name] += statistics.mean(e["seconds"] for e in entries)
+        change = row["tuned"][0] / row["default"][0] - 1 if row["default"][0] else 0.0
+        print(f"{stage:<15}{row['tuned'][0]:>9.3f}{row['default'][0]:>11.3f}{change:>+9.0%}"
+              f"{row['tuned'][1]:>11.0f}{row['default'][1]:>13.0f}")
+    print(f"{'all stages':<15}{totals['tuned']:>9.3f}{totals['default']:>11.3f}"
+          f"{totals['tuned'] / totals['default'] - 1:>+9.0%}  (mean seconds per pass)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Cost/quality benchmark of pipeline configurations.
+
+Runs a prompt corpus through every combination of max_iterations,
+convergence_threshold, D/S strategy, Smart Queue mode and model set, and reports for each
+configuration the mean LLM calls, tokens and wall time per prompt against
+the mean pairwise-evaluation score, marking the Pareto frontier of the
+chosen cost axis. With --target it names the cheapest configuration that
+reaches that score.
+
+Providers are served as backend="openai_compat" by benchmarks.stub_llm_server:
+    stub    deterministic stand-in; scores are constant, only the cost axes mean anything
+    replay  answers recorded in --cassette; a call missing from it fails the prompt
+    record  like replay, fetching and recording missing answers from the real providers
+The judge (pairwise_eval) is pinned to --judge in every configuration, and its
+call is not counted as cost, so scores and costs compare across configurations.
+
+Usage (from backend/):
+    python -m benchmarks.pipeline_bench [--iterations 1,2,3,6] [--thresholds 0.02,0.05,0.1]
+        [--strategies sequential,fanout] [--modes local,hybrid] [--models flash=gemini:gemini-2.5-flash] [--corpus prompts.jsonl]
+        [--provider stub|replay|record] [--cassette calls.jsonl] [--cost calls] [--target 0.5]
+"""
+import argparse
+import itertools
+import json
+import socket
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import settings
+from app.models.schemas import OptimizeRequest
+from app.services.history import evaluation_score
+from app.services.llm_provider import PIPELINE_STAGES, parse_stage_models
+from app.services.metrics import metrics
+from app.services.pipeline import run_to_completion
+from benchmarks.stub_llm_server import Cassette, serve
+
+
+CORPUS = [
+    "Write a poem about the sea.",
+    "Summarize this article for a busy executive.",
+    "Explain recursion to a ten year old, with one example in Python.",
+    "You are a support agent. Answer customer questions about refunds politely and point to the policy page when relevant.",
+    "Generate 5 product names for an eco-friendly water bottle brand aimed at hikers, with a one-line tagline each.",
+    "Review the following pull request for security issues, performance problems and style violations, "
+    "and output a prioritized list of findings with file and line references.",
+]
+
+COST_AXES = ("calls", "tokens", "seconds")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def load_corpus(path: str) -> list[str]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["prompt"] for line in f if line.strip()]
+
+
+def parse_models(items: list[str], judge: str) -> dict[str, dict[str, str]]:
+    """
+    "name=backend:model[,stage=backend:model...]" into per-stage models: the
+    first model serves every stage, the pairs override single stages.
+    """
+    sets = {}
+    for item in items:
+        name, _, spec = item.partition("=")
+        default, _, overrides = spec.partition(",")
+        stages = {stage: default for stage in PIPELINE_STAGES}
+        stages.update({
+            stage: f"{backend}:{model}" if backend else model
+            for stage, (backend, model) in parse_stage_models(overrides).items()
+        })
+        stages["pairwise_eval"] = judge
+        # Every stage goes to the stub server, which sees the model name
+        sets[name] = {stage: f"openai_compat:{model}" for stage, model in stages.items()}
+    return sets
+
+
+def call_totals() -> dict[str, float]:
+    """Calls, tokens and model seconds so far, without the judge's evaluation calls"""
+    totals = {"calls": 0, "tokens": 0.0, "model_seconds": 0.0}
+    for entry in metrics.stage_stats():
+        if entry["stage"] == "pairwise_eval":
+            continue
+        totals["calls"] += entry["calls"]
+        totals["tokens"] += entry["calls"] * (entry["avg_prompt_tokens"] + entry["avg_completion_tokens"])
+        totals["model_seconds"] += entry["calls"] * entry["avg_seconds"]
+    return totals
+
+
+def run_config(config: dict, stage_models: dict[str, str], prompts: list[str], concurrency: int) -> dict:
+    """Run the corpus through one configuration; means are per prompt"""
+    settings.SMART_QUEUE_MODE = config["mode"]
+
+    def one(prompt: str) -> tuple[float, dict]:
+        request = OptimizeRequest(
+            prompt=prompt,
+            backend="openai_compat",
+            max_iterations=config["iterations"],
+            convergence_threshold=config["threshold"],
+            ds_strategy=config["strategy"],
+            stage_models=stage_models,
+            similarity_reuse="off",
+            evaluation_sample_rate=1.0,
+        )
+        start = time.perf_counter()
+        try:
+            result = run_to_completion(request, uuid.uuid4().hex)
+        except Exception as e:
+            return time.perf_counter() - start, {"error": str(e)}
+        return time.perf_counter() - start, result
+
+    before = call_totals()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        runs = list(pool.map(one, prompts))
+    after = call_totals()
+
+    done = [(seconds, result) for seconds, result in runs if "error" not in result]
+    scores = [evaluation_score(result["evaluation"]) for _, result in done if result["evaluation"]]
+    n = max(len(done), 1)
+    return {
+        **config,
+        "prompts": len(done),
+        "failed": len(runs) - len(done),
+        "calls": (after["calls"] - before["calls"]) / len(runs),
+        "tokens": (after["tokens"] - before["tokens"]) / len(runs),
+        "seconds": statistics.mean(seconds for seconds, _ in done) if done else 0.0,
+        "iterations_used": statistics.mean(len(result["ds_iterations"]) for _, result in done) if done else 0.0,
+        "converged": sum(result["converged"] for _, result in done) / n,
+        "quality": statistics.mean(scores) if scores else None,
+    }
+
+
+def mark_pareto(rows: list[dict], cost: str) -> None:
+    """Flag rows no other row beats on both cost and quality"""
+    scored = [row for row in rows if row["quality"] is not None]
+    for row in rows:
+        row["pareto"] = row in scored and not any(
+            other[cost] <= row[cost] and other["quality"] >= row["quality"]
+            and (other[cost] < row[cost] or other["quality"] > row["quality"])
+            for other in scored
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", default="1,2,3,6", help="max_iterations values")
+    parser.add_argument("--thresholds", default="0.02,0.05,0.1", help="convergence_threshold values")
+    parser.add_argument("--strategies", default="sequential,fanout", help="ds_strategy values")
+    parser.add_argument("--modes", default="local", help="SMART_QUEUE_MODE values")
+    parser.add_argument("--models", nargs="+", default=["default=gemini:gemini-2.5-flash"],
+                        help="Model sets: name=backend:model[,stage=backend:model...]")
+    parser.add_argument("--judge", default="gemini:gemini-2.5-flash", help="Model of the pairwise evaluation")
+    parser.add_argument("--corpus", help="JSONL with a \"prompt\" per line (default: built-in prompts)")
+    parser.add_argument("--provider", choices=["stub", "replay", "record"], default="stub")
+    parser.add_argument("--cassette", default="data/bench_cassette.jsonl")
+    parser.add_argument("--latency", type=float, default=0.02, help="Stub latency per call (stub provider)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Factor on recorded latencies (replay)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Prompts run at once per configuration")
+    parser.add_argument("--cost", choices=COST_AXES, default="calls", help="Cost axis of the frontier")
+    parser.add_argument("--target", type=float, help="Quality to reach at the lowest cost")
+    parser.add_argument("--json", help="Also write the rows to this file")
+    args = parser.parse_args()
+
+    cassette = None
+    if args.provider != "stub":
+        cassette = Cassette(args.cassette, record=args.provider == "record", latency_scale=args.latency_scale)
+    port = _free_port()
+    serve(port, latency=args.latency, tokens_per_second=1e6, background=True, cassette=cassette)
+    settings.OPENAI_COMPAT_BASE_URLS = f"http://127.0.0.1:{port}/v1"
+    settings.OPENAI_COMPAT_MAX_CONCURRENCY = max(settings.OPENAI_COMPAT_MAX_CONCURRENCY, args.concurrency * 2)
+    settings.HISTORY_ENABLED = False
+    settings.DEDUP_ENABLED = False
+    settings.CHECKPOINT_ENABLED = False
+
+    prompts = load_corpus(args.corpus) if args.corpus else CORPUS
+    model_sets = parse_models(args.models, args.judge)
+    grid = [
+        {"iterations": iterations, "threshold": threshold, "strategy": strategy, "mode": mode, "models": name}
+        for iterations, threshold, strategy, mode, name in itertools.product(
+            [int(v) for v in args.iterations.split(",")],
+            [float(v) for v in args.thresholds.split(",")],
+            args.strategies.split(","),
+            args.modes.split(","),
+            model_sets,
+        )
+    ]
+
+    print(f"{len(grid)} configurations x {len(prompts)} prompts, provider: {args.provider}")
+    rows = []
+    for config in grid:
+        rows.append(run_config(config, model_sets[config["models"]], prompts, args.concurrency))
+    mark_pareto(rows, args.cost)
+
+    print()
+    print(f"{'iters':>5}{'thresh':>8}  {'strategy':<11}{'mode':<8}{'models':<12}{'calls':>7}{'tokens':>9}{'seconds':>9}"
+          f"{'iters used':>11}{'conv':>6}{'quality':>9}{'fail':>6}  pareto")
+    for row in sorted(rows, key=lambda r: (r[args.cost], -(r["quality"] or 0))):
+        quality = f"{row['quality']:.3f}" if row["quality"] is not None else "-"
+        print(f"{row['iterations']:>5}{row['threshold']:>8.2f}  {row['strategy']:<11}{row['mode']:<8}{row['models']:<12}"
+              f"{row['calls']:>7.1f}{row['tokens']:>9.0f}{row['seconds']:>9.2f}{row['iterations_used']:>11.1f}"
+              f"{row['converged']:>6.0%}{quality:>9}{row['failed']:>6}  {'*' if row['pareto'] else ''}")
+
+    if args.target is not None:
+        reaching = [r for r in rows if r["quality"] is not None and r["quality"] >= args.target]
+        if reaching:
+            best = min(reaching, key=lambda r: (r[args.cost], -r["quality"]))
+            print(f"\ncheapest by {args.cost} with quality >= {args.target}: "
+                  f"iterations={best['iterations']} threshold={best['threshold']} strategy={best['strategy']} mode={best['mode']} models={best['models']} "
+                  f"({best[args.cost]:.1f} {args.cost}/prompt, quality {best['quality']:.3f})")
+        else:
+            print(f"\nno configuration reaches quality {args.target}")
+    if cassette is not None and cassette.misses:
+        print(f"\n{cassette.misses} calls were missing from {args.cassette}; record them with --provider record")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
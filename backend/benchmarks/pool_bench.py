@@ -0,0 +1,103 @@
+"""
+Provider pool behaviour under saturation and rate limiting.
+
+Runs a burst of concurrent calls through a PooledProvider over simulated
+members (each call sleeps --latency seconds; no network) and checks that:
+  - a single key with more calls in flight than POOL_MAX_OUTSTANDING queues
+    the extra calls instead of failing them;
+  - a single key quarantined by a 429 holds calls until the quarantine ends,
+    and calls whose deadline ends first fail with DeadlineExceeded.
+Prints the wall time of each scenario.
+
+Usage (from backend/):
+    python -m benchmarks.pool_bench [--calls 12] [--latency 0.1]
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import settings
+from app.services import provider_pool
+from app.services.llm_provider import DeadlineExceeded, LLMProvider
+from app.services.provider_pool import PoolMember, PooledProvider, ProviderPool
+
+
+class RateLimited(Exception):
+    """Stand-in for an HTTP 429 error (carries response.status_code)"""
+
+    class _Response:
+        status_code = 429
+
+    response = _Response()
+
+
+class SimulatedProvider(LLMProvider):
+    """Answers after a fixed latency; the first `fail_first` calls get a 429"""
+
+    latency = 0.1
+    fail_first = 0
+    _lock = threading.Lock()
+
+    def __init__(self, api_key: str, model: str):
+        super().__init__()
+
+    def call(self, system_prompt, user_prompt, cancel=None, timeout=None, params=None) -> str:
+        with SimulatedProvider._lock:
+            fail = SimulatedProvider.fail_first > 0
+            SimulatedProvider.fail_first -= fail
+        if fail:
+            raise RateLimited()
+        time.sleep(SimulatedProvider.latency)
+        self.last_usage = {"prompt_tokens": 1, "completion_tokens": 1}
+        return "ok"
+
+
+def burst(calls: int, timeout=None) -> tuple[float, list]:
+    """Run `calls` concurrent calls on a fresh single-key pool; (seconds, outcomes)"""
+    pool = ProviderPool([PoolMember("gemini", "key-0001", "model")])
+    provider = PooledProvider(pool, "gemini")
+
+    def one(_) -> object:
+        try:
+            return provider.call("system", "user", cancel=threading.Event(), timeout=timeout)
+        except Exception as e:
+            return e
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=calls) as executor:
+        outcomes = list(executor.map(one, range(calls)))
+    return time.perf_counter() - start, outcomes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=0.1, help="Simulated seconds per call")
+    args = parser.parse_args()
+
+    provider_pool.PROVIDER_CLASSES["gemini"] = SimulatedProvider
+    SimulatedProvider.latency = args.latency
+    settings.POOL_MAX_OUTSTANDING = 8
+    settings.POOL_QUARANTINE_SECONDS = 4 * args.latency
+
+    seconds, outcomes = burst(args.calls)
+    assert outcomes == ["ok"] * args.calls, f"saturated key failed calls: {outcomes}"
+    print(f"saturation: {args.calls} calls on 1 key (max {settings.POOL_MAX_OUTSTANDING} in flight) "
+          f"all succeeded in {seconds:.2f}s")
+
+    SimulatedProvider.fail_first = 1
+    seconds, outcomes = burst(args.calls)
+    assert outcomes == ["ok"] * args.calls, f"quarantined key failed calls: {outcomes}"
+    assert seconds >= settings.POOL_QUARANTINE_SECONDS, "calls did not wait out the quarantine"
+    print(f"quarantine: 1 key with a 429 ({settings.POOL_QUARANTINE_SECONDS:.2f}s quarantine), "
+          f"{args.calls} calls all succeeded in {seconds:.2f}s")
+
+    SimulatedProvider.fail_first = 1
+    seconds, outcomes = burst(args.calls, timeout=settings.POOL_QUARANTINE_SECONDS / 2)
+    assert all(isinstance(o, DeadlineExceeded) for o in outcomes), f"expected deadline errors: {outcomes}"
+    print(f"quarantine past the deadline: {args.calls} calls failed with DeadlineExceeded in {seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
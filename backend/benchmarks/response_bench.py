@@ -0,0 +1,162 @@
+"""
+Response serialization benchmark for /optimize.
+
+Compares the previous path (nested Pydantic results, FastAPI response_model
+re-validation, jsonable_encoder and json.dumps) with the current one
+(slotted result dataclasses, a single validation of OptimizeResponse and
+model_dump_json) on a large multi-iteration response, then the body size and
+build+serialize+compress time per verbosity and Content-Encoding.
+
+Usage (from backend/):
+    python -m benchmarks.response_bench [--iterations 6] [--words 800] [--repeat 200]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.models.schemas import (
+    OptimizeResponse,
+    response_exclude,
+    SmartQueueResult,
+    PCVResult,
+    DSIteration,
+    PairwiseEvaluation,
+)
+from app.models.results import SmartQueueData, PCVData, DSIterationData, EvaluationData
+from app.utils import responses
+from app.utils.responses import PydanticJSONResponse
+
+
+def _texts(iterations: int, words: int, seed: int = 3) -> dict:
+    rng = random.Random(seed)
+    vocab = ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(2, 9))) for _ in range(2000)]
+    text = lambda n: " ".join(rng.choices(vocab, k=n))
+    return {
+        "prompt": text(words // 10),
+        "proposed": text(words),
+        "critique": text(words // 3),
+        "verified": text(words),
+        "ds": [(text(words + 150 * i), text(words + 100 * i)) for i in range(1, iterations + 1)],
+    }
+
+
+def _common(t: dict) -> dict:
+    return dict(
+        success=True,
+        run_id="bench",
+        original_prompt=t["prompt"],
+        final_prompt=t["ds"][-1][1],
+        original_length=len(t["prompt"].split()),
+        final_length=len(t["ds"][-1][1].split()),
+        length_change_percent=1234.5,
+        converged=False,
+        convergence_iteration=None,
+        processing_time_seconds=88.8,
+    )
+
+
+def _run_sync(coro):
+    """Drive a coroutine that never suspends, without event loop overhead"""
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+    raise RuntimeError("coroutine suspended")
+
+
+def legacy(t: dict, field) -> bytes:
+    response = OptimizeResponse(
+        smart_queue=SmartQueueResult(clarity=0.4, structure=0.3, constraints=0.2, needs_optimization=True, comment="c"),
+        pcv=PCVResult(proposed_prompt=t["proposed"], critique=t["critique"], final_prompt=t["verified"]),
+        ds_iterations=[
+            DSIteration(iteration=i, d_block_output=d, s_block_output=s, length=len(s.split()), change_rate=0.2)
+            for i, (d, s) in enumerate(t["ds"], 1)
+        ],
+        evaluation=PairwiseEvaluation(clarity=1.0, structure=0.66, constraints=0.33, usefulness=1.0, comment="c"),
+        **_common(t),
+    )
+    content = _run_sync(serialize_response(field=field, response_content=response))
+    return JSONResponse(content).body
+
+
+def current(t: dict) -> bytes:
+    smart_queue = SmartQueueData(0.4, 0.3, 0.2, True, "c")
+    pcv = PCVData(t["proposed"], t["critique"], t["verified"])
+    iterations = [DSIterationData(i, d, s, len(s.split()), 0.2) for i, (d, s) in enumerate(t["ds"], 1)]
+    evaluation = EvaluationData(1.0, 0.66, 0.33, 1.0, "c")
+    response = OptimizeResponse(
+        smart_queue=smart_queue.dict(),
+        pcv=pcv.dict(),
+        ds_iterations=[it.dict() for it in iterations],
+        evaluation=evaluation.dict(),
+        **_common(t),
+    )
+    return PydanticJSONResponse(response).body
+
+
+def projected(t: dict, verbosity: str, encoding) -> bytes:
+    """Current path as /optimize builds it for a verbosity and encoding"""
+    full = verbosity == "full"
+    response = OptimizeResponse(
+        smart_queue=SmartQueueData(0.4, 0.3, 0.2, True, "c").dict(),
+        pcv=PCVData(t["proposed"], t["critique"], t["verified"]).dict() if full else None,
+        ds_iterations=[
+            DSIterationData(i, d, s, len(s.split()), 0.2).dict() for i, (d, s) in enumerate(t["ds"], 1)
+        ] if full else [],
+        evaluation=EvaluationData(1.0, 0.66, 0.33, 1.0, "c").dict(),
+        **_common(t),
+    )
+    return PydanticJSONResponse(response, exclude=response_exclude(verbosity), encoding=encoding).body
+
+
+def _measure(fn, repeat: int) -> tuple[float, int, int]:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    per_call = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_call, peak, len(fn())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=6)
+    parser.add_argument("--words", type=int, default=800)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    t = _texts(args.iterations, args.words)
+    field = create_response_field(name="Response_optimize", type_=OptimizeResponse)
+    results = {
+        "legacy": _measure(lambda: legacy(t, field), args.repeat),
+        "current": _measure(lambda: current(t), args.repeat),
+    }
+
+    print(f"{args.iterations} D/S iterations, ~{args.words} words per stage text")
+    print(f"{'path':<10}{'ms/response':>13}{'peak alloc KB':>15}{'body KB':>10}")
+    for name, (per_call, peak, size) in results.items():
+        print(f"{name:<10}{per_call * 1000:>13.3f}{peak / 1024:>15.1f}{size / 1024:>10.1f}")
+    speedup = results["legacy"][0] / results["current"][0]
+    print(f"speedup: {speedup:.1f}x, peak allocation: {results['current'][1] / results['legacy'][1]:.0%} of legacy")
+
+    encodings = [None, "gzip"] + (["br"] if responses.brotli is not None else [])
+    print()
+    print(f"{'verbosity':<10}{'encoding':<10}{'ms/response':>13}{'body KB':>10}")
+    for verbosity in ("full", "summary", "final"):
+        for encoding in encodings:
+            per_call, _, size = _measure(lambda: projected(t, verbosity, encoding), args.repeat)
+            print(f"{verbosity:<10}{encoding or 'identity':<10}{per_call * 1000:>13.3f}{size / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+SSE payload benchmark: legacy format vs protocol v2 (full / delta / gzip).
+
+Replays the event sequence of a 6-iteration optimization with realistic
+prompt growth and reports bytes on the wire and serialization time per event.
+
+Usage (from backend/):
+    python -m benchmarks.sse_bench [--iterations 6] [--words 600] [--repeat 20]
+"""
+import argparse
+import json
+import random
+import time
+
+from app.utils.sse import TEXT_FIELDS, SSEEncoder, apply_delta, orjson
+
+
+def _vocabulary(seed: int) -> list[str]:
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choices(letters, k=rng.randint(2, 9))) for _ in range(3000)]
+
+
+def _edit(rng: random.Random, words: list[str], vocab: list[str], grow: int) -> list[str]:
+    """Mimic a D or S block: rewrite a few spans and append new material"""
+    words = list(words)
+    for _ in range(max(1, len(words) // 40)):
+        i = rng.randrange(len(words))
+        words[i : i + 3] = rng.choices(vocab, k=rng.randint(1, 5))
+    return words + rng.choices(vocab, k=grow)
+
+
+def build_events(iterations: int, words: int, seed: int = 7) -> list[dict]:
+    rng = random.Random(seed)
+    vocab = _vocabulary(seed)
+    prompt = rng.choices(vocab, k=words // 10)
+    text = rng.choices(vocab, k=words)
+    events = [
+        {"stage": "init", "message": "Initializing LLM provider..."},
+        {"stage": "pcv_proposer", "status": "complete", "data": {"proposed_prompt": " ".join(text)}},
+        {"stage": "pcv_critic", "status": "complete", "data": {"critique": " ".join(rng.choices(vocab, k=words // 4))}},
+    ]
+    text = _edit(rng, text, vocab, words // 10)
+    events.append({"stage": "pcv_verifier", "status": "complete", "data": {"final_prompt": " ".join(text)}})
+    for i in range(1, iterations + 1):
+        text = _edit(rng, text, vocab, words // 5)
+        events.append({"stage": f"ds_iteration_{i}_d", "status": "running", "message": "Diversification..."})
+        events.append({"stage": f"ds_iteration_{i}_d", "status": "complete", "data": {"output": " ".join(text)}})
+        text = _edit(rng, text, vocab, -(words // 6) or 0)[: len(text) - words // 6]
+        events.append({"stage": f"ds_iteration_{i}_s", "status": "running", "message": "Stabilization..."})
+        events.append({"stage": f"ds_iteration_{i}_s", "status": "complete", "data": {"output": " ".join(text), "iteration": i}})
+    events.append({"stage": "complete", "data": {"final_prompt": " ".join(text), "original_length": len(prompt)}})
+    return events
+
+
+def legacy_stream(events: list[dict]) -> list[str]:
+    return [f"data: {json.dumps(e)}\n\n" for e in events]
+
+
+def v2_stream(events: list[dict], mode: str, compress: bool) -> list:
+    encoder = SSEEncoder(mode=mode, compress=compress)
+    frames = [encoder.event(dict(e, data=dict(e["data"])) if "data" in e else dict(e)) for e in events]
+    tail = encoder.finish()
+    return frames + ([tail] if tail else [])
+
+
+def _size(frames: list) -> int:
+    return sum(len(f.encode("utf-8")) if isinstance(f, str) else len(f) for f in frames)
+
+
+def _check_delta_roundtrip(events: list[dict]) -> None:
+    encoder = SSEEncoder(mode="delta")
+    last = None
+    for e in events:
+        frame = json.loads(encoder.encode(dict(e, data=dict(e["data"])) if "data" in e else dict(e)).split("data: ", 1)[1])
+        for payload in (frame, frame.get("data") or {}):
+            for key, value in payload.items():
+                if key.endswith("_delta"):
+                    last = apply_delta(last, value)
+                    original = (e.get("data") or e)[key[: -len("_delta")]]
+                    assert last == original, f"delta mismatch in {e['stage']}"
+                elif key in TEXT_FIELDS:
+                    last = value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=6)
+    parser.add_argument("--words", type=int, default=600)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    events = build_events(args.iterations, args.words)
+    _check_delta_roundtrip(events)
+
+    variants = {
+        "legacy (json.dumps)": lambda: legacy_stream(events),
+        "v2 full": lambda: v2_stream(events, "full", False),
+        "v2 delta": lambda: v2_stream(events, "delta", False),
+        "v2 full + gzip": lambda: v2_stream(events, "full", True),
+        "v2 delta + gzip": lambda: v2_stream(events, "delta", True),
+    }
+
+    print(f"{len(events)} events, {args.iterations} iterations, ~{args.words} words/prompt, "
+          f"encoder: {'orjson' if orjson else 'json'}")
+    print(f"{'format':<22}{'bytes':>10}{'vs legacy':>11}{'us/event':>11}")
+    baseline = None
+    for name, run in variants.items():
+        size = _size(run())
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            run()
+        per_event = (time.perf_counter() - start) / args.repeat / len(events) * 1e6
+        baseline = baseline or size
+        print(f"{name:<22}{size:>10}{size / baseline:>10.1%}{per_event:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Cold-start benchmark.
+
+Starts the app under uvicorn in a fresh process and measures time until the
+first successful /api/health (liveness) and /api/ready (readiness) responses.
+Also prints the slowest imports of app.main from `python -X importtime`.
+
+Usage (from backend/):
+    python -m benchmarks.startup_bench [--runs 5] [--top 15]
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url: str, deadline: float) -> float:
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                if resp.status == 200:
+                    return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.005)
+    raise TimeoutError(f"{url} did not become available")
+
+
+def measure_once(timeout: float = 60.0) -> tuple[float, float]:
+    port = _free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env={**os.environ, "DEBUG": "False"},
+    )
+    try:
+        base = f"http://127.0.0.1:{port}/api"
+        live = _wait_for(f"{base}/health", start + timeout) - start
+        ready = _wait_for(f"{base}/ready", start + timeout) - start
+        return live, ready
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def import_profile(top: int) -> list[tuple[int, str]]:
+    """Cumulative import time (us) of the slowest modules imported by app.main"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    print("Slowest imports (cumulative):")
+    for cumulative, name in import_profile(args.top):
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    samples = [measure_once() for _ in range(args.runs)]
+    live = [s[0] for s in samples]
+    ready = [s[1] for s in samples]
+    print(f"\n{args.runs} cold starts")
+    print(f"  time to first /api/health: median {statistics.median(live) * 1000:.0f} ms, max {max(live) * 1000:.0f} ms")
+    print(f"  time to first /api/ready:  median {statistics.median(ready) * 1000:.0f} ms, max {max(ready) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
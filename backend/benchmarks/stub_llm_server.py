@@ -0,0 +1,244 @@
+"""
+Local stand-in for an OpenAI-compatible inference server.
+
+Answers /v1/chat/completions (plain and streaming) deterministically with a
+configurable latency, so the whole pipeline can be run and load-tested with
+backend="openai_compat" without a model or API keys. It honours max_tokens
+and, with --thinking-tokens, spends that many hidden tokens before answering
+(counted against max_tokens) unless chat_template_kwargs.enable_thinking is
+false, like a thinking model served by vLLM.
+
+With a cassette it replays recorded answers instead (with their recorded
+latency, scaled by --latency-scale); with --record, answers missing from the
+cassette are fetched from the real provider named by the request's model
+("backend:model", e.g. "gemini:gemini-2.5-flash") and appended to it.
+
+Usage (from backend/):
+    python -m benchmarks.stub_llm_server [--port 8090] [--latency 0.2] [--tokens-per-second 400] [--thinking-tokens 0]
+    python -m benchmarks.stub_llm_server --cassette calls.jsonl [--record] [--latency-scale 1.0]
+    OPENAI_COMPAT_BASE_URLS=http://127.0.0.1:8090/v1 uvicorn app.main:app
+"""
+import argparse
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+
+def _reply(system: str, user: str) -> str:
+    """Plausible output for each pipeline stage, keyed off its system prompt"""
+    if "BATCH MODE" in system:
+        items = re.split(r"^### ITEM \d+\n", user, flags=re.MULTILINE)[1:]
+        return "[" + ",".join(_reply(system.split("BATCH MODE")[0], item) for item in items) + "]"
+    if "ORIGINAL and FINAL" in system:
+        return json.dumps({"clarity": 0.66, "structure": 0.66, "constraints": 0.33, "usefulness": 0.66, "comment": "stub evaluation"})
+    if "quality analyzer" in system:
+        return json.dumps({"clarity": 0.4, "structure": 0.3, "constraints": 0.3, "needs_optimization": True, "comment": "stub analysis"})
+    if "CRITIC" in system:
+        return "1. Add an explicit output format.\n2. State the audience.\n3. Add length limits."
+    if "VERIFIER" in system:
+        return user.split("PROPOSED PROMPT:")[-1].split("CRITIQUE:")[0].strip()
+    if "OPTIMIZED PREVIOUS PROMPT:" in user:
+        return user.split("OPTIMIZED PREVIOUS PROMPT:")[-1].strip()
+    if "EXPANSIONS:" in user:
+        return user.split("EXPANSIONS:")[0].replace("PROMPT:", "", 1).strip() + "\n\nConstraints:\n- Be specific.\n- Cover edge cases."
+    if "DIVERSIFICATION" in system:
+        return user + "\n\nConstraints:\n- Be specific.\n- Cover edge cases."
+    return user
+
+
+class CassetteMiss(Exception):
+    """The cassette has no answer for a call and recording is off"""
+
+
+class Cassette:
+    """Recorded provider answers keyed by model and prompts (JSONL, appended while recording)"""
+
+    def __init__(self, path: str, record: bool = False, latency_scale: float = 1.0):
+        self.path = Path(path)
+        self.record = record
+        self.latency_scale = latency_scale
+        self.entries: dict[str, dict] = {}
+        self.misses = 0
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry
+
+    @staticmethod
+    def key(model: str, system: str, user: str) -> str:
+        return hashlib.sha1("\0".join((model, system, user)).encode("utf-8")).hexdigest()
+
+    def answer(self, model: str, system: str, user: str) -> tuple[str, dict]:
+        """Recorded (text, usage) for a call, recording it first if allowed"""
+        key = self.key(model, system, user)
+        entry = self.entries.get(key)
+        if entry is not None:
+            time.sleep(entry["seconds"] * self.latency_scale)
+            return entry["text"], entry["usage"]
+        if not self.record:
+            with self._lock:
+                self.misses += 1
+            raise CassetteMiss(f"No recorded answer for model {model!r}")
+        text, usage, seconds = self._upstream(model, system, user)
+        entry = {"key": key, "model": model, "text": text, "usage": usage, "seconds": round(seconds, 4)}
+        with self._lock:
+            self.entries[key] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return text, usage
+
+    @staticmethod
+    def _upstream(model: str, system: str, user: str) -> tuple[str, dict, float]:
+        from app.services.llm_provider import BACKENDS, get_llm_provider
+
+        backend, sep, name = model.partition(":")
+        if not sep or backend not in BACKENDS or backend == "openai_compat":
+            raise ValueError(f"Recording needs models named backend:model, got {model!r}")
+        provider = get_llm_provider(backend, model=name)
+        start = time.perf_counter()
+        text = provider.call(system, user)
+        usage = provider.last_usage or {}
+        return text, {"prompt_tokens": usage.get("prompt_tokens", 0), "completion_tokens": usage.get("completion_tokens", 0)}, time.perf_counter() - start
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.2
+    tokens_per_second = 400.0
+    thinking_tokens = 0
+    cassette: Optional[Cassette] = None
+    requests_served = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        type(self).requests_served += 1
+        messages = {m["role"]: m["content"] for m in body.get("messages", [])}
+        finish_reason = "stop"
+        if self.cassette is not None:
+            try:
+                text, usage = self.cassette.answer(body.get("model") or "", messages.get("system", ""), messages.get("user", ""))
+            except CassetteMiss as e:
+                self.send_error(404, str(e))
+                return
+            words = text.split(" ")
+        else:
+            text = _reply(messages.get("system", ""), messages.get("user", ""))
+            words = text.split(" ")
+            thinking = self.thinking_tokens
+            if (body.get("chat_template_kwargs") or {}).get("enable_thinking") is False:
+                thinking = 0
+            if body.get("max_tokens") is not None:
+                thinking = min(thinking, body["max_tokens"])
+                if len(words) > body["max_tokens"] - thinking:
+                    words = words[:body["max_tokens"] - thinking]
+                    finish_reason = "length"
+                text = " ".join(words)
+            usage = {
+                "prompt_tokens": sum(len(m.split()) for m in messages.values()),
+                "completion_tokens": thinking + len(words),
+            }
+            time.sleep(self.latency + thinking / self.tokens_per_second)
+
+        if not body.get("stream"):
+            payload = json.dumps({
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": finish_reason}],
+                "usage": usage,
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, word in enumerate(words):
+                delta = word if i == len(words) - 1 else word + " "
+                self._chunk({"choices": [{"index": 0, "delta": {"content": delta}}]})
+                time.sleep(1 / self.tokens_per_second)
+            self._chunk({"choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]})
+            self._chunk({"choices": [], "usage": usage})
+            self._write(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client cancelled the call
+
+    def _chunk(self, event: dict) -> None:
+        self._write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+
+    def _write(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # load tests open many connections at once
+
+    def handle_error(self, request, client_address):
+        # Clients dropping idle pooled connections are not errors
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def serve(
+    port: int = 8090,
+    latency: float = 0.2,
+    tokens_per_second: float = 400.0,
+    background: bool = False,
+    cassette: Optional[Cassette] = None,
+    thinking_tokens: int = 0,
+) -> StubServer:
+    """Start the stub server; with background=True it runs in a daemon thread"""
+    handler = type("Handler", (StubHandler,), {
+        "latency": latency,
+        "tokens_per_second": tokens_per_second,
+        "thinking_tokens": thinking_tokens,
+        "cassette": cassette,
+    })
+    server = StubServer(("127.0.0.1", port), handler)
+    if background:
+        threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--thinking-tokens", type=int, default=0, help="hidden tokens per answer unless thinking is off")
+    parser.add_argument("--cassette", help="JSONL of recorded answers to replay")
+    parser.add_argument("--record", action="store_true", help="Fetch and record answers missing from the cassette")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Factor on recorded latencies when replaying")
+    args = parser.parse_args()
+    cassette = Cassette(args.cassette, args.record, args.latency_scale) if args.cassette else None
+    print(f"Stub OpenAI-compatible server on http://127.0.0.1:{args.port}/v1")
+    serve(args.port, args.latency, args.tokens_per_second, cassette=cassette, thinking_tokens=args.thinking_tokens)
@@ -9,6 +9,57 @@ const API_BASE_URL = isProduction
     ? `${window.location.origin}/api`  // Railway: use same domain
     : 'http://localhost:8001/api';      // Local: use port 8001
 
+/**
+ * Rebuilds full texts from SSE v2 delta payloads (stream_mode: 'delta').
+ * Ops: number >= 0 keeps chars of the previous text, negative skips them,
+ * string inserts. Counts are UTF-16 code units, the same as String.slice.
+ */
+class DeltaDecoder {
+    constructor() {
+        this.lastText = null;
+    }
+
+    apply(ops) {
+        let out = '';
+        let pos = 0;
+        for (const op of ops) {
+            if (typeof op === 'string') {
+                out += op;
+            } else if (op >= 0) {
+                out += this.lastText.slice(pos, pos + op);
+                pos += op;
+            } else {
+                pos -= op;
+            }
+        }
+        return out;
+    }
+
+    decodeFields(payload) {
+        for (const key of Object.keys(payload)) {
+            if (key.endsWith('_delta')) {
+                const field = key.slice(0, -'_delta'.length);
+                payload[field] = this.apply(payload[key]);
+                delete payload[key];
+                this.lastText = payload[field];
+            } else if (DeltaDecoder.TEXT_FIELDS.includes(key) && typeof payload[key] === 'string') {
+                this.lastText = payload[key];
+            }
+        }
+    }
+
+    decode(event) {
+        this.decodeFields(event);
+        if (event.data && typeof event.data === 'object') {
+            this.decodeFields(event.data);
+        }
+        return event;
+    }
+}
+
+// Prompt texts only (critiques are sent in full); must match TEXT_FIELDS in backend/app/utils/sse.py
+DeltaDecoder.TEXT_FIELDS = ['output', 'proposed_prompt', 'final_prompt'];
+
 class APIClient {
     constructor(baseUrl = API_BASE_URL) {
         this.baseUrl = baseUrl;
@@ -52,48 +103,116 @@ class APIClient {
         }
     }
     /**
-     * Optimize a prompt with real-time streaming
+     * Optimize a prompt with real-time streaming.
+     * If the connection drops, the stream is resumed from the last received
+     * event id (the server keeps the run alive for a grace period).
      */
-    async optimizePromptStream(data, onProgress) {
-        try {
-            const response = await fetch(`${this.baseUrl}/optimize-stream`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify(data)
-            });
+    async optimizePromptStream(data, onProgress, maxRetries = 5) {
+        const deltas = new DeltaDecoder();
+        const state = { runId: null, lastEventId: 0, ended: false };
+        let url = `${this.baseUrl}/optimize-stream`;
+        let options = {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(data)
+        };
+        let retries = 0;
 
-            if (!response.ok) {
-                const errorData = await response.json();
-                throw new Error(errorData.detail || 'Optimization failed');
-            }
+        try {
+            while (true) {
+                let response = null;
+                try {
+                    response = await fetch(url, options);
+                } catch (error) {
+                    if (!state.runId) throw error;
+                    console.warn('Reconnect failed:', error);
+                }
 
-            const reader = response.body.getReader();
-            const decoder = new TextDecoder();
+                if (response) {
+                    if (!response.ok) {
+                        const errorData = await response.json();
+                        throw new Error(errorData.detail || 'Optimization failed');
+                    }
+                    state.runId = response.headers.get('X-Run-Id') || state.runId;
 
-            while (true) {
-                const { done, value } = await reader.read();
-                
-                if (done) break;
-                
-                const chunk = decoder.decode(value);
-                const lines = chunk.split('\n');
-                
-                for (const line of lines) {
-                    if (line.startsWith('data: ')) {
-                        const data = JSON.parse(line.slice(6));
-                        if (onProgress) {
-                            onProgress(data);
+                    try {
+                        if (await this._readEvents(response, deltas, state, onProgress) > 0) {
+                            retries = 0;
                         }
+                    } catch (error) {
+                        console.warn('Stream interrupted:', error);
                     }
+                    if (state.ended) return;
                 }
+
+                if (!state.runId || retries >= maxRetries) {
+                    throw new Error('Stream connection lost');
+                }
+                await new Promise(resolve => setTimeout(resolve, 500 * 2 ** retries));
+                retries += 1;
+
+                const params = new URLSearchParams({
+                    stream_mode: data.stream_mode || 'full',
+                    stream_compression: String(Boolean(data.stream_compression)),
+                });
+                url = `${this.baseUrl}/optimize-stream/${state.runId}?${params}`;
+                options = { headers: { 'Last-Event-ID': String(state.lastEventId) } };
             }
         } catch (error) {
             console.error('Streaming error:', error);
             throw error;
         }
     }
+
+    /**
+     * Read SSE frames until the response ends, tracking the last event id.
+     * A frame's id is only committed once the whole frame (ended by a blank
+     * line) has been handled. Returns the number of events received.
+     */
+    async _readEvents(response, deltas, state, onProgress) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let received = 0;
+        let frameId = null;
+        let frameData = null;
+
+        while (true) {
+            const { done, value } = await reader.read();
+            
+            if (done) return received;
+            
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            
+            for (const line of lines) {
+                if (line.startsWith('id: ')) {
+                    frameId = parseInt(line.slice(4), 10);
+                } else if (line.startsWith('data: ')) {
+                    frameData = line.slice(6);
+                } else if (line === '' && frameData !== null) {
+                    const data = deltas.decode(JSON.parse(frameData));
+                    if (frameId !== null) {
+                        state.lastEventId = frameId;
+                    }
+                    frameId = null;
+                    frameData = null;
+                    received += 1;
+                    if (data.run_id && !state.runId) {
+                        state.runId = data.run_id;
+                    }
+                    if (data.stage === 'stream_end') {
+                        state.ended = true;
+                    } else if (onProgress) {
+                        onProgress(data);
+                    }
+                }
+            }
+        }
+    }
 }
 
 // Export API client instance